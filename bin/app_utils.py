@@ -1,5 +1,5 @@
 from os import getcwd, path, environ
-from util.apache_config import read_config_file, get_config_string, parseBoolean #do not remove
+from util.apache_config import read_config_file, read_config_file_cached, get_config_string, parseBoolean #do not remove
 import util.log as log
 import csv, sys, os
 
@@ -17,17 +17,23 @@ DEBUG_LOGGER = log.setup_file_logger(level=log.DEBUG, log_file=APP_LOG_FILE)
 
 
 
-def get_app_config(file_name=APP_CONFIG_FILE, app_home_dir=APP_PATH):
+def get_app_config(file_name=APP_CONFIG_FILE, app_home_dir=APP_PATH, use_cache=True, cache_file=None):
     '''
     # Reads a Splunk config file by merging settings in the default and local
-    # app folders
-    :usage: config, all_sections, all_options, merged_options = read_config_file()
+    # app folders.
+    # Unless use_cache is False, the merged settings are cached in memory and
+    # only re-parsed when either conf file changes. Pass cache_file to also
+    # keep them on disk for new processes; nothing is written otherwise.
+    :usage: config, all_sections, all_options, merged_options = get_app_config()
     '''
 
     default_config_file = path.join(app_home_dir, 'default', file_name + '.conf')
     local_config_file = path.join(app_home_dir, 'local', file_name + '.conf')
 
-    return read_config_file(default_config_file, local_config_file)
+    if not use_cache:
+        return read_config_file(default_config_file, local_config_file)
+
+    return read_config_file_cached(default_config_file, local_config_file, cache_file)
 
 
 
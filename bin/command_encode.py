@@ -22,17 +22,21 @@ def process_results():
     # Handle key/value and args passed in to my script
     search_fields, search_parameters = splunk.Intersplunk.getKeywordsAndOptions()
 
-    # Fetch results being passed to this search command
-    (results, dummyresults, settings) = splunk.Intersplunk.getOrganizedResults()
+    # Stream the results being passed to this search command, one at a time
+    settings = {}
+    fields = []
+    results = splunk.Intersplunk.iterResults(settings=settings, fields=fields)
 
     logger.debug("Args:  %r, key/value settings:  %r", search_fields, search_parameters)
     logger.debug("Settings passed:  %r", settings)
-    logger.debug("Custom search script processing %d results.", len(results))
 
-    decoded_results = encode_results(results, search_fields, search_parameters)
+    # the input fields, plus the ones this command adds
+    suffix = search_parameters.get('suffix', '_'+search_parameters.get('type', 'base64'))
+    output_fields = fields + [fieldname+suffix for fieldname in search_fields if fieldname in fields and fieldname+suffix not in fields]
 
     #  Return modified results back to splunk (for the next search command to process)
-    splunk.Intersplunk.outputResults(decoded_results)
+    count = splunk.Intersplunk.outputResultsStream(encode_results(results, search_fields, search_parameters), output_fields)
+    logger.debug("Custom search script processed %d results.", count)
 
 
 def hashlib_decode(algo):
@@ -70,7 +74,7 @@ def encode_results(results, search_fields, search_parameters):
             except Exception, e:
                 result[fieldname+suffix] = "[Error] " + type + " encode: " + str(e)
 
-    return results
+        yield result
 
 
 
@@ -34,16 +34,21 @@ def getConf(confName, sessionKey=None, namespace=None, owner=None, overwriteStan
     uri = entity.buildEndpoint(entityClass='properties', entityName=confName, namespace=namespace, 
                                owner=owner, hostPath=hostPath)
     
-    # the fillcontents arg will push all stanza keys down in 1 request instead
-    # of iterating over all stanzas
-    serverResponse, serverContent = rest.simpleRequest(uri, getargs={'fillcontents':1}, sessionKey=sessionKey)
-    
-    if serverResponse.status != 200:
-        logger.info('getConf - server returned status=%s when asked for conf=%s' % (serverResponse.status, confName))
+    cacheKey = entity.entityCache.makeKey('conf', 'properties/%s' % confName, uri, sessionKey=sessionKey)
+    stanzas = entity.entityCache.get(cacheKey)
+    if stanzas is None:
+        # the fillcontents arg will push all stanza keys down in 1 request instead
+        # of iterating over all stanzas
+        serverResponse, serverContent = rest.simpleRequest(uri, getargs={'fillcontents':1}, sessionKey=sessionKey)
         
-    # convert the atom feed into dict
-    confFeed = rest.format.parseFeedDocument(serverContent)
-    stanzas = confFeed.toPrimitive()
+        if serverResponse.status != 200:
+            logger.info('getConf - server returned status=%s when asked for conf=%s' % (serverResponse.status, confName))
+            
+        # convert the atom feed into dict
+        confFeed = rest.format.parseFeedDocument(serverContent)
+        stanzas = confFeed.toPrimitive()
+        if serverResponse.status == 200:
+            entity.entityCache.set(cacheKey, 'properties/%s' % confName, stanzas)
     
     # create Conf/Stanzas
     output = Conf(confName, namespace=namespace, owner=owner, overwriteStanzas=overwriteStanzas)
@@ -72,6 +77,7 @@ def createConf(confName, namespace=None, owner=None, sessionKey=None, hostPath=N
     postargs = {'__conf': confName}
     
     status, response = rest.simpleRequest(uri, postargs=postargs, sessionKey=sessionKey, raiseAllErrors=True)
+    entity.entityCache.invalidate('properties/%s' % confName)
     
     # Expect 201 on creation or 200 on preexisting file (automatic handling of 303 redirect).
     if not ((status.status == 201) or (status.previous is not None and status.status == 200)):
@@ -277,6 +283,8 @@ class Conf(util.OrderedDict):
             method=self._getWriteMethod()
             )
 
+        entity.entityCache.invalidate('properties/%s' % self.name)
+
         if serverResponse.status != 200:
             logger.error('_executeSingle - HTTP error=%s server returned: %s' % (serverResponse.status, serverContent))
             raise splunk.RESTException, (serverResponse.status, '_executeSingle - server returned: %s' % serverContent)
@@ -306,6 +314,8 @@ class Conf(util.OrderedDict):
             method=self._getWriteMethod()
             )
         
+        entity.entityCache.invalidate('properties/%s' % self.name)
+
         if serverResponse.status != 200:
             logger.error('_executeBatch - HTTP error=%s server returned: %s' % (serverResponse.status, serverContent))
             raise splunk.RESTException, (serverResponse.status, '_executeBatch - server returned: %s' % serverContent)
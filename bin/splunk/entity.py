@@ -2,6 +2,7 @@ import logging, os
 import splunk, rest, util, auth
 import urllib, time
 import re
+import collections, copy, threading
 
 logger = logging.getLogger('splunk.entity')
 
@@ -36,6 +37,129 @@ NEW_EAI_ENTITY_NAME = '_new'
 # define preset key for literal XML data
 EAI_DATA_KEY = 'eai:data'
 
+# default size and lifetime of the entities kept by entityCache, once enabled
+ENTITY_CACHE_MAX_ENTRIES = 500
+ENTITY_CACHE_MAX_SECONDS = 10
+
+
+class EntityCache(object):
+    '''
+    Per process, thread safe LRU cache of the entities read by getEntity(),
+    getEntities(), getEntitiesList() and bundle.getConf().  It is off until
+    enable() is called.
+
+    Entries are keyed by the request along with the current user and session
+    key, and expire after maxSeconds.  setEntity(), deleteEntity(),
+    controlEntity(), refreshEntities() and conf writes drop the entries of
+    the entity path they touch.  Values are copied in and out of the cache,
+    so callers are free to modify what they get.
+    '''
+
+    def __init__(self, maxEntries=ENTITY_CACHE_MAX_ENTRIES, maxSeconds=ENTITY_CACHE_MAX_SECONDS):
+        self.enabled       = False
+        self.maxEntries    = maxEntries
+        self.maxSeconds    = maxSeconds
+        self._entries      = collections.OrderedDict() # key -> [time, entity path, value]
+        self._lock         = threading.Lock()
+        self.hits          = 0
+        self.misses        = 0
+        self.evictions     = 0
+        self.invalidations = 0
+
+    def enable(self, maxEntries=None, maxSeconds=None):
+        if maxEntries is not None: self.maxEntries = maxEntries
+        if maxSeconds is not None: self.maxSeconds = maxSeconds
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.clear()
+
+    def makeKey(self, kind, entityPath, *args, **kwargs):
+        '''
+        Returns the key of a request for entityPath, or None if the cache is
+        off or the request asks splunkd to refresh its data
+        '''
+        if not self.enabled or 'refresh' in kwargs or '_reload' in args:
+            return None
+        sessionKey = kwargs.pop('sessionKey', None) or splunk.getSessionKey()
+        return (kind, _cachePath(entityPath), auth.getCurrentUser()['name'], sessionKey, repr(args), repr(sorted(kwargs.items())))
+
+    def get(self, key):
+        ''' Returns a copy of the value cached for key, or None '''
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] + self.maxSeconds < time.time():
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            value = entry[2]
+        return copy.deepcopy(value)
+
+    def set(self, key, entityPath, value):
+        if key is None or value is None:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = [time.time(), _cachePath(entityPath), value]
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, entityPath=None, uri=None):
+        '''
+        Drops the entries for entityPath, and for the entity paths found in
+        uri; drops everything if neither is given
+        '''
+        if entityPath is None and uri is None:
+            self.clear()
+            return
+        paths = []
+        if entityPath is not None:
+            paths.append(_cachePath(entityPath))
+        if uri is not None:
+            uri = urllib.unquote(uri.split('?')[0]).rstrip('/') + '/'
+        # conf files are served both as properties/<conf> and configs/conf-<conf>
+        for conf in re.findall(r'(?:^|/)(?:properties/|configs/conf-)([^/]+)', '/'.join(paths + [uri or ''])):
+            paths.extend(['properties/%s' % conf, 'configs/conf-%s' % conf])
+        with self._lock:
+            for key, entry in self._entries.items():
+                for path in paths:
+                    if entry[1] == path or entry[1].startswith(path + '/') or path.startswith(entry[1] + '/'):
+                        break
+                else:
+                    if not (uri and ('/%s/' % entry[1]) in uri):
+                        continue
+                del self._entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        ''' Returns the number of entries and the hit, miss, eviction and invalidation counts '''
+        with self._lock:
+            return {
+                'size'          : len(self._entries),
+                'hits'          : self.hits,
+                'misses'        : self.misses,
+                'evictions'     : self.evictions,
+                'invalidations' : self.invalidations
+            }
+
+entityCache = EntityCache()
+
+
+def _cachePath(entityPath):
+    if isinstance(entityPath, list):
+        entityPath = '/'.join(entityPath)
+    return urllib.unquote(entityPath).strip('/')
+
 
 def entityParams(**kw):
     '''Returns a clean dict of valid entity params'''
@@ -126,22 +250,19 @@ def getEntities(entityPath, namespace=None, owner=None, search=None, count=None,
     @param unique_key: specify the uniquifying key
     '''
     
-    atomFeed = _getEntitiesAtomFeed(entityPath, namespace, owner, search, count, offset, sort_key, sort_dir, sessionKey, uri, hostPath, **kwargs)
+    cacheKey = entityCache.makeKey('entities', entityPath, namespace, owner, search, count, offset, sort_key, sort_dir, uri, unique_key, hostPath, sessionKey=sessionKey, **kwargs)
+    collection = entityCache.get(cacheKey)
+    if collection is not None:
+        return collection
 
-    offset = int(atomFeed.os_startIndex or -1)
-    totalResults = int(atomFeed.os_totalResults or -1)
-    itemsPerPage = int(atomFeed.os_itemsPerPage or -1)
+    atomFeed, atomEntries = _getEntitiesAtomFeed(entityPath, namespace, owner, search, count, offset, sort_key, sort_dir, sessionKey, uri, hostPath, **kwargs)
 
-    links = atomFeed.links
-    
-    messages = atomFeed.messages
-    
     # preserves order of returned elements
     # EntityCollection is a new subclass or util.OrderedDict, it still preserves
     # the order, but it allows some additional params to be added on.
-    collection = EntityCollection(None, search, count, offset, totalResults, itemsPerPage, sort_key, sort_dir, links, messages)
+    collection = EntityCollection(None, search, count, sort_key=sort_key, sort_dir=sort_dir)
 
-    for atomEntry in atomFeed:
+    for atomEntry in atomEntries:
         entity = _getEntityFromAtomEntry(atomEntry, entityPath, namespace, hostPath)
         
         # use the same semantics as in the C++ code: make the first item in the
@@ -150,6 +271,14 @@ def getEntities(entityPath, namespace=None, owner=None, search=None, count=None,
         if attr not in collection:
             collection[attr] = entity
 
+    # the feed properties are known once its entries have been read
+    collection.offset = int(atomFeed.os_startIndex or -1)
+    collection.totalResults = int(atomFeed.os_totalResults or -1)
+    collection.itemsPerPage = int(atomFeed.os_itemsPerPage or -1)
+    collection.links = atomFeed.links
+    collection.messages = atomFeed.messages
+
+    entityCache.set(cacheKey, entityPath, collection)
     return collection
 
 def getEntitiesList(entityPath, namespace=None, owner=None, search=None, count=None, offset=0, sort_key=None, sort_dir=None , sessionKey=None, uri=None, hostPath=None, **kwargs):
@@ -169,14 +298,20 @@ def getEntitiesList(entityPath, namespace=None, owner=None, search=None, count=N
     @param unique_key: specify the uniquifying key
     '''
     
-    atomFeed = _getEntitiesAtomFeed(entityPath, namespace, owner, search, count, offset, sort_key, sort_dir, sessionKey, uri, hostPath, **kwargs)
+    cacheKey = entityCache.makeKey('list', entityPath, namespace, owner, search, count, offset, sort_key, sort_dir, uri, hostPath, sessionKey=sessionKey, **kwargs)
+    list = entityCache.get(cacheKey)
+    if list is not None:
+        return list
+
+    atomFeed, atomEntries = _getEntitiesAtomFeed(entityPath, namespace, owner, search, count, offset, sort_key, sort_dir, sessionKey, uri, hostPath, **kwargs)
 
     list = []
 
-    for atomEntry in atomFeed:
+    for atomEntry in atomEntries:
         entity = _getEntityFromAtomEntry(atomEntry, entityPath, namespace, hostPath)
         list.append(entity)
 
+    entityCache.set(cacheKey, entityPath, list)
     return list
 
 def _getEntityFromAtomEntry(atomEntry, entityPath, namespace, hostPath):
@@ -224,8 +359,10 @@ def _getEntitiesAtomFeed(entityPath, namespace=None, owner=None, search=None, co
     if serverResponse.status != 200:
         raise splunk.RESTException, (serverResponse.status, serverResponse.messages)
         
-    atomFeed = rest.format.parseFeedDocument(serverContent)
-    return atomFeed
+    # entries are parsed, and their XML freed, as they are iterated over; the
+    # other properties of atomFeed are set once the first entry is read
+    atomFeed = rest.format.AtomFeed()
+    return atomFeed, rest.format.iterFeedEntries(serverContent, atomFeed)
 
 def getEntity(entityPath, entityName, uri=None, namespace=None, owner=None, sessionKey=None, hostPath=None, **kwargs):
     '''
@@ -246,6 +383,11 @@ def getEntity(entityPath, entityName, uri=None, namespace=None, owner=None, sess
           raise ValueError, "entityName cannot be empty"
        uri = buildEndpoint(entityPath, entityName=entityName, namespace=namespace, owner=owner, hostPath=hostPath)
     
+    cacheKey = entityCache.makeKey('entity', entityPath, entityName, uri, namespace, owner, hostPath, sessionKey=sessionKey, **kwargs)
+    entity = entityCache.get(cacheKey)
+    if entity is not None:
+        return entity
+
     serverResponse, serverContent = rest.simpleRequest(uri, getargs=kwargs, sessionKey=sessionKey, raiseAllErrors=True)
 
     if serverResponse.status != 200:
@@ -284,6 +426,7 @@ def getEntity(entityPath, entityName, uri=None, namespace=None, owner=None, sess
 
     entity.updateOptionalRequiredFields()
         
+    entityCache.set(cacheKey, entityPath, entity)
     return entity
         
 
@@ -369,6 +512,7 @@ def setEntity(entity, sessionKey=None, uri=None, msgObj=None, strictCreate=False
             entity.name = createName
                 
         serverResponse, serverContent = rest.simpleRequest(uri, sessionKey=sessionKey, postargs=postargs, raiseAllErrors=True)
+        entityCache.invalidate(entity.path, uri)
         if (serverResponse.status == 201):
             if msgObj:
                 msgObj['messages'] = serverResponse.messages
@@ -394,6 +538,7 @@ def setEntity(entity, sessionKey=None, uri=None, msgObj=None, strictCreate=False
 
         uri = entity.getBasePath()
         serverResponse, serverContent = rest.simpleRequest(uri, sessionKey=sessionKey, postargs=postargs, raiseAllErrors=True)
+        entityCache.invalidate(entity.path, uri)
         
         if serverResponse.status == 201:
             if msgObj:
@@ -423,6 +568,8 @@ def controlEntity(action, entityURI, sessionKey=None):
     else:
         raise Exception, 'unknown action=%s' % action
 
+    entityCache.invalidate(uri=entityURI)
+
     if serverResponse.status == 200:
         return True
     else:
@@ -436,6 +583,7 @@ def deleteEntity(entityPath, entityName, namespace, owner, sessionKey=None, host
 
     uri = buildEndpoint(entityPath, entityName, namespace=namespace, owner=owner, hostPath=hostPath)
     serverResponse, serverContent = rest.simpleRequest(uri, sessionKey=sessionKey, method='DELETE', raiseAllErrors=True)
+    entityCache.invalidate(entityPath)
     
     if serverResponse.status == 200:
         logger.info('deleteEntity - deleted entity=%s' % uri)
@@ -473,6 +621,9 @@ def refreshEntities(entityPath, **kwargs):
     else:
         kwargs['refresh'] = "1"
         getEntities(entityPath, **kwargs)
+
+    # the refreshed entities are read again from splunkd
+    entityCache.invalidate(entityPath)
     
     
 class EntityCollection(util.OrderedDict):
@@ -876,6 +1027,69 @@ if __name__ == '__main__':
             self.assert_('blockSignSize' in index)
 
 
+    class EntityCacheTest(unittest.TestCase):
+        
+        entryXml = '<entry><title>%s</title><id>/servicesNS/admin/search/saved/searches/%s</id><updated>2014-01-01T00:00:00-08:00</updated><link href="/servicesNS/admin/search/saved/searches/%s" rel="alternate"/><author><name>admin</name></author><content type="text/xml"><s:dict><s:key name="search">%s</s:key></s:dict></content></entry>'
+        
+        def setUp(self):
+            self.requests = []
+            self.simpleRequest = rest.simpleRequest
+            rest.simpleRequest = self.fakeRequest
+            entityCache.enable()
+            
+        def tearDown(self):
+            rest.simpleRequest = self.simpleRequest
+            entityCache.disable()
+            
+        def fakeRequest(self, uri, **kwargs):
+            class Response(object):
+                status = 200
+                messages = []
+            self.requests.append((uri, kwargs.get('method', 'GET')))
+            entries = ''.join([self.entryXml % (name, name, name, 'search %s' % len(self.requests)) for name in ('one', 'two')])
+            return Response(), '<feed xmlns="%s" xmlns:s="%s"><title>searches</title>%s</feed>' % (rest.format.ATOM_NS, rest.format.SPLUNK_NS, entries)
+            
+        def testGetEntitiesCached(self):
+            first = getEntities('saved/searches', namespace='search', owner='admin', sessionKey='key')
+            first['one']['search'] = 'modified'
+            second = getEntities('saved/searches', namespace='search', owner='admin', sessionKey='key')
+            self.assertEquals(len(self.requests), 1)
+            self.assertEquals(second['one']['search'], 'search 1')
+            self.assertEquals(entityCache.stats()['hits'], 1)
+            
+            # different users, sessions and arguments are separate entries
+            getEntities('saved/searches', namespace='search', owner='admin', sessionKey='other')
+            getEntities('saved/searches', namespace='search', owner='admin', sessionKey='key', count=1)
+            self.assertEquals(len(self.requests), 3)
+            
+            # refreshes always go to splunkd
+            getEntities('saved/searches', namespace='search', owner='admin', sessionKey='key', refresh=1)
+            getEntities('saved/searches', namespace='search', owner='admin', sessionKey='key', refresh=1)
+            self.assertEquals(len(self.requests), 5)
+            
+        def testInvalidation(self):
+            getEntity('saved/searches', 'one', namespace='search', owner='admin', sessionKey='key')
+            getEntities('saved/searches', namespace='search', owner='admin', sessionKey='key')
+            getEntities('data/ui/views', namespace='search', owner='admin', sessionKey='key')
+            self.assertEquals(entityCache.stats()['size'], 3)
+            
+            deleteEntity('saved/searches', 'one', 'search', 'admin', sessionKey='key')
+            self.assertEquals(entityCache.stats()['size'], 1)
+            
+            controlEntity('disable', '/servicesNS/admin/search/data/ui/views/home/disable', sessionKey='key')
+            self.assertEquals(entityCache.stats()['size'], 0)
+            
+            getEntities('properties/web', owner='admin', sessionKey='key')
+            controlEntity('disable', '/servicesNS/nobody/search/configs/conf-web/settings/disable', sessionKey='key')
+            self.assertEquals(entityCache.stats()['size'], 0)
+            
+        def testDisabled(self):
+            entityCache.disable()
+            getEntities('saved/searches', namespace='search', owner='admin', sessionKey='key')
+            getEntities('saved/searches', namespace='search', owner='admin', sessionKey='key')
+            self.assertEquals(len(self.requests), 2)
+            self.assertEquals(entityCache.stats()['size'], 0)
+
     class MiscTest(unittest.TestCase):
         pass
 
@@ -887,5 +1101,6 @@ if __name__ == '__main__':
     suites.append(loader.loadTestsFromTestCase(SavedSearchTest))
     suites.append(loader.loadTestsFromTestCase(IndexTest))
     suites.append(loader.loadTestsFromTestCase(EntityTest))
+    suites.append(loader.loadTestsFromTestCase(EntityCacheTest))
     unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(suites))
 
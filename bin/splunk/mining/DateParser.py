@@ -3,6 +3,8 @@
 #whole or in part without the express written permission of Splunk Inc. is prohibited.
 
 import re,time
+import collections, threading
+import sre_constants, sre_parse
 
 _debug = False
 
@@ -108,12 +110,7 @@ def hasTime(text, timeInfoTuplet):
     return getFastTime(text, timeInfoTuplet) != None
 
 def getFastTime(text, timeInfoTuplet):
-    expressions = timeInfoTuplet[0]
-    for expression in expressions:
-        match = expression.search(text)
-        if match:
-            return match
-    return None
+    return getMatcher(timeInfoTuplet[0]).search(text)
 
 
 def fixOffset(timetuple, offset):
@@ -209,20 +206,150 @@ def DateTimeFromString(text, timeInfoTuplet):
 
 
 def getMatch(text, expressions, validator):
-    index = -1
-    for expression in expressions:
-        index += 1
-        match = expression.search(text)
-        if match:
-            values = match.groupdict()
-            extractions = validator(values)
-            if extractions:
-                # DC: WE HAVE A VALID MATCH, AND IT WASN'T THE FIRST EXPRESSION,
-                # MAKE THIS PATTERN THE FIRST ONE TRIED FROM NOW ON
-                if index > 0:
-                    expressions.insert(0, expressions.pop(index))
-                return extractions
-    return None
+    return getMatcher(expressions).match(text, validator)
+
+
+def _requiredLiterals(parsed, ignorecase, literals, run=''):
+    # collect the runs of literal characters that every match of the parsed pattern must
+    # contain.  with ignorecase, letters can match either case, so they end a run.
+    for op, av in parsed:
+        if op == sre_constants.LITERAL and not (ignorecase and unichr(av).isalpha()):
+            run += unichr(av)
+            continue
+        if run:
+            literals.append(run)
+            run = ''
+        if op == sre_constants.SUBPATTERN:
+            _requiredLiterals(av[-1], ignorecase, literals)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            _requiredLiterals(av[2], ignorecase, literals)
+    if run:
+        literals.append(run)
+    return literals
+
+def requiredLiterals(expression):
+    """ returns the strings that any text matched by the compiled expression must contain """
+    try:
+        parsed = sre_parse.parse(expression.pattern, expression.flags)
+        ignorecase = (expression.flags | parsed.pattern.flags) & sre_constants.SRE_FLAG_IGNORECASE
+        required = _requiredLiterals(parsed, ignorecase, [])
+    except Exception: # no prefiltering is always safe
+        return []
+    literals = []
+    for literal in required:
+        try:
+            literal = str(literal)
+        except UnicodeError:
+            continue
+        if literal not in literals:
+            literals.append(literal)
+    return literals
+
+class PatternMatcher:
+    """ Tries a list of compiled expressions in order of how often each has matched.
+
+    Each expression is indexed by the literal strings it requires (e.g. ':' for hh:mm:ss), and
+    is only searched for in text that contains all of them, so lines without a timestamp are
+    mostly rejected by substring tests instead of regex scans.  Hit counts are kept per matcher,
+    so each source of text can keep its own ordering by using its own matcher (see copy()); the
+    list of expressions it was built from is never changed.  A matcher can be shared between
+    threads: hits are counted under a lock, and a reordering replaces the order list instead of
+    changing the one other threads may be iterating.
+    """
+    
+    def __init__(self, expressions, literals=None):
+        self.expressions = list(expressions)
+        if literals == None:
+            literals = [requiredLiterals(expression) for expression in self.expressions]
+        self.literals = literals
+        self.hits = [0] * len(self.expressions)
+        self._order = range(len(self.expressions))
+        self._lock = threading.Lock()
+
+    def copy(self):
+        """ returns a matcher for the same expressions with its own hit counts, e.g. for
+        another source of text """
+        return PatternMatcher(self.expressions, self.literals)
+
+    def __iter__(self):
+        for index in self._order:
+            yield self.expressions[index]
+
+    def __len__(self):
+        return len(self.expressions)
+
+    def search(self, text):
+        """ returns the match of the first expression, in hit order, found in text """
+        for index in self._order:
+            for literal in self.literals[index]:
+                if literal not in text:
+                    break
+            else:
+                match = self.expressions[index].search(text)
+                if match:
+                    return match
+        return None
+
+    def match(self, text, validator):
+        """ returns validator's extractions for the first expression, in hit order, whose
+        match in text the validator accepts """
+        for index in self._order:
+            for literal in self.literals[index]:
+                if literal not in text:
+                    break
+            else:
+                match = self.expressions[index].search(text)
+                if match:
+                    extractions = validator(match.groupdict())
+                    if extractions:
+                        self._hit(index)
+                        return extractions
+        return None
+
+    def _hit(self, index):
+        # move the expression ahead of those with fewer hits.  once the hit counts have
+        # settled this only counts the hit; a move builds a new order list, so threads
+        # iterating the old one in search() or match() are unaffected.
+        with self._lock:
+            hits = self.hits
+            hits[index] += 1
+            count = hits[index]
+            order = self._order
+            pos = order.index(index)
+            if pos == 0 or hits[order[pos-1]] >= count:
+                return
+            order = list(order)
+            while pos > 0 and hits[order[pos-1]] < count:
+                order[pos] = order[pos-1]
+                pos -= 1
+            order[pos] = index
+            self._order = order
+
+    def getHitCounts(self):
+        """ returns (pattern, hits) for each expression, most hit first """
+        with self._lock:
+            return [(self.expressions[index].pattern, self.hits[index]) for index in self._order]
+
+
+MATCHER_CACHE_MAX_ENTRIES = 64
+_matchers = collections.OrderedDict()
+_matchersLock = threading.Lock()
+
+def getMatcher(expressions):
+    """ returns the PatternMatcher for expressions, which may be a PatternMatcher or a list of compiled
+    expressions.  matchers for lists are shared by every list holding the same patterns; the
+    MATCHER_CACHE_MAX_ENTRIES most recently used are kept. """
+    if isinstance(expressions, PatternMatcher):
+        return expressions
+    key = tuple([(expression.pattern, expression.flags) for expression in expressions])
+    with _matchersLock:
+        matcher = _matchers.pop(key, None)
+        if matcher == None:
+            matcher = PatternMatcher(expressions)
+        _matchers[key] = matcher
+        while len(_matchers) > MATCHER_CACHE_MAX_ENTRIES:
+            _matchers.popitem(last=False)
+    return matcher
 
     
 #litday,day,litmonth,month,year,epoch = match.groups()
@@ -338,3 +465,147 @@ def add_century(year):
         return year + 100
     else:
         return year - 100
+
+
+if __name__ == '__main__':
+    # python DateParser.py            runs the tests
+    # python DateParser.py benchmark  times matching lines from several log sources, interleaved
+    #                                 as when scanning many files at once
+    import random
+    import sys
+    import unittest
+    timePatterns = [
+        r'(?<!\d)(?P<hour>[01]?\d|2[0-3]):(?P<minute>[0-5]\d):(?P<second>[0-5]\d(?:\.\d+)?)\s*(?P<ampm>[ap]m)?\s*(?P<zone>[+-]\d\d:?\d\d|[A-Z]{3,4})?',
+        r'(?<!\d)(?P<hour>[01]?\d|2[0-3]):(?P<minute>[0-5]\d)\s*(?P<ampm>[ap]m)',
+        r'T(?P<hour>[01]\d|2[0-3])(?P<minute>[0-5]\d)(?P<second>[0-5]\d)(?P<zone>Z|[+-]\d\d\d\d)?',
+        r'(?<!\d)(?P<hour>[01]?\d|2[0-3])h(?P<minute>[0-5]\d)m(?P<second>[0-5]\d)s',
+        ]
+    datePatterns = [
+        r'(?P<year>20\d\d)-(?P<month>[01]?\d)-(?P<day>[0-3]?\d)',
+        r'(?<!\d)(?P<month>[01]?\d)/(?P<day>[0-3]?\d)/(?P<year>(?:20)?\d\d)(?!\d)',
+        r'(?P<day>[0-3]?\d)/(?P<litmonth>jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*/(?P<year>20\d\d)',
+        r'(?P<litmonth>jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+(?P<day>[0-3]?\d)(?:\s+(?P<year>20\d\d))?',
+        r'(?P<day>[0-3]?\d)\.(?P<month>[01]?\d)\.(?P<year>20\d\d)',
+        ]
+    sources = [
+        ['2008-03-14 12:01:%02d,123 INFO  [main] service started on port 8089',
+         '   at com.example.Foo.bar(Foo.java:%d)'],
+        ['15/May/2007:04:06:%02d -0800 "POST /carasso/was-here.html HTTP/1.0" 300 385'],
+        ['Mar 14 12:01:%02d myhost sshd[1234]: Accepted publickey for root'],
+        ['03/14/08 11:%02d pm scheduler: job 42 complete',
+         'no timestamp on this continuation line, number %d'],
+        ['14.03.2008 T1201%02dZ backup finished'],
+        ]
+    compileAll = lambda patterns: [re.compile(p, re.I) for p in patterns]
+
+    class TestPatternMatcher(unittest.TestCase):
+
+        def setUp(self):
+            global _MIN_YEAR, _MAX_YEAR
+            _MIN_YEAR, _MAX_YEAR = 2000, 2030
+
+        def testSameMatchAsList(self):
+            expressions = compileAll(datePatterns)
+            matcher = PatternMatcher(expressions)
+            for lines in sources:
+                for line in lines:
+                    text = line % 7
+                    expected = None
+                    for expression in expressions:
+                        match = expression.search(text)
+                        if match and _validateDate(match.groupdict()):
+                            expected = _validateDate(match.groupdict())
+                            break
+                    self.assertEqual(matcher.match(text, _validateDate), expected, text)
+            self.assertEqual([e.pattern for e in expressions], datePatterns)
+
+        def testCopyKeepsOwnHits(self):
+            matcher = PatternMatcher(compileAll(datePatterns))
+            other = matcher.copy()
+            self.assertTrue(other.literals is matcher.literals)
+            for i in range(3):
+                other.match('14.03.2008 T120100Z backup finished', _validateDate)
+            self.assertEqual(other.getHitCounts()[0], (datePatterns[4], 3))
+            self.assertEqual(matcher.getHitCounts()[0], (datePatterns[0], 0))
+
+        def testSharedBetweenThreads(self):
+            matcher = PatternMatcher(compileAll(datePatterns))
+            texts = [line % 7 for lines in sources for line in lines]
+            expected = [PatternMatcher(compileAll(datePatterns)).match(text, _validateDate) for text in texts]
+            errors, found = [], []
+            def run(seed):
+                rnd = random.Random(seed)
+                for i in range(2000):
+                    n = rnd.randrange(len(texts))
+                    extractions = matcher.match(texts[n], _validateDate)
+                    if extractions != expected[n]:
+                        errors.append(texts[n])
+                    elif extractions:
+                        found.append(n)
+            threads = [threading.Thread(target=run, args=(seed,)) for seed in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(sorted(matcher._order), range(len(datePatterns)))
+            counts = [hits for pattern, hits in matcher.getHitCounts()]
+            self.assertEqual(counts, sorted(counts, reverse=True))
+            self.assertEqual(sum(counts), len(found))
+
+        def testMatcherCacheIsBounded(self):
+            expressions = compileAll(timePatterns)
+            self.assertTrue(getMatcher(expressions) is getMatcher(compileAll(timePatterns)))
+            for i in range(MATCHER_CACHE_MAX_ENTRIES + 10):
+                getMatcher([re.compile('%d:(?P<minute>\\d\\d)' % i)])
+            self.assertEqual(len(_matchers), MATCHER_CACHE_MAX_ENTRIES)
+
+    def benchmark():
+        # the old code tried one shared list of expressions, moving each hit to the front;
+        # PatternMatcher is used with one matcher per source.
+        global _MIN_YEAR, _MAX_YEAR
+        random.seed(42)
+        lines = []
+        for i in range(20000):
+            source = random.randrange(len(sources))
+            lines.append((source, random.choice(sources[source]) % random.randint(0, 59)))
+
+        def moveToFrontMatch(text, expressions, validator):
+            index = -1
+            for expression in expressions:
+                index += 1
+                match = expression.search(text)
+                if match:
+                    extractions = validator(match.groupdict())
+                    if extractions:
+                        if index > 0:
+                            expressions.insert(0, expressions.pop(index))
+                        return extractions
+            return None
+
+        def bench(label, getmatch, timeExpressions, dateExpressions):
+            start = time.time()
+            found = 0
+            for source, line in lines:
+                if getmatch(line, timeExpressions[source], _validateTime):
+                    found += 1
+                    getmatch(line, dateExpressions[source], _validateDate)
+            elapsed = time.time() - start
+            print "%-16s %6.3fs  %5.1fus/line  %s of %s lines with a time" % (label, elapsed, 1e6 * elapsed / len(lines), found, len(lines))
+
+        _MIN_YEAR, _MAX_YEAR = 2000, 2030
+        sharedTime, sharedDate = compileAll(timePatterns), compileAll(datePatterns)
+        bench("move-to-front", moveToFrontMatch, [sharedTime] * len(sources), [sharedDate] * len(sources))
+        timeMatcher, dateMatcher = PatternMatcher(compileAll(timePatterns)), PatternMatcher(compileAll(datePatterns))
+        bench("shared matcher", getMatch, [timeMatcher] * len(sources), [dateMatcher] * len(sources))
+        timeMatchers = [timeMatcher.copy() for source in sources]
+        dateMatchers = [dateMatcher.copy() for source in sources]
+        bench("matcher/source", getMatch, timeMatchers, dateMatchers)
+        for source, matcher in enumerate(dateMatchers):
+            pattern, hits = matcher.getHitCounts()[0]
+            print "source %s: %5d hits  %s" % (source, hits, pattern[:60])
+
+    if sys.argv[1:] == ['benchmark']:
+        benchmark()
+    else:
+        unittest.main()
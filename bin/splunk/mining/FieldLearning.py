@@ -3,7 +3,9 @@
 #whole or in part without the express written permission of Splunk Inc. is prohibited.
 
 import re
+import time
 import logging
+from multiprocessing import Pool
 
 logger = logging.getLogger('splunk.mining.FieldLearning') 
 
@@ -27,6 +29,14 @@ MAX_VALUE_REGEX = 15
 MAXMATCHCOUNT = 10
 # don't allow jump to char if more than 30 chars away.  defeats much of purpose of dist
 MAXDIST = 30
+# validate rules against the events on a process pool once there are at
+# least this many events.  below that, forking costs more than it saves.
+PARALLEL_VALIDATION_MIN_EVENTS = 2000
+# number of validation processes.  1 (the default) validates in this process;
+# set it higher to opt in to a pool, which is started once per learn() call
+VALIDATION_PROCESSES = 1
+# compiled rule regexes are kept by pattern; the cache is flushed when it gets this big
+MAX_COMPILED_RULES = 1000
 
 # terms that you do not want to use as a prefix in regex
 BAD_MEAT = set(["sun", "mon", "tue", "tues", "wed", "thurs", "fri", "sat", "sunday", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec", "january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december", "2003", "2004", "2005", "2006", "2007", "2008", "2009", "am", "pm", "ut", "utc", "gmt", "cet", "cest", "cetdst", "met", "mest", "metdst", "mez", "mesz", "eet", "eest", "eetdst", "wet", "west", "wetdst", "msk", "msd", "ist", "jst", "kst", "hkt", "ast", "adt", "est", "edt", "cst", "cdt", "mst", "mdt", "pst", "pdt", "cast", "cadt", "east", "eadt", "wast", "wadt"])
@@ -46,16 +56,40 @@ def ruleCMP(x, y):
 def fastFirstRuleCMP(x, y):
     return y.getMatchCount() - x.getMatchCount() #len(x._wholePattern) - len(y._wholePattern)
 
-def learn(events, examples, counterexamples, justTopRule=True):
+def learn(events, examples, counterexamples, justTopRule=True, stats=None, processes=None):
+    '''if stats is a list, a dict of timings is appended to it for each learning cycle.
+    processes overrides VALIDATION_PROCESSES for this call.'''
+    if processes == None:
+        processes = VALIDATION_PROCESSES
+    pool = None
+    if processes > 1 and len(events) >= PARALLEL_VALIDATION_MIN_EVENTS:
+        pool = Pool(processes)
+    try:
+        return _learn(events, examples, counterexamples, justTopRule, stats, pool, processes)
+    finally:
+        if pool != None:
+            pool.terminate()
+            pool.join()
 
+def _learn(events, examples, counterexamples, justTopRule, stats, pool, processes):
     rules = None
     newTerms = None
     newExamples = list(examples)
     # for each learning cycle
     for i in range(0, MAX_ITERATIONS):
         logger.info("GENERATING RULES FROM %s EVENTS" % len(events))
+        start = time.time()
         rules = _generateRules(events, newExamples)
-        newTerms = _validateRules(events, newExamples, counterexamples, rules)
+        generated = time.time()
+        generatedCount = len(rules)
+        newTerms = _validateRules(events, newExamples, counterexamples, rules, pool, processes)
+        validated = time.time()
+        logger.debug("Iteration %s: generated %s rules in %.3fs, validated %s rules in %.3fs" % (i, generatedCount, generated - start, len(rules), validated - generated))
+        if stats != None:
+            stats.append({'iteration': i, 'events': len(events),
+                          'rules_generated': generatedCount, 'rules_kept': len(rules),
+                          'new_terms': len(newTerms),
+                          'generate_time': generated - start, 'validate_time': validated - generated})
         if len(newTerms) == 0:
             break
         newExamples.extend(newTerms)
@@ -126,7 +160,7 @@ def removeBadRules(rules, badrules):
 # remove rules that have bad patterns, like \d+(\d+)
 BADPATTERNS = [] #["\\d\+\(.*?>\\\d\+\)","\\d\(.*?>\\\d\+\)","\(.*?>\\\d\+\)\\d", "\\\d\+\(.*?>\\\d\+\)","\\\d\(.*?>\\\d\+\)","\(.*?>\\\d\+\)\\\d"]
 
-def _validateRules(events, examples, counterexamples, rules):
+def _validateRules(events, examples, counterexamples, rules, pool=None, processes=1):
 
     totalExtractions = 0
     knownmatches = 0
@@ -164,26 +198,21 @@ def _validateRules(events, examples, counterexamples, rules):
         r._score = None # reset the prelim score
 
     matchesSomething = set()
-    for event in events:
-        for rule in rules:
-            if rule in badrules:
-                continue
-            extractions = rule.findExtractions(event)
-            if len(extractions) > 0:
-                for extraction in extractions:
-                    #print "EXTRACTED:", extractions, "RULE:", rule
-                    if extraction in counterexamples:
-                        badrules.add(rule)
-                        logger.debug("Removing rule that learned counter example: %s Counterexample: %s" % (rule._wholePattern, extraction))
-                        break
-                    rule.addExtraction(extraction)
-                    totalExtractions += 1
-                    if extraction in examples:
-                        knownmatches += 1
-                        matchesSomething.add(rule)
-                    else:
-                        if not extraction in newExtractions:
-                            newExtractions.add(extraction)
+    results = _findRuleExtractions(events, [rule.getWholePattern() for rule in rules], counterexamples, pool, processes)
+    for rule, (extractions, counterexample) in zip(rules, results):
+        if counterexample != None:
+            badrules.add(rule)
+            logger.debug("Removing rule that learned counter example: %s Counterexample: %s" % (rule._wholePattern, counterexample))
+        for extraction in extractions:
+            #print "EXTRACTED:", extractions, "RULE:", rule
+            rule.addExtraction(extraction)
+            totalExtractions += 1
+            if extraction in examples:
+                knownmatches += 1
+                matchesSomething.add(rule)
+            else:
+                if not extraction in newExtractions:
+                    newExtractions.add(extraction)
 
     # delete rules that don't match anything
     for rule in rules:
@@ -199,6 +228,58 @@ def _validateRules(events, examples, counterexamples, rules):
     return newExtractions
     
 
+def _findRuleExtractions(events, patterns, counterexamples, pool=None, processes=1):
+    '''returns, for each pattern, the values it extracts from events, in event order and up
+    to the first counterexample, and that counterexample (or None).  given a process pool
+    of processes workers, the events are split into contiguous shards that are searched on
+    it; the shard results are merged in order so the outcome is the same as searching all
+    events in one go.  the caller owns the pool.'''
+    if pool == None or processes <= 1 or len(patterns) == 0:
+        return _validateShard((patterns, counterexamples, events))
+
+    size = (len(events) + processes - 1) / processes
+    shards = [(patterns, counterexamples, events[i:i+size]) for i in range(0, len(events), size)]
+    shardResults = pool.map(_validateShard, shards)
+
+    merged = [([], None) for pattern in patterns]
+    for shardResult in shardResults:
+        for i, (extractions, counterexample) in enumerate(shardResult):
+            if merged[i][1] != None:
+                continue # already thrown out by an earlier shard
+            merged[i] = (merged[i][0] + extractions, counterexample)
+    return merged
+
+def _validateShard(args):
+    # runs in the pool's worker processes, so it must be a module level function
+    patterns, counterexamples, events = args
+    results = []
+    for pattern in patterns:
+        search = compileRule(pattern).search
+        extractions = []
+        counterexample = None
+        for event in events:
+            m = search(event)
+            if m == None:
+                continue
+            extraction = m.group(1)
+            if extraction in counterexamples:
+                counterexample = extraction
+                break
+            extractions.append(extraction)
+        results.append((extractions, counterexample))
+    return results
+
+_compiledRules = {}
+
+def compileRule(pattern):
+    '''returns the compiled regex for pattern, compiling each pattern only once'''
+    regex = _compiledRules.get(pattern)
+    if regex == None:
+        if len(_compiledRules) >= MAX_COMPILED_RULES:
+            _compiledRules.clear()
+        regex = _compiledRules[pattern] = re.compile(pattern)
+    return regex
+
 def _generateEventRules(events, event, extractions):
     rules = []
     for extraction in extractions:
@@ -819,7 +900,7 @@ class PositionalRule:
 
     def getRE(self):
         if self._regex == None:
-            self._regex = re.compile(self._wholePattern)
+            self._regex = compileRule(self._wholePattern)
         return self._regex
     
     def setExamples(self, examples):
@@ -9,6 +9,7 @@ import splunk.util as util
 import datetime 
 import traceback
 import time
+import DateParser
 
 LOGGING_FORMAT = "%(asctime)s %(levelname)-s\t%(module)s:%(lineno)d - %(message)s"
 class LoggingFormatterWithTimeZoneOffset(logging.Formatter):
@@ -329,7 +330,7 @@ def getTimeInfoTuplet():
     text = readText(timestampconfigfilename)
     text = text.replace('\\n', '\n').replace('\n\n', '\n')
     exec(text)
-    compiledTimePatterns = compilePatterns(timePatterns)
-    compiledDatePatterns = compilePatterns(datePatterns)
+    compiledTimePatterns = DateParser.PatternMatcher(compilePatterns(timePatterns))
+    compiledDatePatterns = DateParser.PatternMatcher(compilePatterns(datePatterns))
     timeInfoTuplet = [compiledTimePatterns, compiledDatePatterns, minYear, maxYear]
     return timeInfoTuplet
@@ -3,7 +3,11 @@
 # www.djangoproject.com
 #
 
+import collections
+import copy
 import logging
+import threading
+import time
 import urlparse, re
 
 import splunk.entity
@@ -16,15 +20,75 @@ logger = logging.getLogger('splunk.models.base')
 LINK_REMOVE_KEY = 'remove'
 LINK_LIST_KEY = 'list'
 
+# number of page requests a prefetching query set keeps in flight
+PREFETCH_THREADS = 4
+# how long, and how many, pages of entities a family of prefetching query sets keeps
+PREFETCH_MAX_SECONDS = 30
+PREFETCH_MAX_PAGES = 200
+
+
+class PageCache(object):
+    '''
+    Pages of entities fetched by a prefetching SplunkQuerySet, keyed by the
+    query (search, sort, namespace...) and the page offset, along with the
+    total number of entities of each query.  Shared by a query set and all
+    its clones; safe to use from several threads.
+    '''
+
+    def __init__(self, max_seconds=PREFETCH_MAX_SECONDS, max_pages=PREFETCH_MAX_PAGES):
+        self.max_seconds = max_seconds
+        self.max_pages   = max_pages
+        self._pages      = collections.OrderedDict() # (key, offset) -> (time, entities)
+        self._totals     = {} # key -> (time, total)
+        self._lock       = threading.Lock()
+
+    def get_total(self, key):
+        '''Returns the total number of entities of the query key, or None.'''
+        with self._lock:
+            entry = self._totals.get(key)
+            if entry is None or entry[0] + self.max_seconds < time.time():
+                return None
+            return entry[1]
+
+    def set_total(self, key, total):
+        with self._lock:
+            self._totals[key] = (time.time(), total)
+
+    def get(self, key, offset):
+        '''Returns the list of entities of the page at offset, or None.'''
+        with self._lock:
+            entry = self._pages.pop((key, offset), None)
+            if entry is None or entry[0] + self.max_seconds < time.time():
+                return None
+            self._pages[(key, offset)] = entry
+            return entry[1]
+
+    def set(self, key, offset, entities):
+        with self._lock:
+            self._pages.pop((key, offset), None)
+            self._pages[(key, offset)] = (time.time(), entities)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._totals.clear()
+
 
 class SplunkQuerySet(object):
     '''
     A simple query set for splunkd model objects.
 
     Supports iterating, slicing, searching, and ordering.
+
+    A query set built with prefetch_threads (see prefetch()) requests whole
+    pages of count_per_req entities, several at a time, and keeps them in a
+    PageCache shared with its clones, so that slicing it again does not go
+    back to splunkd for pages it already has.
     '''
 
-    def __init__(self, manager, count_per_req=50, host_path=None, sessionKey=None):
+    def __init__(self, manager, count_per_req=50, host_path=None, sessionKey=None, prefetch_threads=None):
         self.manager            = manager
         self._host_path         = host_path
         self._sessionKey        = sessionKey
@@ -39,6 +103,8 @@ class SplunkQuerySet(object):
         self._search_string     = None
         self._search_count      = None
         self._additional_getargs = None
+        self._prefetch_threads  = prefetch_threads
+        self._page_cache        = PageCache() if prefetch_threads else None
         
         self._uri               = None
         self._namespace         = None
@@ -47,6 +113,8 @@ class SplunkQuerySet(object):
     def get_total(self):
         '''Get the total. If total has not yet been defined, request it from splunkd.'''
 
+        if self._total == None and self._prefetch_threads:
+            self._total = self._get_prefetch_total()
         if self._total == None:
             try:
                 self._total = int(self.get_entities(count=1, offset=0, 
@@ -231,6 +299,13 @@ class SplunkQuerySet(object):
         resource in pages based on the internal count_per_req.
         '''
 
+        if self._prefetch_threads:
+            return self._prefetch_iterator()
+        return self._paged_iterator()
+
+    def _paged_iterator(self):
+        '''Retrieves the pages one request after the other.'''
+
         # Set the count to the lesser of the count_per_req or the internal
         # count. This remains constant until the very last req.
         iter_count = self._count_per_req if (self._count > self._count_per_req or self._count == 0) else self._count
@@ -287,6 +362,162 @@ class SplunkQuerySet(object):
             for model in results:
                 yield model
 
+    def _prefetch_iterator(self):
+        '''
+        Retrieves all the pages covering this query set's slice before yielding
+        the first model.  Pages already in the page cache are not requested
+        again, and runs of missing pages are split into at most
+        _prefetch_threads requests of adjacent pages that run concurrently.
+        '''
+
+        page_size = self._count_per_req
+        key = self._page_key()
+        # worker threads do not see the current request's session
+        sessionKey = self._sessionKey or splunk.getSessionKey()
+
+        start = self._offset
+        first = start - start % page_size
+        pages = {}
+        try:
+            total = self._page_cache.get_total(key)
+            if total is None:
+                # the first page also tells how many entities there are
+                total = self._fetch_pages(key, first, 1, sessionKey, pages)
+        except splunk.AuthenticationFailed:
+            raise
+        except splunk.LicenseRestriction: 
+            raise splunk.LicenseRestriction
+        except Exception, e:
+            logger.warn('Could not retrieve entities for the given resource with the following error %s' % e)
+            self.total = 0
+            return
+        self.total = total
+
+        stop = start + self._count if self._count else total
+        stop = min(stop, total)
+        offsets = range(first, stop, page_size)
+
+        missing = []
+        for offset in offsets:
+            if offset not in pages:
+                page = self._page_cache.get(key, offset)
+                if page is None:
+                    missing.append(offset)
+                else:
+                    pages[offset] = page
+
+        requests = []
+        for run in self._page_runs(missing):
+            per_request = -(-len(run) // self._prefetch_threads)
+            for i in range(0, len(run), per_request):
+                requests.append((run[i], len(run[i:i + per_request])))
+        self._fetch_concurrently(key, requests, sessionKey, pages)
+
+        for offset in offsets:
+            # cached entities are copied so that saving a model cannot alter them
+            page = copy.deepcopy(pages.get(offset, []))
+            for i, entity in enumerate(page):
+                if start <= offset + i < stop:
+                    yield self.manager._from_entity(self.manager._fix_entity(entity))
+
+    def _page_runs(self, offsets):
+        '''Splits a sorted list of page offsets into lists of adjacent pages.'''
+        runs = []
+        for offset in offsets:
+            if runs and runs[-1][-1] + self._count_per_req == offset:
+                runs[-1].append(offset)
+            else:
+                runs.append([offset])
+        return runs
+
+    def _fetch_concurrently(self, key, requests, sessionKey, pages):
+        '''Runs _fetch_pages for each (offset, num_pages) of requests on up to _prefetch_threads threads.'''
+
+        if len(requests) <= 1:
+            for offset, num_pages in requests:
+                self._fetch_pages(key, offset, num_pages, sessionKey, pages)
+            return
+
+        errors = []
+        pending = list(requests)
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                lock.acquire()
+                try:
+                    if not pending or errors:
+                        return
+                    offset, num_pages = pending.pop(0)
+                finally:
+                    lock.release()
+                try:
+                    self._fetch_pages(key, offset, num_pages, sessionKey, pages)
+                except Exception, e:
+                    lock.acquire()
+                    errors.append(e)
+                    lock.release()
+
+        threads = [threading.Thread(target=worker) for i in range(min(self._prefetch_threads, len(requests)))]
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def _fetch_pages(self, key, offset, num_pages, sessionKey, pages):
+        '''
+        Requests num_pages adjacent pages starting at offset in one call,
+        stores them in pages and in the page cache, and returns the total.
+        '''
+
+        page_size = self._count_per_req
+        entities = self.get_entities(count=page_size * num_pages, offset=offset, search=self._search_string, sort_key=self._sort_key, sort_dir=self._sort_dir, hostPath=self._host_path, sessionKey=sessionKey)
+        total = int(entities.totalResults)
+        self._page_cache.set_total(key, total)
+
+        entities = entities.values()
+        for i in range(num_pages):
+            page = entities[i * page_size:(i + 1) * page_size]
+            if not page and offset + i * page_size >= total:
+                break
+            pages[offset + i * page_size] = page
+            self._page_cache.set(key, offset + i * page_size, page)
+        return total
+
+    def _get_prefetch_total(self):
+        '''Gets the total from the page cache, or from the first page of this query set.'''
+
+        total = self._page_cache.get_total(self._page_key())
+        if total is None:
+            try:
+                start = self._offset - self._offset % self._count_per_req
+                total = self._fetch_pages(self._page_key(), start, 1, self._sessionKey or splunk.getSessionKey(), {})
+            except splunk.AuthenticationFailed:
+                raise
+            except Exception, e:
+                total = 0
+                logger.warn('Could not retrieve entities for the given resource with the following error %s' % e)
+        return total
+
+    def _page_key(self):
+        '''Returns the part of the page cache key that identifies this query, whatever its slice.'''
+        getargs = self._additional_getargs and repr(sorted(self._additional_getargs.items()))
+        return (self._search_string, self._sort_key, self._sort_dir, self._namespace, self._owner, self._uri, self._host_path, getargs)
+
+    def prefetch(self, threads=PREFETCH_THREADS, *args, **kwargs):
+        '''
+        Returns a clone of the current query set that requests its pages
+        concurrently, on up to threads threads, and caches them.
+        '''
+        clone = self._clone()
+        clone._prefetch_threads = threads
+        if clone._page_cache is None:
+            clone._page_cache = PageCache()
+        return clone
+
     def get_entities(self, **kwargs):
         '''Simple wrapper around the getEntities method.'''
 
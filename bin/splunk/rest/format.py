@@ -39,6 +39,22 @@ def parseFeedDocument(inputContents, contentsAreEscaped=False):
     
     if contentsAreEscaped: inputContents = su.unescape(inputContents)
     
+    # feeds, by far the most common documents, are read incrementally
+    try:
+        output = AtomFeed()
+        output.entries = list(iterFeedEntries(inputContents, output))
+        return output
+    except ValueError:
+        # not a feed, see below
+        pass
+    except etree.XMLSyntaxError, e:
+        logger.warn('There was an error parsing the feed document. Error: %s' % e.message)
+        logger.debug('parseFeedDocument inputContents = %s', inputContents) 
+
+        if contentsAreEscaped:
+            return su.escape(inputContents)
+        else:
+            return inputContents
 
     # parse XML
     try:
@@ -118,31 +134,132 @@ def toAtomFeed(lxmlNode):
 
     root = lxmlNode
     output = AtomFeed()
-
-    # extract props
-    output.id = root.findtext(ATOM_TAGF % 'id')
-    output.title = root.findtext(ATOM_TAGF % 'title')
-    output.updated = util.parseISO(root.findtext(ATOM_TAGF % 'updated', ''))
-
-    # extract OpenSearch props
-    output.os_totalResults = root.findtext(OPENSEARCH_TAGF % 'totalResults')
-    output.os_itemsPerPage = root.findtext(OPENSEARCH_TAGF % 'itemsPerPage')
-    output.os_startIndex   = root.findtext(OPENSEARCH_TAGF % 'startIndex')
+    _readFeedProperties(output, root)
 
     # extract messages
     for msg in root.xpath('//s:msg', namespaces={'s': SPLUNK_NS}):
         output.messages.append({'type': msg.get('type','error').lower(), 'text': msg.text})
     
+    # iterate over entries
+    output.entries = map(toAtomEntry, root.xpath('//a:entry', namespaces={'a': ATOM_NS}))
+
+    return output
+    
+
+def _readFeedProperties(feed, root):
+    '''
+    Sets the properties of an AtomFeed from the child nodes of the lxml <feed>
+    node root
+    '''
+
+    # extract props
+    feed.id = root.findtext(ATOM_TAGF % 'id')
+    feed.title = root.findtext(ATOM_TAGF % 'title')
+    feed.updated = util.parseISO(root.findtext(ATOM_TAGF % 'updated', ''))
+
+    # extract OpenSearch props
+    feed.os_totalResults = root.findtext(OPENSEARCH_TAGF % 'totalResults')
+    feed.os_itemsPerPage = root.findtext(OPENSEARCH_TAGF % 'itemsPerPage')
+    feed.os_startIndex   = root.findtext(OPENSEARCH_TAGF % 'startIndex')
+
     # extract links
     try: 
-        output.links = map((lambda link: (link.attrib['rel'], link.attrib['href'])), root.findall(ATOM_TAGF % 'link'))
+        feed.links = map((lambda link: (link.attrib['rel'], link.attrib['href'])), root.findall(ATOM_TAGF % 'link'))
     except KeyError:
         pass # SPL-21884
-                        
-    # iterate over entries
-    output.entries = map(toAtomEntry, root.xpath('//a:entry', namespaces={'a': ATOM_NS}))
+    
+    
+def iterFeedEntries(source, feed=None):
+    '''
+    Incrementally parses an Atom <feed> document and yields an AtomEntry for
+    each of its entries as soon as it has been read.  Only the entry being
+    read is held as lxml nodes; the nodes of an entry are freed once it has
+    been yielded, except for its content node, which stays referenced by
+    AtomEntry.rawcontents until AtomEntry.toPrimitive() converts it.
+    
+    source - the document, as a string, a file-like object, or an iterable
+        of strings such as StreamingResponse.readall()
+    feed - an optional AtomFeed that gets the feed's messages, and its id,
+        title, updated, OpenSearch and link properties as read from the
+        nodes that precede the first entry (which is where splunkd puts
+        them); the entries themselves are not added to it
+    
+    Raises ValueError if the document is not an Atom feed, and
+    etree.XMLSyntaxError if it is not well formed.
+    '''
+    
+    tags = (ATOM_TAGF % 'feed', ATOM_TAGF % 'entry', SPLUNK_TAGF % 'msg')
+    context = etree.iterparse(_BlockReader(source), events=('start', 'end'), tag=tags)
+    try:
+        event, root = context.next()
+    except StopIteration:
+        raise ValueError, 'iterFeedEntries - no Atom <feed> node found'
+    if root.tag != ATOM_TAGF % 'feed' or root.getparent() is not None or root.nsmap.get(None) != ATOM_NS:
+        raise ValueError, 'iterFeedEntries - document is not an Atom feed'
+    
+    if feed is None:
+        feed = AtomFeed()
+    return _iterFeedEntries(context, root, feed)
 
-    return output
+
+def _iterFeedEntries(context, root, feed):
+
+    hasProperties = False
+    for event, node in context:
+        if event != 'end':
+            continue
+            
+        if node.tag == SPLUNK_TAGF % 'msg':
+            feed.messages.append({'type': node.get('type','error').lower(), 'text': node.text})
+            
+        elif node is root:
+            if not hasProperties:
+                _readFeedProperties(feed, root)
+                
+        elif node.tag == ATOM_TAGF % 'entry' and node.getparent() is root:
+            if not hasProperties:
+                _readFeedProperties(feed, root)
+                hasProperties = True
+                
+            yield toAtomEntry(node)
+            
+            # drop the nodes read so far; lxml keeps the ones still
+            # referenced from python, such as the entry's content, alive
+            node.clear()
+            while node.getprevious() is not None:
+                del root[0]
+    
+
+class _BlockReader(object):
+    '''
+    File-like wrapper handing a string, or an iterable of strings, to
+    etree.iterparse
+    '''
+    
+    def __init__(self, source):
+        if isinstance(source, basestring):
+            source = [source]
+        if hasattr(source, 'read'):
+            source = iter(lambda: source.read(32768), '')
+        self._blocks = iter(source)
+        self._block = ''
+        self._pos = 0
+        
+    def read(self, size=-1):
+        while self._pos >= len(self._block):
+            try:
+                self._block = self._blocks.next()
+            except StopIteration:
+                return ''
+            if isinstance(self._block, unicode):
+                self._block = self._block.encode('utf-8')
+            self._pos = 0
+        if size < 0:
+            size = len(self._block)
+        output = self._block[self._pos:self._pos + size]
+        self._pos += len(output)
+        return output
+    
     
     
 def toAtomEntry(lxmlNode):
@@ -770,6 +887,35 @@ if __name__ == '__main__':
             
             ae = AtomEntry(id='foo', title='title', updated='now', rawcontents=xmlelement)
             self.assertEquals(ae.toPrimitive(), nodeToPrimitive(xmlelement))
+
+        def testIterFeedEntries(self):
+            '''
+            checks that the incremental feed reader gives the same feed and
+            entries as the fromstring based toAtomFeed()
+            '''
+            
+            entry = '<entry><title>e%d</title><id>/e%d</id><updated>2014-01-01T00:00:00-08:00</updated><link href="/e%d" rel="alternate"/><author><name>admin</name></author><content type="text/xml"><s:dict><s:key name="k">v%d</s:key></s:dict></content></entry>'
+            xmlstring = '<feed xmlns="%s" xmlns:s="%s" xmlns:opensearch="%s"><title>feed</title><id>/feed</id><link href="/feed/_new" rel="create"/><opensearch:totalResults>3</opensearch:totalResults><s:messages><s:msg type="WARN">careful</s:msg></s:messages>%s</feed>' \
+                % (ATOM_NS, SPLUNK_NS, OPENSEARCH_NS, ''.join([entry % (i, i, i, i) for i in range(3)]))
+            expected = toAtomFeed(etree.fromstring(xmlstring))
+            
+            # read in small blocks, as from StreamingResponse.readall()
+            feed = AtomFeed()
+            entries = iterFeedEntries([xmlstring[i:i + 10] for i in range(0, len(xmlstring), 10)], feed)
+            self.assertEquals(entries.next().title, 'e0')
+            self.assertEquals(feed.os_totalResults, '3')
+            self.assertEquals(feed.messages, [{'type': 'warn', 'text': 'careful'}])
+            self.assertEquals(feed.links, [('create', '/feed/_new')])
+            self.assertEquals([e.toPrimitive() for e in entries], [{'k': 'v1'}, {'k': 'v2'}])
+            
+            feed = parseFeedDocument(xmlstring)
+            self.assertEquals((feed.id, feed.title, feed.links), (expected.id, expected.title, expected.links))
+            self.assertEquals([(e.id, e.links, e.toPrimitive()) for e in feed], [(e.id, e.links, e.toPrimitive()) for e in expected])
+            
+            # documents other than feeds
+            self.assertRaises(ValueError, iterFeedEntries, (entry % (0, 0, 0, 0)).replace('<entry>', '<entry xmlns="%s" xmlns:s="%s">' % (ATOM_NS, SPLUNK_NS)))
+            self.assertEquals(parseFeedDocument('<foo>bar</foo>'), '<foo>bar</foo>')
+            self.assertEquals(parseFeedDocument('<feed xmlns="%s"><entry>' % ATOM_NS), '<feed xmlns="%s"><entry>' % ATOM_NS)
             
             
 
@@ -2,6 +2,9 @@ import httplib2
 import urllib
 import lxml.etree as et
 import copy
+import collections
+import threading
+import time
 import splunk
 
 #SPL-18208
@@ -17,17 +20,72 @@ from TransformerUtil import *
 ### Creat
 ###
 
-def parseSearchToXML(search, hostPath=None, sessionKey=None, parseOnly='t', timeline=None, namespace=None, owner=None):
+# the parser's responses are cached, keyed by search string, parse options, namespace and owner
+PARSE_CACHE_MAX_ENTRIES = 500
+PARSE_CACHE_MAX_SECONDS = 300
+
+
+class ParseCache(object):
     """
-        Given a valid search string, return the XML from the splunk parsing endpoint that
-        represents the search.
+    Bounded, thread safe LRU cache of /search/parser responses.  Each entry
+    holds the response XML and, once parseSearch() has built one, a snapshot
+    of the ParsedSearch for it.  Entries expire after maxSeconds, so changes
+    to commands or macros on the server are eventually seen.
     """
 
-    if search == None or len(search) == 0:
-        return None
-    
-    if not owner: owner = auth.getCurrentUser()['name']
-    
+    def __init__(self, maxEntries=PARSE_CACHE_MAX_ENTRIES, maxSeconds=PARSE_CACHE_MAX_SECONDS):
+        self.maxEntries = maxEntries
+        self.maxSeconds = maxSeconds
+        self._entries   = collections.OrderedDict() # key -> [time, xml, ParsedSearch or None]
+        self._lock      = threading.Lock()
+        self.hits       = 0
+        self.misses     = 0
+        self.evictions  = 0
+
+    def get(self, key):
+        """ Returns the (xml, ParsedSearch or None) cached for key, or None """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] + self.maxSeconds < time.time():
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(self, key, xml, parsed=None):
+        """ Caches xml and optionally its ParsedSearch, which must not be handed out afterwards """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = [time.time(), xml, parsed]
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """ Returns the number of entries and the hit, miss and eviction counts """
+        with self._lock:
+            return {
+                'size'      : len(self._entries),
+                'hits'      : self.hits,
+                'misses'    : self.misses,
+                'evictions' : self.evictions
+            }
+
+parseCache = ParseCache()
+
+
+def _parseCacheKey(search, hostPath, parseOnly, timeline, namespace, owner):
+    return (search, hostPath, parseOnly, timeline, namespace, owner)
+
+
+def _requestSearchXML(search, hostPath, sessionKey, parseOnly, timeline, namespace, owner):
+    """ Asks the splunk parsing endpoint for the XML representing search """
+
     uri = entity.buildEndpoint('/search/parser', namespace=namespace, owner=owner)
     if hostPath:
         uri = splunk.mergeHostPath(hostPath) + uri
@@ -52,14 +110,58 @@ def parseSearchToXML(search, hostPath=None, sessionKey=None, parseOnly='t', time
     return serverContent
 
 
-def parseSearch(search, hostPath=None, sessionKey=None, parseOnly='t', namespace=None, owner=None, timeline=None):
+def parseSearchToXML(search, hostPath=None, sessionKey=None, parseOnly='t', timeline=None, namespace=None, owner=None, useCache=True):
+    """
+        Given a valid search string, return the XML from the splunk parsing endpoint that
+        represents the search.  The response is cached in parseCache unless useCache is False.
+    """
+
+    if search == None or len(search) == 0:
+        return None
+    
+    if not owner: owner = auth.getCurrentUser()['name']
+
+    if not useCache:
+        return _requestSearchXML(search, hostPath, sessionKey, parseOnly, timeline, namespace, owner)
+
+    key = _parseCacheKey(search, hostPath, parseOnly, timeline, namespace, owner)
+    cached = parseCache.get(key)
+    if cached != None:
+        return cached[0]
+
+    xml = _requestSearchXML(search, hostPath, sessionKey, parseOnly, timeline, namespace, owner)
+    parseCache.set(key, xml)
+    return xml
+
+
+def parseSearch(search, hostPath=None, sessionKey=None, parseOnly='t', namespace=None, owner=None, timeline=None, useCache=True):
     """
 	Given a valid search string, return an object that represents
 	the searchs properties
+
+        Unless useCache is False, the parsed search is cached in parseCache.
+        Every call returns its own copy, so callers are free to modify it.
     """
 
-    # parse out the response xml to an object and return it
-    return ParsedSearch(parseSearchToXML(search, hostPath, sessionKey, parseOnly, timeline=timeline, namespace=namespace, owner=owner))
+    if not useCache or search == None or len(search) == 0:
+        # parse out the response xml to an object and return it
+        return ParsedSearch(parseSearchToXML(search, hostPath, sessionKey, parseOnly, timeline=timeline, namespace=namespace, owner=owner, useCache=useCache))
+
+    if not owner: owner = auth.getCurrentUser()['name']
+
+    key = _parseCacheKey(search, hostPath, parseOnly, timeline, namespace, owner)
+    cached = parseCache.get(key)
+    if cached != None and cached[1] != None:
+        return copy.deepcopy(cached[1])
+
+    if cached != None:
+        xml = cached[0]
+    else:
+        xml = _requestSearchXML(search, hostPath, sessionKey, parseOnly, timeline, namespace, owner)
+
+    parsed = ParsedSearch(xml)
+    parseCache.set(key, xml, copy.deepcopy(parsed))
+    return parsed
 
 ###
 ### Parsed objects 
@@ -513,10 +615,76 @@ if __name__ == "__main__":
             return val.strip()
         return val
 
+    class TestParseCache(unittest.TestCase):
+        """ Tests the parse cache against a stub parser endpoint """
+
+        xml = """<response>
+            <dict><key name="remoteSearch">search foo</key></dict>
+            <list><item><dict>
+                <key name="command">search</key>
+                <key name="rawargs">foo</key>
+                <key name="args">foo</key>
+            </dict></item></list>
+        </response>"""
+
+        def setUp(self):
+            self.requests = []
+            self._simpleRequest = rest.simpleRequest
+            def stubRequest(uri, getargs=None, sessionKey=None, **kwargs):
+                self.requests.append(getargs)
+                class Response(object):
+                    status = 200
+                return Response(), self.xml
+            rest.simpleRequest = stubRequest
+            parseCache.clear()
+
+        def tearDown(self):
+            rest.simpleRequest = self._simpleRequest
+
+        def testCacheHits(self):
+            ps1 = parseSearch('search foo', owner='admin', namespace='search')
+            ps2 = parseSearch('search foo', owner='admin', namespace='search')
+            self.assertEquals(len(self.requests), 1)
+            self.assertEquals(ps1, ps2)
+            self.assertEquals(parseSearchToXML('search foo', owner='admin', namespace='search'), self.xml)
+            self.assertEquals(len(self.requests), 1)
+
+            # different options are different entries
+            parseSearch('search foo', owner='admin', namespace='search', timeline=False)
+            parseSearch('search foo', owner='nobody', namespace='search')
+            self.assertEquals(len(self.requests), 3)
+            parseSearch('search foo', owner='admin', namespace='search', useCache=False)
+            self.assertEquals(len(self.requests), 4)
+
+            stats = parseCache.stats()
+            self.assertEquals(stats['hits'], 2)
+            self.assertEquals(stats['misses'], 3)
+
+        def testCopies(self):
+            ps1 = parseSearch('search foo', owner='admin')
+            ps1.clauses[0].args = 'bar'
+            ps1.clauses.append(ParsedClause(command='head', args='1'))
+            ps2 = parseSearch('search foo', owner='admin')
+            self.assertEquals(len(ps2.clauses), 1)
+            self.assertEquals(ps2.clauses[0].args, 'foo')
+            self.failIf(ps2.isDirty())
+
+        def testEviction(self):
+            cache = ParseCache(maxEntries=2)
+            for i in range(3):
+                cache.set(i, str(i))
+            self.assertEquals(cache.get(0), None)
+            self.assertEquals(cache.get(2), ('2', None))
+            self.assertEquals(cache.stats()['evictions'], 1)
+
     class TestParse(unittest.TestCase):
 
-        _sessionKey = auth.getSessionKey('admin', 'changeme')
-        _hostPath   = splunk.mergeHostPath()
+        # these tests run against a live splunkd; log in once the suite runs,
+        # so that the offline TestParseCache runs without one
+        @classmethod
+        def setUpClass(cls):
+            cls._sessionKey = auth.getSessionKey('admin', 'changeme')
+            cls._hostPath   = splunk.mergeHostPath()
 
         # searches 
         q = {
@@ -688,5 +856,8 @@ if __name__ == "__main__":
                     self.assertEquals( k, out)
 
     # Execute test suite.
-    parseSuite = unittest.TestLoader().loadTestsFromTestCase(TestParse)
+    parseSuite = unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(TestParseCache),
+        unittest.TestLoader().loadTestsFromTestCase(TestParse)
+    ])
     unittest.TextTestRunner(verbosity=3).run(parseSuite)
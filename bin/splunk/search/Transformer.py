@@ -70,19 +70,11 @@ def decomposeSearch(namespace, owner, parsed, q=None, checkp=True):
 
     # no all intentions are decomposble. list only the decomposable here.
     # e.g. how to decompose removeterm?
-    decomposableMap = _gatherTransformers('untransform', namespace)
-
     # each transform should have an untransform/decompose method that 
     # that decomposes an intent or set of intents, and returns the decomposed
     # search for the next intent to decompose.
-
-    decomposers = []
-    for k,v in decomposableMap.items():
-        decomposers.append(v)
-
-    # sort the decomposers by priority
-    decomposers.sort(key=lambda obj: obj.priority)
-    decomposers.reverse()
+    # the decomposers come sorted by priority, highest first
+    decomposers = _getDecomposers(namespace)
 
     # make deep copy of original search
     originalParsed = copy.deepcopy(parsed)
@@ -146,32 +138,72 @@ def _untrustworthyDecomposition(namespace, owner, original, decomposedParse, dec
     return False
 
 
-def _gatherTransformers(filter_s, namespace=None):
-    """ return a list of the transformer classes """
+# how long the enabled_decomposers setting of an app's web.conf is cached
+ENABLED_DECOMPOSERS_MAX_SECONDS = 60
+_enabledDecomposersCache = shutils.AgedCache(max_seconds=ENABLED_DECOMPOSERS_MAX_SECONDS, max_entries=100)
+# sorted decomposers for each distinct enabled_decomposers setting
+_enabledDecomposerLists = {}
 
-    intentTransformMap = {}
-    transformers = [o for k,o in globals().items() if inspect.isclass(o) and issubclass(o, BaseTransformer) ]
-    transformers = [t for t in transformers if hasattr(t, filter_s) ]
+def _buildTransformerRegistry(transformers, capabilities=('transform', 'untransform')):
+    """ return a map of capability to a map of intent name to the transformers that have that method """
 
-    for transformer in transformers:
-        intentTransformMap[transformer.name] = transformer()
+    registry = {}
+    for capability in capabilities:
+        registry[capability] = dict([(t.name, t) for t in transformers if hasattr(t, capability)])
+    return registry
+
+def _gatherTransformers(filter_s, namespace=None):
+    """ return a map of intent name to transformer, for the transformers that have a filter_s method """
+
+    intentTransformMap = _transformerRegistry.get(filter_s)
+    if intentTransformMap is None:
+        intentTransformMap = _buildTransformerRegistry(_transformers, (filter_s,))[filter_s]
+        _transformerRegistry[filter_s] = intentTransformMap
 
     # allow app specific decomposition, hack for SPL-32478
     if namespace and filter_s == "untransform":
+        enabled_decomposers = _getEnabledDecomposers(namespace)
+        return dict([item for item in intentTransformMap.items() if item[0] in enabled_decomposers])
+    else:
+        # not in an app, or for composition
+        return dict(intentTransformMap)
+
+def _sortDecomposers(decomposableMap):
+    """ return the decomposers of decomposableMap, highest priority first.  decomposers
+        of equal priority come in the reverse of the map's order, and decomposeSearch
+        relies on that order to pick which one runs first """
+    decomposers = decomposableMap.values()
+    decomposers.sort(key=lambda obj: obj.priority)
+    decomposers.reverse()
+    return decomposers
+
+def _getDecomposers(namespace=None):
+    """ return the transformers that can decompose searches in namespace, highest priority first """
+    if namespace:
+        enabled_decomposers = _getEnabledDecomposers(namespace)
+        decomposers = _enabledDecomposerLists.get(enabled_decomposers)
+        if decomposers is None:
+            # the order of equal priorities depends on the filtered map, so sort it as is
+            decomposers = _sortDecomposers(_gatherTransformers('untransform', namespace))
+            _enabledDecomposerLists[enabled_decomposers] = decomposers
+        return list(decomposers)
+    return list(_sortedDecomposers)
+
+def _getEnabledDecomposers(namespace):
+    """ return the set of intent names listed in enabled_decomposers in namespace's web.conf """
+    enabled_decomposers = _enabledDecomposersCache.getValid(namespace)
+    if enabled_decomposers is None:
         web_conf = splunk.bundle.getConf('web', namespace=namespace)
         # get stanza without failure if not present
         settings = web_conf.get("settings")
         if not "enabled_decomposers" in settings:
             # no decomposers wanted
-            return {}
-        enabled_decomposers = re.split('[, ]+', settings["enabled_decomposers"])
-        enabled_decomposers = map(string.strip, enabled_decomposers)
-        enabled_checker = lambda item: item[0] in enabled_decomposers
-        enabled_map = dict(filter(enabled_checker, intentTransformMap.items()))
-        return enabled_map
-    else:
-        # not in an app, or for composition
-        return intentTransformMap
+            enabled_decomposers = frozenset()
+        else:
+            enabled_decomposers = re.split('[, ]+', settings["enabled_decomposers"])
+            enabled_decomposers = frozenset(map(string.strip, enabled_decomposers))
+        _enabledDecomposersCache[namespace] = enabled_decomposers
+    return enabled_decomposers
 
 def _isDecomposable(parsed):
     """
@@ -1760,9 +1792,42 @@ def addArgIfNotDefault(inDict, outDict, field, defaultval):
             outDict[IARG][field] = val
 
 
-
-
-
-
-
+# built once all the transformer classes above are defined.  transformers have no
+# state of their own, so one instance of each is shared by all callers
+_transformers = [o() for k,o in globals().items() if inspect.isclass(o) and issubclass(o, BaseTransformer) ]
+_transformerRegistry = _buildTransformerRegistry(_transformers)
+_sortedDecomposers = _sortDecomposers(_transformerRegistry['untransform'])
+
+
+if __name__ == "__main__":
+    import unittest
+
+    class TestDecomposerOrder(unittest.TestCase):
+        """ Tests that the precomputed decomposers keep the order of gathering them on each call """
+
+        def gatherDecomposers(self, enabled=None):
+            # the computation decomposeSearch did before the registry was precomputed
+            transformers = [o for k,o in globals().items() if inspect.isclass(o) and issubclass(o, BaseTransformer) ]
+            intentTransformMap = {}
+            for transformer in [t for t in transformers if hasattr(t, 'untransform') ]:
+                intentTransformMap[transformer.name] = transformer()
+            if enabled is not None:
+                intentTransformMap = dict(filter(lambda item: item[0] in enabled, intentTransformMap.items()))
+            decomposers = intentTransformMap.values()
+            decomposers.sort(key=lambda obj: obj.priority)
+            decomposers.reverse()
+            return [d.name for d in decomposers]
+
+        def testDefaultOrder(self):
+            self.assertEquals([d.name for d in _getDecomposers()], self.gatherDecomposers())
+
+        def testEnabledOrder(self):
+            enabled = frozenset(['addterm', 'addtermgt', 'addtermlt', 'stats', 'plot', 'sort'])
+            _enabledDecomposersCache['search'] = enabled
+            try:
+                self.assertEquals([d.name for d in _getDecomposers('search')], self.gatherDecomposers(enabled))
+            finally:
+                _enabledDecomposerLists.clear()
+
+    unittest.main()
 
@@ -5,6 +5,7 @@ import urllib
 import lxml.etree as et
 import logging
 import time, datetime, copy, decimal
+import csv, threading, Queue
 
 import splunk
 import splunk.auth as auth
@@ -19,6 +20,11 @@ logger = logging.getLogger('splunk.search')
 # define the block size of events to fetch per request
 ITER_BUFFER_SIZE = 100
 
+# define the size of the blocks read from the export endpoint by SearchJob.stream(),
+# and how many of them may wait to be decoded before reading stops
+STREAM_BLOCK_SIZE = 32768
+STREAM_MAX_BUFFERED_BLOCKS = 16
+
 # define the number of times to retry the event fetching if the returned event
 # count is less than expected count; retry interval is in seconds
 FETCH_RETRY_COUNT = 10
@@ -31,6 +37,21 @@ STATUS_FETCH_MIN_INTERVAL = .05
 STATUS_FETCH_MAX_INTERVAL = 1
 STATUS_FETCH_EASING_DURATION = 5
 
+# define the polling schedule used while waiting on running jobs; the first
+# poll comes after JOB_POLL_MIN_INTERVAL and each following one waits
+# JOB_POLL_BACKOFF times longer, up to JOB_POLL_MAX_INTERVAL; times in seconds
+JOB_POLL_MIN_INTERVAL = .05
+JOB_POLL_MAX_INTERVAL = 2
+JOB_POLL_BACKOFF = 1.5
+
+# define the maximum number of jobs whose status is fetched by a single
+# search/jobs listing request
+JOB_POLL_MAX_LISTED_JOBS = 50
+
+# define the default number of jobs that dispatchMany() keeps dispatched and
+# running at the same time
+DISPATCH_MANY_MAX_CONCURRENCY = 4
+
 # define number of tries to obtain the 'dispatchState' job value; needed to
 # support older APIs that do not output this key
 MAX_DISPATCH_STATE_RETRY_COUNT = 2
@@ -179,6 +200,10 @@ JOB_TTL_EXPIRED_VALUES = [
 
 JOBS_ENDPOINT_ENTITY_PATH = 'search/jobs'
 
+# define the job properties requested when polling a running job; the full
+# job entity is only fetched at init time and once the job is done
+JOB_POLL_STATUS_FIELDS = DYNAMIC_JOB_PROPERTIES + ['dispatchState']
+
 
 # /////////////////////////////////////////////////////////////////////////////
 #  SearchJob factory methods
@@ -408,18 +433,343 @@ def waitForJob(searchjob, maxtime=-1):
     All real-time searches will return immediately.
     """
 
-    pause = 0.2
-    lapsed = 0.0
-    while not searchjob.isDone:
-        if searchjob.isRealTimeSearch:
-            break
-        time.sleep(pause)
-        lapsed += pause
-        if maxtime >= 0 and lapsed > maxtime:
-            break
+    JobWaiter().wait(searchjob, maxtime)
     return searchjob.isDone
 
 
+class JobWaiter(object):
+    '''
+    Waits for one or more search jobs to finish.
+
+    Jobs are polled on an exponential backoff schedule, so that short
+    interactive jobs are noticed as soon as they finish while long running
+    jobs are polled at most every max_interval seconds.  Each poll only
+    requests the job status properties, and the status of several jobs
+    sharing a host and session is fetched with a single search/jobs listing
+    request.
+
+    Usage:
+
+        jobs = [dispatch(s, sessionKey=key) for s in searches]
+        waiter = JobWaiter()
+        if waiter.wait(jobs, 60):
+            print 'all jobs done in %(elapsed)ss with %(requests)s requests' % waiter.stats()
+    '''
+
+    def __init__(self, min_interval=JOB_POLL_MIN_INTERVAL, max_interval=JOB_POLL_MAX_INTERVAL, backoff=JOB_POLL_BACKOFF):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.clear()
+
+
+    def clear(self):
+        '''
+        Resets the timing metrics
+        '''
+
+        self.polls = 0
+        self.requests = 0
+        self.elapsed = 0.0
+        self.slept = 0.0
+        self.doneTimes = {}
+
+
+    def stats(self):
+        '''
+        Returns the timing metrics of the waits made so far:
+
+            polls: number of polling rounds
+            requests: number of status requests sent to splunkd
+            elapsed: total seconds spent in wait()
+            slept: seconds of elapsed spent sleeping between polls
+            doneTimes: dict of job id -> seconds from the start of its wait()
+                until the job was seen done
+        '''
+
+        return {
+            'polls': self.polls,
+            'requests': self.requests,
+            'elapsed': self.elapsed,
+            'slept': self.slept,
+            'doneTimes': dict(self.doneTimes)
+        }
+
+
+    def wait(self, jobs, maxtime=-1):
+        '''
+        Waits up to maxtime seconds for every job in jobs to finish.  If
+        maxtime is negative (default), waits forever.  jobs may be a single
+        SearchJob or a list of them.  Real-time searches never finish and
+        are not waited on.
+
+        Returns True if all the waited on jobs are done.
+        '''
+
+        if isinstance(jobs, SearchJob):
+            jobs = [jobs]
+
+        startTime = time.time()
+        intervals = backoffIntervals(self.min_interval, self.max_interval, self.backoff)
+        pending = list(jobs)
+
+        try:
+            while True:
+                # isRealTimeSearch is only final once the job has been parsed,
+                # so it is checked again after each poll
+                pending = [job for job in pending if not self._isFinished(job, startTime) \
+                    and not getattr(job, 'isRealTimeSearch', False)]
+                if not pending:
+                    return True
+
+                pause = intervals.next()
+                if maxtime >= 0:
+                    remaining = maxtime - (time.time() - startTime)
+                    if remaining <= 0:
+                        return False
+                    pause = min(pause, remaining)
+
+                time.sleep(pause)
+                self.slept += pause
+                self.poll(pending)
+
+        finally:
+            self.elapsed += time.time() - startTime
+
+
+    def poll(self, jobs):
+        '''
+        Refreshes the status properties of jobs that are not done yet
+        '''
+
+        self.polls += 1
+
+        # jobs whose static properties are not final yet are fetched whole,
+        # one by one; the others are listed together by host and session
+        groups = {}
+        for job in jobs:
+            if job._cachedProps['isDone']:
+                continue
+            if not job._hasStaticProps:
+                self._pollOne(job)
+            else:
+                groups.setdefault((job.hostPath, job.sessionKey), []).append(job)
+
+        for (hostPath, sessionKey), group in groups.items():
+            if len(group) == 1:
+                self._pollOne(group[0])
+                continue
+
+            # long sid filters make for long URLs; list the jobs in chunks
+            for i in range(0, len(group), JOB_POLL_MAX_LISTED_JOBS):
+                self._pollListed(hostPath, sessionKey, group[i:i + JOB_POLL_MAX_LISTED_JOBS])
+
+
+    def _pollOne(self, job):
+
+        partial = job._hasStaticProps
+        self.requests += 1
+        job._getStatus()
+
+        # partially polled jobs seen done have just fetched their full properties
+        if partial and job._cachedProps['isDone']:
+            self.requests += 1
+
+
+    def _pollListed(self, hostPath, sessionKey, group):
+
+        uri = entity.buildEndpoint(JOBS_ENDPOINT_ENTITY_PATH)
+        if hostPath:
+            uri = hostPath + uri
+
+        # only list the polled jobs, not every job visible to the user
+        args = {
+            'count': 0,
+            'f': JOB_POLL_STATUS_FIELDS + ['sid'],
+            'search': ' OR '.join(['sid="%s"' % job.id for job in group])
+        }
+        self.requests += 1
+        serverResponse, serverContent = rest.simpleRequest(uri, getargs=args, sessionKey=sessionKey, raiseAllErrors=True)
+
+        entries = {}
+        root = et.fromstring(serverContent)
+        for node in root.findall('{%(atom)s}entry' % NS_MAP):
+            sid = node.findtext('{%(atom)s}content/{%(splunk)s}dict/{%(splunk)s}key[@name="sid"]' % NS_MAP)
+            if not sid:
+                sid = urllib.unquote(node.findtext('{%(atom)s}id' % NS_MAP, '').rstrip('/').split('/')[-1])
+            entries[sid] = node
+
+        for job in group:
+            if job.id in entries:
+                job._updateStatus(entries[job.id])
+
+                # jobs seen done have just fetched their full properties
+                if job._cachedProps['isDone']:
+                    self.requests += 1
+
+            # the job is not listed yet (or anymore); ask for it directly
+            # so that missing jobs raise as they would with _getStatus()
+            else:
+                logger.debug('JobWaiter.poll - job=%s not found in jobs listing' % job.id)
+                self._pollOne(job)
+
+
+    def _isFinished(self, job, startTime):
+
+        if job._cachedProps['isDone'] or job._cachedProps.get('isFailed') or job._cachedProps.get('isZombie'):
+            self.doneTimes.setdefault(job.id, time.time() - startTime)
+            return True
+        return False
+
+
+def dispatchMany(searches, max_concurrency=DISPATCH_MANY_MAX_CONCURRENCY, trace=None, waiter=None, **kwargs):
+    '''
+    Runs several searches and yields (search, results) as each job
+    completes, in completion order.  Not compatible with real-time search.
+
+    searches: list of search strings, or of (search string, dict) pairs
+        where the dict holds dispatch() arguments for that search only; the
+        items are yielded back as given
+
+    max_concurrency: maximum number of jobs being dispatched or running at
+        the same time; the next search is dispatched as soon as a job
+        completes.  Jobs are dispatched from background threads, while
+        their status is polled from the calling thread with a single
+        JobWaiter, passed as waiter or created with the default schedule.
+
+    trace: optional list that receives one dict per completed job, with
+        its search, sid and latencies in seconds: queued (waiting for a
+        free slot), dispatch (the dispatch() call), run (from dispatched
+        until seen done), fetch (reading the results) and total
+
+    kwargs: dispatch() arguments for every search, i.e. sessionKey,
+        hostPath, earliestTime...
+
+    results is the list of all results of the job, as searchAll() returns
+    it, and the job is cancelled once they are read.  If a search fails,
+    the jobs still running are cancelled and the error is raised.
+    '''
+
+    if max_concurrency < 1:
+        raise ValueError, 'max_concurrency must be at least 1'
+
+    if waiter is None:
+        waiter = JobWaiter()
+
+    # the dispatching threads do not see the current request's session
+    if not kwargs.get('sessionKey'):
+        kwargs['sessionKey'] = splunk.getSessionKey()
+
+    startTime = time.time()
+    intervals = backoffIntervals(waiter.min_interval, waiter.max_interval, waiter.backoff)
+    pending = list(searches)
+    dispatched = Queue.Queue()
+    stopping = threading.Event()
+    dispatching = 0
+    running = []
+    tracked = {}
+
+    try:
+        while pending or dispatching or running:
+
+            while pending and dispatching + len(running) < max_concurrency:
+                item = pending.pop(0)
+                if isinstance(item, basestring):
+                    search, args = item, kwargs
+                else:
+                    search, args = item
+                    args = dict(kwargs, **args)
+
+                worker = threading.Thread(target=_dispatchOne, args=(item, search, args, startTime, dispatched, stopping))
+                worker.setDaemon(True)
+                worker.start()
+                dispatching += 1
+
+            # wait for a dispatch to return; poll the running jobs when
+            # none does before the next polling interval
+            try:
+                if running:
+                    item, job, info, error = dispatched.get(True, intervals.next())
+                else:
+                    item, job, info, error = dispatched.get(True, waiter.max_interval)
+            except Queue.Empty:
+                if running:
+                    waiter.poll(running)
+            else:
+                dispatching -= 1
+                if error:
+                    raise error[0], error[1], error[2]
+                tracked[job.id] = (item, info)
+                running.append(job)
+                intervals = backoffIntervals(waiter.min_interval, waiter.max_interval, waiter.backoff)
+
+            for job in [job for job in running if waiter._isFinished(job, startTime)]:
+                item, info = tracked.pop(job.id)
+                info['run'] = time.time() - info['dispatched']
+
+                # the job stays in running until its results are read, so
+                # that it is cancelled by the finally below if that fails
+                fetchStartTime = time.time()
+                results = list(job)
+                running.remove(job)
+                job.cancel()
+                info['fetch'] = time.time() - fetchStartTime
+                info['total'] = time.time() - startTime
+                del info['dispatched']
+
+                logger.debug('dispatchMany - sid=%(sid)s queued=%(queued).3f dispatch=%(dispatch).3f run=%(run).3f fetch=%(fetch).3f total=%(total).3f' % info)
+                if trace is not None:
+                    trace.append(info)
+                yield item, results
+
+    finally:
+        # jobs still being dispatched are cancelled by their thread
+        stopping.set()
+        while True:
+            try:
+                job = dispatched.get_nowait()[1]
+            except Queue.Empty:
+                break
+            if job:
+                running.append(job)
+        for job in running:
+            try:
+                job.cancel()
+            except Exception, e:
+                logger.warn('dispatchMany - unable to cancel job=%s: %s' % (job.id, e))
+        waiter.elapsed += time.time() - startTime
+
+
+def _dispatchOne(item, search, args, startTime, dispatched, stopping):
+    '''
+    Dispatches one search of dispatchMany() and puts (item, job, info, error)
+    on the dispatched queue
+    '''
+
+    dispatchStartTime = time.time()
+    try:
+        job = dispatch(search, **args)
+    except Exception:
+        dispatched.put((item, None, None, sys.exc_info()))
+        return
+
+    if stopping.isSet():
+        try:
+            job.cancel()
+        except Exception, e:
+            logger.warn('dispatchMany - unable to cancel job=%s: %s' % (job.id, e))
+        return
+
+    info = {
+        'search': search,
+        'sid': job.id,
+        'queued': dispatchStartTime - startTime,
+        'dispatch': time.time() - dispatchStartTime,
+        'dispatched': time.time()
+    }
+    dispatched.put((item, job, info, None))
+
+
 # /////////////////////////////////////////////////////////////////////////////
 #  Search objects
 # /////////////////////////////////////////////////////////////////////////////
@@ -490,6 +840,11 @@ class SearchJob(object):
         self._propertyPrimitives = None
         self.resourceLinks = []
         self.waitForRunning = waitForRunning
+
+        # set once the full job entity has been read at a dispatch state
+        # where its static properties are final; status polls only request
+        # the dynamic properties from then on
+        self._hasStaticProps = False
         
         # scaffold job properties that we expect to be there from the start
         # of the job; sometimes the job endpoint is lazy
@@ -796,9 +1151,16 @@ class SearchJob(object):
         if self.message_level is not None:
             args['message_level'] = self.message_level
 
+        # once the static job properties are final, only poll the ones that
+        # change; jobs loaded while queued or parsing need a full fetch
+        partial = not isInitial and not force and self._hasStaticProps
+        if partial:
+            args['f'] = JOB_POLL_STATUS_FIELDS
+
         # a HTTP 204 means that splunkd isn't quite ready yet; retry for a bit
         loopStartTime = time.time()
         stateRetryCount = 0
+        dispatchEnum = None
         firstTime = True
         while firstTime or ((time.time() - loopStartTime) < self._status_fetch_timeout):
             serverResponse, serverContent = rest.simpleRequest(uri, getargs=args, sessionKey=self.sessionKey, raiseAllErrors=True)
@@ -864,7 +1226,48 @@ class SearchJob(object):
 
 
 
-        # iterate over every key returned in the job property data
+        if partial:
+            self._updateStatus(root)
+            return
+
+        self._loadStatusKeys(root)
+        self._hasStaticProps = dispatchEnum is not None and dispatchEnum >= PASSABLE_DISPATCH_ENUM
+
+        # get the remaining static values from the standard Atom feed elements
+        # at init time
+        if isInitial:
+
+            # get atom feed props
+            self.createTime = root.findtext('{%(atom)s}published' % NS_MAP)
+            self.modifiedTime = root.findtext('{%(atom)s}updated' % NS_MAP)
+            self._cachedProps['search'] = root.findtext('{%(atom)s}title' % NS_MAP)
+
+            # import all the <link> URIs; verify that server is sending
+            # expected rels over
+            for node in root.findall('{%(atom)s}link' % NS_MAP):
+                if node.get('href'):
+                    self.links[node.get('rel')] = node.get('href')
+            for name in (self.ASSET_LINKS + self.META_LINKS):
+                if name not in self.links:
+                    logger.warn('SearchJob._getStatus - did not find expected "%s" <link> tag' % name)
+
+
+        # create primitive container for property serialization, and pulling in
+        # from the Atom wrapper
+        self._propertyPrimitives = rest.format.nodeToPrimitive(
+            root.find('{%(atom)s}content/{%(splunk)s}dict' % NS_MAP)
+        )
+        self._propertyPrimitives['createTime'] = self.createTime
+        self._propertyPrimitives['modifiedTime'] = self.modifiedTime
+        self._propertyPrimitives['search'] = self._cachedProps['search']
+
+
+
+    def _loadStatusKeys(self, root):
+        '''
+        Sets the job properties found in the <s:dict> of the Atom entry root
+        '''
+
         keyNodes = root.findall('{%(atom)s}content/{%(splunk)s}dict/{%(splunk)s}key' % NS_MAP)
         for node in keyNodes:
 
@@ -953,33 +1356,23 @@ class SearchJob(object):
                         self.isStreaming = value
 
 
-        # get the remaining static values from the standard Atom feed elements
-        # at init time
-        if isInitial:
 
-            # get atom feed props
-            self.createTime = root.findtext('{%(atom)s}published' % NS_MAP)
-            self.modifiedTime = root.findtext('{%(atom)s}updated' % NS_MAP)
-            self._cachedProps['search'] = root.findtext('{%(atom)s}title' % NS_MAP)
+    def _updateStatus(self, root):
+        '''
+        Updates the job properties from an Atom entry that only holds some of
+        them, as returned when polling with a field list.  When the job turns
+        out to be done, the full job entity is fetched once more so that the
+        final values of the other properties are available too.
+        '''
 
-            # import all the <link> URIs; verify that server is sending
-            # expected rels over
-            for node in root.findall('{%(atom)s}link' % NS_MAP):
-                if node.get('href'):
-                    self.links[node.get('rel')] = node.get('href')
-            for name in (self.ASSET_LINKS + self.META_LINKS):
-                if name not in self.links:
-                    logger.warn('SearchJob._getStatus - did not find expected "%s" <link> tag' % name)
+        self._loadStatusKeys(root)
 
+        contentNode = root.find('{%(atom)s}content/{%(splunk)s}dict' % NS_MAP)
+        if self._propertyPrimitives is not None and contentNode is not None:
+            self._propertyPrimitives.update(rest.format.nodeToPrimitive(contentNode))
 
-        # create primitive container for property serialization, and pulling in
-        # from the Atom wrapper
-        self._propertyPrimitives = rest.format.nodeToPrimitive(
-            root.find('{%(atom)s}content/{%(splunk)s}dict' % NS_MAP)
-        )
-        self._propertyPrimitives['createTime'] = self.createTime
-        self._propertyPrimitives['modifiedTime'] = self.modifiedTime
-        self._propertyPrimitives['search'] = self._cachedProps['search']
+        if self._cachedProps['isDone']:
+            self._getStatus(force=True)
 
 
 
@@ -1143,6 +1536,74 @@ class SearchJob(object):
 
 
 
+    def stream(self, mode='results', output_mode='csv', sink=None, stats=None, max_buffered_blocks=STREAM_MAX_BUFFERED_BLOCKS, **kwargs):
+        '''
+        Streams all the events or results of the job from the splunkd export
+        endpoint in one request, instead of paging through them by offset.
+        The response is read by a background thread, at most
+        max_buffered_blocks blocks ahead of the rows being consumed, so a
+        slow consumer makes splunkd slow down rather than filling memory.
+
+        output_mode is 'csv' or 'json'.  Rows are decoded as they are
+        consumed; csv rows are ordered dicts of field name to value, json
+        rows are the dicts of the 'result' objects splunkd outputs.
+
+        If sink is None, returns a generator of the rows.  Otherwise calls
+        sink(row) for each row and returns the stats dict, which is also
+        filled in when passed: rows, bytes, blocks, elapsed seconds,
+        read_wait (seconds spent waiting for data), sink_time (seconds
+        spent in sink), max_buffered (most blocks waiting at once),
+        rows_per_second and bytes_per_second.
+
+        The current fetch options apply, as with getFeed(); kwargs add to them.
+        '''
+
+        mode = mode.lower()
+        if output_mode not in ('csv', 'json'):
+            raise ValueError, 'output_mode must be csv or json, not %s' % output_mode
+        if mode not in self.links:
+            raise AssertionError, 'Splunkd did not provide link to job "%s" endpoint for sid=%s' % (mode, self.id)
+
+        uri = self.links[mode].rstrip('/') + '/export'
+        if self.hostPath:
+            uri = self.hostPath + uri
+
+        getargs = self.getFetchOptions()
+        getargs.update(self._normalizeFetchOptions(kwargs))
+        getargs['output_mode'] = output_mode
+        for k in getargs:
+            if isinstance(getargs[k], list):
+                getargs[k] = util.fieldListToString(getargs[k])
+
+        response = rest.streamingRequest(uri, sessionKey=self.sessionKey, getargs=getargs)
+        if response.response.status not in [200, 204]:
+            serverContent = response.response.read()
+            response.conn.close()
+            logger.error('stream - error while getting data; status=%s content=%s' % (response.response.status, serverContent))
+            raise Exception, 'Server reported HTTP status=%s while streaming mode=%s\n%s' % (response.response.status, mode, serverContent)
+
+        if stats is None:
+            stats = {}
+        stats.update({'rows': 0, 'bytes': 0, 'blocks': 0, 'elapsed': 0.0, 'read_wait': 0.0, 'sink_time': 0.0,
+                      'max_buffered': 0, 'rows_per_second': 0.0, 'bytes_per_second': 0.0})
+
+        blocks = _bufferedBlocks(response, max_buffered_blocks, stats)
+        if output_mode == 'csv':
+            rows = _csvRows(blocks)
+        else:
+            rows = _jsonRows(blocks)
+        rows = _countRows(rows, stats)
+
+        if sink is None:
+            return rows
+
+        for row in rows:
+            t = time.time()
+            sink(row)
+            stats['sink_time'] += time.time() - t
+        return stats
+
+
     def getFeed(self, mode='events', **kwargs):
         '''
         Retrieves the raw data feed for a search job.  Specify the 'mode' option
@@ -1258,6 +1719,130 @@ class SearchJob(object):
 # /////////////////////////////////////////////////////////////////////////////
 
 
+def _bufferedBlocks(streamingResponse, maxBlocks, stats):
+    '''
+    Generates the blocks of a rest.StreamingResponse, read by a separate
+    thread through a queue of at most maxBlocks blocks
+    '''
+
+    blocks = Queue.Queue(maxBlocks)
+    stop = threading.Event()
+
+    def put(item):
+        # give up once the consumer has gone away
+        while not stop.isSet():
+            try:
+                blocks.put(item, timeout=.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            for block in streamingResponse.readall(STREAM_BLOCK_SIZE):
+                if not put(('block', block)):
+                    return
+            put(('end', None))
+        except Exception, e:
+            put(('error', e))
+
+    thread = threading.Thread(target=reader)
+    thread.setDaemon(True)
+    thread.start()
+
+    try:
+        while True:
+            # count the waiting blocks before taking one, so that the reader
+            # refilling the queue meanwhile cannot push the count past maxBlocks
+            waiting = blocks.qsize()
+            t = time.time()
+            kind, item = blocks.get()
+            stats['read_wait'] += time.time() - t
+            if kind == 'end':
+                break
+            if kind == 'error':
+                raise item
+            stats['bytes'] += len(item)
+            stats['blocks'] += 1
+            stats['max_buffered'] = max(stats['max_buffered'], waiting)
+            yield item
+    finally:
+        stop.set()
+        streamingResponse.conn.close()
+
+
+def _lines(blocks):
+    '''
+    Generates the lines, with their line endings, of a sequence of blocks
+    '''
+
+    # the pieces of a line are only joined once its end is read, so a long
+    # line is not copied again for every block
+    pending = []
+    for block in blocks:
+        if '\n' not in block:
+            pending.append(block)
+            continue
+        lines = block.split('\n')
+        if pending:
+            pending.append(lines[0])
+            lines[0] = ''.join(pending)
+        pending = [lines.pop()]
+        for line in lines:
+            yield line + '\n'
+    line = ''.join(pending)
+    if line:
+        yield line
+
+
+def _csvRows(blocks):
+    '''
+    Generates an ordered dict per row of the CSV document split in blocks; the
+    first row holds the field names
+    '''
+
+    reader = csv.reader(_lines(blocks))
+    try:
+        fields = reader.next()
+    except StopIteration:
+        return
+    for values in reader:
+        yield util.FastOrderedDict.fromLists(fields, values)
+
+
+def _jsonRows(blocks):
+    '''
+    Generates the 'result' object of each line of the JSON export document
+    split in blocks
+    '''
+
+    for line in _lines(blocks):
+        line = line.strip()
+        if not line:
+            continue
+        row = json.loads(line)
+        if 'result' in row:
+            yield row['result']
+
+
+def _countRows(rows, stats):
+    '''
+    Passes rows through, keeping the row count and the throughput in stats
+    '''
+
+    start = time.time()
+    try:
+        for row in rows:
+            stats['rows'] += 1
+            yield row
+    finally:
+        stats['elapsed'] = time.time() - start
+        if stats['elapsed'] > 0:
+            stats['rows_per_second'] = stats['rows'] / stats['elapsed']
+            stats['bytes_per_second'] = stats['bytes'] / stats['elapsed']
+
+
 class ResultSet(object):
 
 
@@ -1444,7 +2029,7 @@ class ResultSet(object):
         # get the actual results
         results = []
         for result in root.findall('result'):
-            row = util.OrderedDict()
+            row = util.FastOrderedDict()
 
             # get the offset
             offset = result.get('offset', 'null')
@@ -1510,8 +2095,9 @@ class ResultSet(object):
         else:
             jobCountProperty = 'resultCount'
 
-        # if data has not all been retrieved, then keep polling for data
-        loopStartTime = time.time()
+        # if data has not all been retrieved, then keep polling for data; the
+        # polling interval backs off while no new data shows up
+        pollIntervals = backoffIntervals()
         while not allDataFetched:
 
             self.job._getStatus()
@@ -1522,10 +2108,12 @@ class ResultSet(object):
                 if (self.mode == 'events' and not self.job.eventIsStreaming and not self.job.isRealTimeSearch) \
                 or (self.mode == 'results' and not self.job.resultIsStreaming):
                     logger.debug('ResultSet.__iter__ -- waiting on completion of non-streaming results...')
-                    time.sleep(1)
+                    time.sleep(pollIntervals.next())
                     continue
 
-            # seed the count once here
+            # seed the count once here; new data restarts the polling backoff
+            if self.job._cachedProps[jobCountProperty] > localCount:
+                pollIntervals = backoffIntervals()
             localCount = self.job._cachedProps[jobCountProperty]
 
             # if request is within available data bounds
@@ -1545,8 +2133,11 @@ class ResultSet(object):
 
                     # loop is for protecting against incomplete data; see SPL-12146;
                     # loop is not applicable when fetching results, so flush the buffer
-                    # if it's non-empty
-                    for i in range(FETCH_RETRY_COUNT):
+                    # if it's non-empty.  Retries back off up to FETCH_RETRY_INTERVAL
+                    # within the FETCH_RETRY_COUNT * FETCH_RETRY_INTERVAL budget
+                    retryIntervals = backoffIntervals(JOB_POLL_MIN_INTERVAL, FETCH_RETRY_INTERVAL)
+                    retryDeadline = time.time() + FETCH_RETRY_COUNT * FETCH_RETRY_INTERVAL
+                    while True:
                         __iterbuffer = self[__iteridx:stop]
                         if len(__iterbuffer) >= (stop - __iteridx):
                             break
@@ -1556,11 +2147,12 @@ class ResultSet(object):
                                     yield item
                             raise StopIteration
 
+                        if time.time() >= retryDeadline:
+                            raise Exception, 'ResultSet.__iter__ -- timed out while waiting on data; expected %s events, only got %s; count=%s' % \
+                                ((stop - __iteridx), len(__iterbuffer), localCount)
+
                         logger.debug('ResultSet.__iter__ -- waiting on complete events...')
-                        time.sleep(FETCH_RETRY_INTERVAL)
-                    else:
-                        raise Exception, 'ResultSet.__iter__ -- timed out while waiting on data; expected %s events, only got %s; count=%s' % \
-                            ((stop - __iteridx), len(__iterbuffer), localCount)
+                        time.sleep(retryIntervals.next())
 
                     __iterbufferBounds = (__iteridx, stop)
 
@@ -1570,8 +2162,7 @@ class ResultSet(object):
                 logger.debug('ResultSet.__iter__ -- DONE')
                 allDataFetched = True
             else:
-                elapsedTime = time.time() - loopStartTime
-                nextRetry = getRetryInterval(elapsedTime, .1, .5, 2)
+                nextRetry = pollIntervals.next()
                 logger.debug('ResultSet.__iter__ -- sleeping for %s' % nextRetry)
                 time.sleep(nextRetry)
 
@@ -1973,7 +2564,7 @@ class ResultsLite:
         results = []
 
         for result in root.findall('result'):
-            row = splunk.util.OrderedDict()
+            row = splunk.util.FastOrderedDict()
 
             # get the offset
             offset = result.get('offset', 'null')
@@ -2105,6 +2696,20 @@ def getRetryInterval(elapsed_time, min_interval, max_interval, clamp_time):
     return min(max_interval * pow(elapsed_time/float(clamp_time), 3) + min_interval, max_interval)
 
 
+def backoffIntervals(min_interval=JOB_POLL_MIN_INTERVAL, max_interval=JOB_POLL_MAX_INTERVAL, backoff=JOB_POLL_BACKOFF):
+    '''
+    Generates an endless series of wait times (sec) that starts at
+    min_interval and grows by a factor of backoff at each step, up to
+    max_interval.
+    '''
+
+    interval = float(min_interval)
+    while True:
+        yield min(interval, max_interval)
+        if interval < max_interval:
+            interval *= backoff
+
+
 def normalizeJobPropertyValue(key, value):
     if key in BOOLEAN_JOB_PROPERTIES:
         return util.normalizeBoolean(value)
@@ -3602,6 +4207,235 @@ if __name__ == '__main__':
             # TODO: check that the iterator is blocked until job is done
 
 
+    class StreamDecodingTests(unittest.TestCase):
+        '''Tests the decoding of export output used by SearchJob.stream()'''
+
+        def split(self, doc, size=7):
+            return [doc[i:i + size] for i in range(0, len(doc), size)]
+
+        def testCsvRows(self):
+            doc = 'host,_raw\r\na,"first, line\nsecond ""line"""\r\nb,plain\r\n'
+            rows = list(_csvRows(self.split(doc)))
+            self.assertEquals([r.keys() for r in rows], [['host', '_raw'], ['host', '_raw']])
+            self.assertEquals(rows[0]['_raw'], 'first, line\nsecond "line"')
+            self.assertEquals(rows[1]['host'], 'b')
+            self.assertEquals(list(_csvRows([])), [])
+
+        def testBufferedBlocksBound(self):
+            class Response(object):
+                class conn(object):
+                    @staticmethod
+                    def close(): pass
+                def readall(self, size):
+                    return ('x' * size for i in range(20))
+            stats = {'bytes': 0, 'blocks': 0, 'read_wait': 0.0, 'max_buffered': 0}
+            for block in _bufferedBlocks(Response(), 4, stats):
+                # a slow consumer lets the reader fill the queue
+                time.sleep(.005)
+            self.assertEquals(stats['blocks'], 20)
+            self.assertEquals(stats['max_buffered'], 4)
+
+        def testLines(self):
+            doc = 'a\nbc\n\ndef\ng'
+            for size in (1, 2, 3, len(doc)):
+                self.assertEquals(list(_lines(self.split(doc, size))), ['a\n', 'bc\n', '\n', 'def\n', 'g'])
+            self.assertEquals(list(_lines(['a\n', '', 'b', ''])), ['a\n', 'b'])
+            self.assertEquals(list(_lines([])), [])
+
+        def testJsonRows(self):
+            doc = '{"preview":false,"offset":0,"result":{"host":"a"}}\n\n{"preview":false,"offset":1,"result":{"host":"b"}}\n{"lastrow":true}'
+            self.assertEquals(list(_jsonRows(self.split(doc))), [{'host': 'a'}, {'host': 'b'}])
+
+
+    class CannedJobsTestCase(unittest.TestCase):
+        '''Serves canned job status responses in place of splunkd'''
+
+        ENTRY = '''<entry xmlns="http://www.w3.org/2005/Atom" xmlns:s="http://dev.splunk.com/ns/rest">
+            <title>search *</title><id>https://localhost:8089/services/search/jobs/%(sid)s</id>
+            <link href="/services/search/jobs/%(sid)s/control" rel="control"/>
+            <content type="text/xml"><s:dict>
+                <s:key name="sid">%(sid)s</s:key>
+                <s:key name="dispatchState">%(state)s</s:key>
+                <s:key name="isDone">%(done)s</s:key>
+                <s:key name="eventCount">%(count)s</s:key>
+                %(extra)s
+            </s:dict></content></entry>'''
+
+        class Response(object):
+            status = 200
+
+        def setUp(self):
+            self.requests = []
+            self.polls = {}
+            self.queued = {}
+            self._simpleRequest = rest.simpleRequest
+            rest.simpleRequest = self.simpleRequest
+
+        def tearDown(self):
+            rest.simpleRequest = self._simpleRequest
+
+        def entry(self, sid, getargs):
+            # each job is done at its third status request; jobs listed in
+            # self.queued stay queued for that many requests first
+            polls = self.polls[sid] = self.polls.get(sid, 0) + 1
+            queued = polls <= self.queued.get(sid, 0)
+            done = polls - self.queued.get(sid, 0) >= 3
+            state = queued and 'QUEUED' or done and 'DONE' or 'RUNNING'
+            extra = ''
+            if 'f' not in getargs:
+                extra = '<s:key name="eventIsStreaming">%d</s:key><s:key name="isRealTimeSearch">0</s:key>' % (not queued)
+            return self.ENTRY % {'sid': sid, 'state': state, 'done': int(done), 'count': polls, 'extra': extra}
+
+        def simpleRequest(self, uri, sessionKey=None, getargs=None, **kwargs):
+            self.requests.append((uri, getargs))
+            sid = uri.rstrip('/').split('/')[-1]
+            if sid == 'jobs':
+                content = '<feed xmlns="http://www.w3.org/2005/Atom">%s</feed>' % ''.join(self.entry(s, getargs) for s in sorted(self.polls))
+            else:
+                content = self.entry(sid, getargs)
+            return self.Response(), content
+
+
+    class JobWaiterTests(CannedJobsTestCase):
+        '''Tests the JobWaiter polling against canned job status responses'''
+
+        def testBackoffIntervals(self):
+            intervals = backoffIntervals(.1, 1, 2)
+            self.assertEquals([intervals.next() for i in range(6)], [.1, .2, .4, .8, 1, 1])
+
+        def testPartialStatus(self):
+            job = SearchJob('a', 'https://localhost:8089', sessionKey='k')
+            self.assert_('f' not in self.requests[0][1])
+            self.assertEquals(job.eventCount, 2)
+            self.assertEquals(self.requests[1][1]['f'], JOB_POLL_STATUS_FIELDS)
+
+            # the partial poll that sees the job done triggers a full fetch
+            self.assertEquals(job.isDone, True)
+            self.assert_('f' not in self.requests[-1][1])
+            self.assertEquals(job.toJsonable()['eventCount'], 4)
+
+        def testWaitMultiplexed(self):
+            jobs = [SearchJob(sid, 'https://localhost:8089', sessionKey='k') for sid in ('a', 'b', 'c')]
+            del self.requests[:]
+
+            waiter = JobWaiter(min_interval=.001, max_interval=.002)
+            self.assert_(waiter.wait(jobs))
+            self.assert_(all(job.isDone for job in jobs))
+
+            # two listing polls, then one full fetch per finished job
+            listings = [args for uri, args in self.requests if uri.rstrip('/').endswith('search/jobs')]
+            self.assertEquals(len(listings), 2)
+            self.assert_('sid' in listings[0]['f'])
+            self.assertEquals(listings[0]['search'], 'sid="a" OR sid="b" OR sid="c"')
+            stats = waiter.stats()
+            self.assertEquals(stats['requests'], len(self.requests))
+            self.assertEquals(stats['polls'], 2)
+            self.assertEquals(sorted(stats['doneTimes']), ['a', 'b', 'c'])
+
+        def testQueuedStatus(self):
+            # jobs first loaded while queued are fetched whole until running
+            job = SearchJob('a', 'https://localhost:8089', sessionKey='k', waitForRunning=False)
+            self.queued['b'] = 1
+            queuedJob = SearchJob('b', 'https://localhost:8089', sessionKey='k', waitForRunning=False)
+            self.assertEquals(queuedJob.eventIsStreaming, False)
+            del self.requests[:]
+
+            waiter = JobWaiter(min_interval=.001, max_interval=.002)
+            waiter.poll([job, queuedJob])
+            self.assertEquals(sorted(uri.split('/')[-1] for uri, args in self.requests), ['a', 'b'])
+            self.assertEquals([uri.split('/')[-1] for uri, args in self.requests if 'f' in args], ['a'])
+            self.assertEquals(queuedJob.eventIsStreaming, True)
+            self.assertEquals(waiter.stats()['requests'], 2)
+
+            # both are now polled with one listing, which sees a done and
+            # triggers its final full fetch
+            del self.requests[:]
+            waiter.poll([job, queuedJob])
+            self.assertEquals(len(self.requests), 2)
+            self.assertEquals(job._cachedProps['isDone'], True)
+            self.assert_(waiter.wait([job, queuedJob]))
+            self.assertEquals(waiter.stats()['requests'], len(self.requests) + 2)
+
+        def testWaitTimeout(self):
+            job = SearchJob('a', 'https://localhost:8089', sessionKey='k')
+            waiter = JobWaiter(min_interval=.01, max_interval=.01)
+            self.assertEquals(waiter.wait(job, 0), False)
+            self.assertEquals(waiter.stats()['polls'], 0)
+
+
+    class DispatchManyTests(CannedJobsTestCase):
+        '''Tests dispatchMany() against canned dispatch and job status responses'''
+
+        def setUp(self):
+            super(DispatchManyTests, self).setUp()
+            self.cancelled = []
+            self.sessionKeys = []
+            self._iter = SearchJob.__iter__
+            self._cancel = SearchJob.cancel
+            SearchJob.__iter__ = lambda job: iter([job.id])
+            SearchJob.cancel = lambda job: self.cancelled.append(job.id)
+
+        def tearDown(self):
+            super(DispatchManyTests, self).tearDown()
+            SearchJob.__iter__ = self._iter
+            SearchJob.cancel = self._cancel
+
+        def simpleRequest(self, uri, sessionKey=None, getargs=None, postargs=None, **kwargs):
+            if postargs:
+                if postargs['search'] == 'search fail':
+                    raise splunk.SearchException, 'Unknown search command'
+                self.requests.append((uri, postargs))
+                self.sessionKeys.append(sessionKey)
+                return self.Response(), '<?xml version="1.0"?><response><sid>%s</sid></response>' % postargs['search'].split()[-1]
+            return super(DispatchManyTests, self).simpleRequest(uri, sessionKey, getargs)
+
+        def testDispatchMany(self):
+            waiter = JobWaiter(min_interval=.001, max_interval=.002)
+            trace = []
+            searches = ['search a', ('search b', {'earliestTime': '-1h'}), 'search c']
+            output = list(dispatchMany(searches, 2, trace, waiter, hostPath='https://localhost:8089', sessionKey='k'))
+
+            self.assertEquals(sorted(output), sorted([('search a', ['a']), (searches[1], ['b']), ('search c', ['c'])]))
+            self.assertEquals(sorted(self.cancelled), ['a', 'b', 'c'])
+            dispatchArgs = dict((args['search'], args) for uri, args in self.requests if 'search' in args)
+            self.assertEquals(dispatchArgs['search b']['earliest_time'], '-1h')
+            self.assert_('earliest_time' not in dispatchArgs['search a'])
+            self.assertEquals(sorted(info['sid'] for info in trace), ['a', 'b', 'c'])
+            for key in ('queued', 'dispatch', 'run', 'fetch', 'total'):
+                self.assert_(trace[0][key] >= 0)
+
+            # c waits for a free slot
+            self.assert_([info for info in trace if info['sid'] == 'c'][0]['queued'] > 0)
+
+        def testDispatchManyRequestSession(self):
+            # like splunkweb, only the calling thread sees the session key
+            callingThread = threading.currentThread()
+            getSessionKey = splunk.getSessionKey
+            splunk.getSessionKey = lambda: threading.currentThread() is callingThread and 'k' or None
+            try:
+                waiter = JobWaiter(min_interval=.001, max_interval=.002)
+                output = list(dispatchMany(['search a', 'search b'], waiter=waiter, hostPath='https://localhost:8089'))
+            finally:
+                splunk.getSessionKey = getSessionKey
+            self.assertEquals(sorted(output), [('search a', ['a']), ('search b', ['b'])])
+            self.assertEquals(self.sessionKeys, ['k', 'k'])
+
+        def testDispatchManyFetchError(self):
+            def failingIter(job):
+                raise splunk.SearchException, 'Job failed'
+            SearchJob.__iter__ = failingIter
+            waiter = JobWaiter(min_interval=.001, max_interval=.002)
+            output = dispatchMany(['search a'], waiter=waiter, hostPath='https://localhost:8089', sessionKey='k')
+            self.assertRaises(splunk.SearchException, output.next)
+            self.assertEquals(self.cancelled, ['a'])
+
+        def testDispatchManyError(self):
+            waiter = JobWaiter(min_interval=.001, max_interval=.002)
+            output = dispatchMany(['search a', 'search fail'], 1, waiter=waiter, hostPath='https://localhost:8089', sessionKey='k')
+            self.assertEquals(output.next(), ('search a', ['a']))
+            self.assertRaises(splunk.SearchException, output.next)
+            self.assertEquals(self.cancelled, ['a'])
+
 
     # exec all tests
     loader = unittest.TestLoader()
@@ -3614,5 +4448,8 @@ if __name__ == '__main__':
     suites.append(loader.loadTestsFromTestCase(Tags_MultiValWithTag))
     suites.append(loader.loadTestsFromTestCase(SearchMessaging))
     suites.append(loader.loadTestsFromTestCase(SearchJobIterator))
+    suites.append(loader.loadTestsFromTestCase(StreamDecodingTests))
+    suites.append(loader.loadTestsFromTestCase(JobWaiterTests))
+    suites.append(loader.loadTestsFromTestCase(DispatchManyTests))
     unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(suites))
 
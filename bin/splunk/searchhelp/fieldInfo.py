@@ -1,23 +1,20 @@
+import time
+import Queue
 import utils
 import splunk.search as se
-from threading import Thread
+from threading import Thread, Event, Lock
 
-MAX_FIELD_THREADS = 5         # don't get field info, if we're already handling 5 other requests.  it's a nice to have and shouldn't abuse system
+MAX_FIELD_THREADS = 5         # get field info with at most 5 threads.  it's a nice to have and shouldn't abuse system
+MAX_QUEUED_FIELD_SEARCHES = 20 # don't get field info, if 20 other requests are already waiting for a thread
 FIELD_INFO_MAX_RESULTS = 100  # ask for at most 100 search results
 FIELD_INFO_MAX_FIELDS = 15    # display at most 15 interesting fields
 FIELD_INFO_MAX_TIME = 5       # wait up to 5 seconds for a search for field info
 
 g_field_info_cache = utils.AgedCache()  # global storage mapping searches to field info
-g_threads = []
 
 def usefulFields(output, sessionKey, namespace, user, search):
     """the fields ___ can help narrow does these results"""
 
-    tcount = aliveThreadCount()
-    if  tcount > MAX_FIELD_THREADS:
-        #print "punting on getting field info: %s %s" % (tcount, len(g_threads))
-        return
-
     search = getSearch(search)
     key = (search, namespace, user)
     
@@ -26,22 +23,107 @@ def usefulFields(output, sessionKey, namespace, user, search):
     if fields != None:
         if len(fields) > 0:
             output['fields'] = fields
+    elif not safe(search):
+        # remember not to bother with this search
+        g_field_info_cache[key] = ""
     else:
-        # otherwise, calculate the interesting fields in a separate thread,
-        # and we'll present the data next time we are called.
-        # initialize value so multiple threads for same search aren't kicked off        
-        g_field_info_cache[key] = "" 
-        if safe(search):
-            thread = FieldInfoThread(sessionKey, namespace, user, search, key)
-            g_threads.append(thread)
-            thread.start()
-
-def aliveThreadCount():
-    count = 0
-    for t in g_threads:
-        if t.isAlive():
-            count += 1
-    return count
+        # otherwise, calculate the interesting fields on the pool, and we'll present the data
+        # next time we are called.  requests for a search already being calculated share it.
+        g_field_info_pool.submit(sessionKey, namespace, user, search, key)
+
+
+class FieldInfoRequest:
+    """a search submitted to the FieldInfoPool.  wait() returns its fields once a worker has run it."""
+
+    def __init__(self, sessionKey, namespace, user, search, key):
+        self.sessionKey = sessionKey
+        self.namespace  = namespace
+        self.user       = user
+        self.search     = search
+        self.key        = key
+        self.fields     = None
+        self.submitted  = time.time()
+        self.finished   = None
+        self._done      = Event()
+
+    def done(self):
+        return self._done.isSet()
+
+    def wait(self, timeout=None):
+        """return the fields, or None if the search failed or is still running after timeout seconds"""
+        self._done.wait(timeout)
+        return self.fields
+
+
+class FieldInfoPool:
+    """runs field info searches on a fixed number of threads, fed by a bounded queue.
+    a search that is already queued or running is not submitted twice."""
+
+    def __init__(self, threads=MAX_FIELD_THREADS, max_queued=MAX_QUEUED_FIELD_SEARCHES):
+        self.threads = threads
+        self.queue = Queue.Queue(max_queued)
+        self.pending = {}   # key -> FieldInfoRequest, for requests that are queued or running
+        self.lock = Lock()
+        self.workers = []
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def submit(self, sessionKey, namespace, user, search, key):
+        """return the request for key, or None if the queue is full"""
+        with self.lock:
+            request = self.pending.get(key)
+            if request != None:
+                return request
+            request = FieldInfoRequest(sessionKey, namespace, user, search, key)
+            try:
+                self.queue.put_nowait(request)
+            except Queue.Full:
+                self.dropped += 1
+                return None
+            self.pending[key] = request
+            # start the workers on first use
+            while len(self.workers) < self.threads:
+                worker = Thread(target=self._work, name="fieldInfo-%s" % len(self.workers))
+                worker.setDaemon(True)
+                worker.start()
+                self.workers.append(worker)
+        return request
+
+    def _work(self):
+        while True:
+            request = self.queue.get()
+            try:
+                request.fields = getFieldInfo(request.sessionKey, request.namespace, request.user, request.search)
+                # store answer away
+                g_field_info_cache[request.key] = request.fields
+            except:
+                # cache the failure too, so the search isn't retried straight away
+                g_field_info_cache[request.key] = ""
+            request.finished = time.time()
+            latency = request.finished - request.submitted
+            with self.lock:
+                del self.pending[request.key]
+                if request.fields == None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            request._done.set()
+
+    def stats(self):
+        """return the queue depth, number of pending requests, request counts and latencies in seconds"""
+        with self.lock:
+            finished = self.completed + self.failed
+            return {'threads': len(self.workers), 'queued': self.queue.qsize(), 'pending': len(self.pending),
+                    'completed': self.completed, 'failed': self.failed, 'dropped': self.dropped,
+                    'avg_latency': finished and self.total_latency / finished or 0.0,
+                    'max_latency': self.max_latency}
+
+g_field_info_pool = FieldInfoPool()
 
 
 # list of well-known, safe commands, which are public, do not write or
@@ -96,43 +178,25 @@ def ignoredField(fieldname):
     return fieldname == '' or fieldname == None or fieldname.startswith('_') or fieldname.startswith('date_') or fieldname == 'punct' or fieldname == 'timestartpos' or fieldname == 'timeendpos'
 
 
-class FieldInfoThread(Thread):
-    def __init__(self, sessionKey, namespace, user, search, key):
-        Thread.__init__(self)
-        self.sessionKey = sessionKey
-        self.namespace  = namespace
-        self.user       = user
-        self.search     = search
-        self.key        = key
-
-    def run(self):
-        try:
-            results = se.searchAll(self.search, sessionKey=self.sessionKey, namespace=self.namespace, owner=self.user, status_buckets=0, required_field_list='*',
-                                   auto_finalize_ec=100, 
-                                   max_count=100, max_time=FIELD_INFO_MAX_TIME,
-                                   enable_lookups=0, auto_cancel=2*FIELD_INFO_MAX_TIME                                   
-                                   #exec_mode='blocking', 
-                                   )
-            fieldCounts = {}
-            fieldValues = {}
-            for result in results:
-                for field in result:
-                    if ignoredField(field):
-                        continue
-                    fieldCounts[field] = fieldCounts.get(field, 0) + 1
-                    if field not in fieldValues:
-                        fieldValues[field] = set()
-                    fieldValues[field].add(str(result[field]))
-                    
-            fields = fieldCounts.keys()
-            fields.sort(lambda x, y: (10 * len(fieldValues[y]) + fieldCounts[y]) - (10 * len(fieldValues[x]) + fieldCounts[x]))
-            fieldInfo = fields[:FIELD_INFO_MAX_FIELDS]
-            # store answer away
-            g_field_info_cache[self.key] = fieldInfo
-        except:
-            pass
-        try:
-            if self in g_threads:
-                g_threads.remove(self)
-        except:
-            pass
+def getFieldInfo(sessionKey, namespace, user, search):
+    """return the most interesting fields in the first results of search"""
+    results = se.searchAll(search, sessionKey=sessionKey, namespace=namespace, owner=user, status_buckets=0, required_field_list='*',
+                           auto_finalize_ec=100, 
+                           max_count=100, max_time=FIELD_INFO_MAX_TIME,
+                           enable_lookups=0, auto_cancel=2*FIELD_INFO_MAX_TIME                                   
+                           #exec_mode='blocking', 
+                           )
+    fieldCounts = {}
+    fieldValues = {}
+    for result in results:
+        for field in result:
+            if ignoredField(field):
+                continue
+            fieldCounts[field] = fieldCounts.get(field, 0) + 1
+            if field not in fieldValues:
+                fieldValues[field] = set()
+            fieldValues[field].add(str(result[field]))
+            
+    fields = fieldCounts.keys()
+    fields.sort(lambda x, y: (10 * len(fieldValues[y]) + fieldCounts[y]) - (10 * len(fieldValues[x]) + fieldCounts[x]))
+    return fields[:FIELD_INFO_MAX_FIELDS]
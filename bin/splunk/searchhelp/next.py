@@ -78,7 +78,7 @@ def getPastSearches(user, sessionKey, namespace):
 
 END = "<RUN>"
 
-g_cache = utils.AgedCache(clean_count=100, max_seconds=60)
+g_cache = utils.AgedCache(max_seconds=60, max_entries=100)
 MAX_HISTORY = 2000 # only get next data from last 2000 searches
 g_running_sessions = []
 
@@ -34,7 +34,7 @@ import splunk.rest, splunk.entity
 # - suggest optimizations. swapping of operators.  search | sort FIELD | head N  --> search | sort N FIELD
 #                                                  search | sort | fields -> search | fields | sort  (test case 20% faster)
 
-g_cache = utils.AgedCache(clean_count=5000, max_seconds=60)
+g_cache = utils.AgedCache(max_seconds=60, max_entries=5000)
 
 
 def help(sessionKey, namespace, user, search, insertpos=None, earliest_time=None, latest_time=None, count=10, max_time=None, servers=None,
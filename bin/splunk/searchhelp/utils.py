@@ -1,4 +1,4 @@
-import re, time
+import re, time, collections, threading
 import logging, logging.handlers
 import splunk.bundle
 import splunk.auth
@@ -15,76 +15,108 @@ ABUSE_PENALITY = 0.5
 
 
 class AgedCache:
-    # delete old cached values every 100 requests
-    # keep list of fields for 10 minutes
+    # keep values for max_seconds, and at most max_entries of them, dropping the
+    # least recently used value first.  safe to share between threads.
     
-    def __init__(self, clean_count=100, max_seconds=600):
-        self.cache = {}  
-        self.request_count = 0 
-        self.clean_count = clean_count
+    def __init__(self, max_seconds=600, max_entries=1000, clean_count=None):
+        # clean_count is accepted for old callers; expired values are now dropped as they are found
+        self.cache = collections.OrderedDict()  # key -> (data_time, value), least recently used first
         self.max_seconds = max_seconds
+        self.max_entries = max_entries
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, data_time, now):
+        return data_time + self.max_seconds <= now
+
+    def _lookup(self, key):
+        # return (True, value) and mark key as most recently used, or (False, None). caller holds lock
+        entry = self.cache.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        if self._expired(entry[0], time.time()):
+            self.misses += 1
+            self.expirations += 1
+            return False, None
+        self.cache[key] = entry
+        self.hits += 1
+        return True, entry[1]
         
-    def _cleanupCache(self):
-        self.request_count += 1
-        # if it's time
-        if self.request_count % self.clean_count == 0:
-            now = time.time()
-            doomed = []
-            # for each cached value that is too old, delete
-            for key, (data_time, out) in self.cache.items():
-                if data_time + self.max_seconds < now:
-                    doomed.append(key)
-            for d in doomed:
-                if d in self.cache:
-                    del self.cache[d]
-
     def getValid(self, key, default=None):
         '''return value if cache has a value that has not expired'''
-        key = hash(key)
-        self._cleanupCache()
-        if key in self.cache:
-            data_time, out = self.cache[key]
-            if data_time + self.max_seconds > time.time():
-                return out
+        with self.lock:
+            found, value = self._lookup(key)
+        if found:
+            return value
         return default
 
     def __getitem__(self, key):
-        self._cleanupCache()
-        key = hash(key)
-        return self.cache[key][1]
+        with self.lock:
+            found, value = self._lookup(key)
+        if not found:
+            raise KeyError(key)
+        return value
         
     def __setitem__(self, key, value):
-        key = hash(key)        
-        self.cache[key] = (time.time(), value)
+        with self.lock:
+            now = time.time()
+            self.cache.pop(key, None)
+            self.cache[key] = (now, value)
+            # drop expired values from the old end, then the least recently used ones
+            # if there are still too many.  each value is dropped once, so this is O(1) amortized.
+            while self.cache:
+                oldest = next(self.cache.iterkeys())
+                if self._expired(self.cache[oldest][0], now):
+                    self.expirations += 1
+                elif len(self.cache) > self.max_entries:
+                    self.evictions += 1
+                else:
+                    break
+                del self.cache[oldest]
         
     def __delitem__(self, key):
-        key = hash(key)                
-        del self.cache[key]
+        with self.lock:
+            del self.cache[key]
     def __iter__(self):
-        return self.cache.__iter__()
+        return iter(self.keys())
     def __len__(self):
         return self.cache.__len__()
     def __str__(self):
-        return self.cache.__str__()
+        return str(dict(self.items()))
     def __repr__(self):
-        o = [x for x in self.cache]
-        return o.__repr__()
+        return self.keys().__repr__()
     def __contains__(self, key):
-        key = hash(key)                
-        return key in self.cache
+        with self.lock:
+            entry = self.cache.get(key)
+        return entry is not None and not self._expired(entry[0], time.time())
     def get(self, key, default=None):
-        key = hash(key)                
-        if key in self.cache:
-            return self.__getitem__(key)
-        return default
+        return self.getValid(key, default)
     def keys(self):
-        return self.cache.keys()
+        return [key for key, value in self.items()]
+    def items(self):
+        '''return (key, value) for each value that has not expired, least recently used first'''
+        now = time.time()
+        with self.lock:
+            return [(key, value) for key, (data_time, value) in self.cache.items() if not self._expired(data_time, now)]
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+    def stats(self):
+        '''return the number of values held and the hit, miss, eviction and expiration counts'''
+        with self.lock:
+            return {'size': len(self.cache), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'expirations': self.expirations}
         
 
 
 
 # cache confs, as splunk.bundle is really, really slow
-g_conf_cache = AgedCache(clean_count=10000)
+g_conf_cache = AgedCache(max_entries=1000)
 g_running_gets = []
 
 def getStanzas(confFile, sessionKey, username, namespace):
@@ -0,0 +1,152 @@
+""" Array kernels shared by the stats_util modules.
+
+NumPy is used when it can be imported, otherwise the pure Python loops below are used.
+Both paths return plain lists, so callers don't need to know which one ran.
+Set USE_NUMPY = False to force the pure Python code (e.g. to compare results). """
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from fft import rfft, irfft
+
+USE_NUMPY = numpy is not None
+
+# Without NumPy, lagged_products uses the FFT for this many lags or more; fewer lags are
+# cheaper to sum directly.
+FFT_MIN_LAGS = 32
+
+
+def _padded_size (N, maxlag):
+    """ Smallest power of 2 that holds N values plus maxlag zeros, so that the circular
+    correlation computed through the FFT doesn't wrap around. """
+    size = 1
+    while size < N + maxlag: size <<= 1
+    return size
+
+
+# data: list, mean: float, maxlag: int
+def lagged_products (data, mean, maxlag):
+    """ Return the list of sums (data[i]-mean)*(data[i+k]-mean) over i, for k = 0..maxlag.
+    Dividing these by the appropriate count gives the autocovariances. """
+    N = len(data)
+    if maxlag >= N: maxlag = N-1
+    if maxlag < 0: return []
+    # Wiener-Khinchin: the inverse FFT of the power spectrum is the autocorrelation,
+    # which costs O(N log N) for all lags instead of O(N) per lag.
+    if USE_NUMPY:
+        x = numpy.asarray(data, dtype=float) - mean
+        size = _padded_size(N, maxlag)
+        f = numpy.fft.rfft(x, size)
+        return numpy.fft.irfft(f*f.conjugate(), size)[:maxlag+1].tolist()
+    if maxlag+1 >= FFT_MIN_LAGS:
+        size = _padded_size(N, maxlag)
+        f = rfft([x-mean for x in data] + [0.0]*(size-N))
+        return irfft([complex(abs(z)**2) for z in f], size)[:maxlag+1]
+
+    sums = [0.0]*(maxlag+1)
+    for k in range(maxlag+1):
+        s = 0.0
+        for i in range(N-k):
+            s += (data[i]-mean)*(data[i+k]-mean)
+        sums[k] = s
+    return sums
+
+
+# values: list, weights: list
+def correlate_valid (values, weights):
+    """ Return the list r where r[j] = sum_k weights[k]*values[j+k],
+    for every j at which the weights fit entirely inside values. """
+    n = len(values)
+    m = len(weights)
+    if m > n: return []
+    if USE_NUMPY:
+        return numpy.correlate(numpy.asarray(values, dtype=float),
+                               numpy.asarray(weights, dtype=float), 'valid').tolist()
+
+    # Seasonal filters such as the 3x3 and 3x5 ones used by X11 are mostly zeros,
+    # so only the non-zero taps are visited.
+    taps = [(k, w) for k, w in enumerate(weights) if w != 0.0]
+    result = [0.0]*(n-m+1)
+    for j in range(n-m+1):
+        val = 0.0
+        for k, w in taps:
+            val += w * values[j+k]
+        result[j] = val
+    return result
+
+
+if __name__ == "__main__":
+    import math
+    import random
+    import unittest
+
+    # run the kernels through the modules that use them, so that the
+    # USE_NUMPY switch below applies to the same module object
+    import backend
+    import statespace
+    import ts
+
+    TOLERANCE = 1e-9
+
+    def series (n, period, seed):
+        rnd = random.Random(seed)
+        return [10.0 + 0.05*i + 3*math.sin(2*math.pi*i/period) + rnd.gauss(0, 0.5) for i in range(n)]
+
+    class TestBackends(unittest.TestCase):
+        """ Checks that the NumPy kernels, the pure Python FFT and the direct loops agree """
+
+        fixtures = [series(n, p, n) for n, p in ((7, 3), (48, 12), (200, 7), (365, 30))]
+
+        def setUp(self):
+            self.saved = (backend.USE_NUMPY, backend.FFT_MIN_LAGS)
+
+        def tearDown(self):
+            backend.USE_NUMPY, backend.FFT_MIN_LAGS = self.saved
+
+        def modes(self):
+            """ yield once for each kernel implementation available here """
+            if backend.numpy is not None:
+                backend.USE_NUMPY = True
+                yield 'numpy'
+            backend.USE_NUMPY = False
+            backend.FFT_MIN_LAGS = 1
+            yield 'fft'
+            backend.FFT_MIN_LAGS = 10**9
+            yield 'loops'
+
+        def assertClose(self, expected, actual, mode):
+            self.assertEqual(len(expected), len(actual), mode)
+            for e, a in zip(expected, actual):
+                self.assertTrue(abs(e-a) <= TOLERANCE*max(1.0, abs(e)), "%s: %r != %r" % (mode, e, a))
+
+        def testLaggedProducts(self):
+            for data in self.fixtures:
+                mean = sum(data)/len(data)
+                expected = [statespace.autocovariance(data, mean, k)*(len(data)-1.) for k in range(len(data))]
+                for mode in self.modes():
+                    self.assertClose(expected, backend.lagged_products(data, mean, len(data)-1), mode)
+                    self.assertClose(expected[:5], backend.lagged_products(data, mean, 4), mode)
+
+        def testCorrelateValid(self):
+            weights = [1/9., 0, 0, 2/9., 0, 0, 3/9., 0, 0, 2/9., 0, 0, 1/9.]
+            for data in self.fixtures:
+                expected = [sum(w*data[j+k] for k, w in enumerate(weights)) for j in range(len(data)-len(weights)+1)]
+                for mode in self.modes():
+                    self.assertClose(expected, backend.correlate_valid(data, weights), mode)
+
+        def testCorrelograms(self):
+            for data in self.fixtures:
+                for module in (statespace, ts):
+                    results = [(mode, list(module.correlogram(data))) for mode in self.modes()]
+                    for mode, cor in results:
+                        self.assertClose(results[-1][1], cor, "%s.%s" % (module.__name__, mode))
+
+        def testFindPeriod(self):
+            for data in self.fixtures:
+                for module in (statespace, ts):
+                    periods = [(mode, module.findPeriod(data)) for mode in self.modes()]
+                    self.assertEqual(len(set(p for mode, p in periods)), 1, "%s: %s" % (module.__name__, periods))
+
+    unittest.main()
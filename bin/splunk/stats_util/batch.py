@@ -0,0 +1,181 @@
+""" Forecast many time series in one call.
+
+forecast_many() takes a mapping of series id -> list of floats, fits the same model to every
+series and returns the forecasts and their variances in one dict. The fits are independent,
+so they are spread over a process pool. """
+
+import time
+from multiprocessing import Pool
+
+import statespace
+from statespace import FORECAST, findPeriod
+
+
+# Models that take a period argument; the others find their own periods (or have none).
+PERIODIC_MODELS = ('LLP','LLP1','LLP2')
+MODELS = ('LL','LLT','LLP','LLP1','LLP2','LLP3','LLP4','LLP5')
+# Models built on LL, which accept LL's fit options (refit_every).
+LL_OPTION_MODELS = ('LL','LLP','LLP1','LLP2','LLP3','LLP4','LLP5')
+
+
+def _fit_one (args):
+    """ Fit one series. Runs in the pool's worker processes, so it must be a module level function. """
+    sid, data, model, forecast_len, period, options = args
+    start = time.time()
+    result = {'model': model, 'period': period, 'fc': None, 'variance': None, 'error': None}
+    try:
+        if len(data) < statespace.LL.least_num_data():
+            raise ValueError("too few data points: %d" % len(data))
+        cls = getattr(statespace, model)
+        if model in PERIODIC_MODELS:
+            m = cls(data, period if period else -1, forecast_len, **options)
+            result['period'] = m.model2.period if model == 'LLP2' else m.period
+        else:
+            m = cls(data, forecast_len, **options)
+            result['period'] = getattr(m, 'period', None)
+        result['fc'] = m.fc
+        result['variance'] = m.p
+    except (ValueError, ArithmeticError), e:
+        # a series the model can't fit (too short, no period, numeric trouble) is recorded
+        # with its series, so the other fits carry on. anything else is a bug and propagates.
+        result['error'] = "%s: %s" % (e.__class__.__name__, e)
+    result['elapsed'] = time.time() - start
+    return sid, result
+
+
+def shared_period (series):
+    """ Find one period for a group of series by looking at their point-wise average.
+    Series are aligned on their last point and truncated to the shortest one.
+    Return -1 if no periodicity is found. """
+    series = [s for s in series if len(s) > 0]
+    if not series: return -1
+    n = min(len(s) for s in series)
+    avg = [0.0]*n
+    for s in series:
+        tail = s[len(s)-n:]
+        for i in xrange(n):
+            avg[i] += tail[i]
+    avg = [x/len(series) for x in avg]
+    return findPeriod(avg)
+
+
+def forecast_many (series, model='LLP5', forecast_len=FORECAST, processes=None, share_period=False, progress=None, **model_options):
+    """ Fit model to every series and return {series id: result}.
+
+    series: a dict (or list of pairs) of series id -> list of floats
+    model: name of a statespace model, one of MODELS
+    processes: size of the process pool; None uses one process per CPU, 1 fits in this process
+    share_period: for the models in PERIODIC_MODELS, detect the period once on the average of
+        all series instead of once per series
+    progress: optional function called as progress(series_id, result, done, total) as each fit finishes
+    model_options: fit options passed to the model, e.g. refit_every=10 (see statespace.LL);
+        only the models in LL_OPTION_MODELS take them
+
+    Each result is a dict with keys 'fc' (filtered states followed by the forecasts), 'variance'
+    (their variances), 'period', 'model', 'elapsed' (seconds spent fitting) and 'error'
+    (None, or a message if the series couldn't be fitted, in which case 'fc' and 'variance' are None). """
+    if model not in MODELS:
+        raise ValueError("unknown model: %s" % model)
+    if model_options and model not in LL_OPTION_MODELS:
+        raise ValueError("model %s takes no fit options" % model)
+    if hasattr(series, 'items'):
+        series = series.items()
+
+    period = None
+    if share_period and model in PERIODIC_MODELS:
+        period = shared_period([data for sid, data in series])
+        if period < 2: period = None
+
+    jobs = [(sid, list(data), model, forecast_len, period, model_options) for sid, data in series]
+    results = {}
+    total = len(jobs)
+
+    if processes == 1 or total <= 1:
+        fits = (_fit_one(job) for job in jobs)
+        pool = None
+    else:
+        pool = Pool(processes)
+        fits = pool.imap_unordered(_fit_one, jobs)
+
+    try:
+        for sid, result in fits:
+            results[sid] = result
+            if progress is not None:
+                progress(sid, result, len(results), total)
+    except:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        raise
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+if __name__ == "__main__":
+    import math
+    import random
+    import unittest
+
+    from statespace import LL, LLP
+
+    def series (n, period=12, seed=0):
+        rnd = random.Random(seed)
+        return [20.0 + 0.1*i + 4*math.sin(2*math.pi*i/period) + rnd.gauss(0, 1) for i in range(n)]
+
+    class TestForecastMany(unittest.TestCase):
+
+        def setUp(self):
+            self.series = dict(('s%d' % i, series(72, seed=i)) for i in range(3))
+
+        def testMatchesSingleLL(self):
+            results = forecast_many(self.series, model='LL', processes=1)
+            for sid, data in self.series.items():
+                m = LL(data)
+                self.assertEqual(results[sid]['error'], None)
+                self.assertEqual(results[sid]['fc'], m.fc)
+                self.assertEqual(results[sid]['variance'], m.p)
+
+        def testMatchesSingleLLP(self):
+            results = forecast_many(self.series, model='LLP', processes=1)
+            for sid, data in self.series.items():
+                m = LLP(data)
+                self.assertEqual(results[sid]['period'], m.period)
+                self.assertEqual(results[sid]['fc'], m.fc)
+                self.assertEqual(results[sid]['variance'], m.p)
+
+        def testPoolMatchesSerial(self):
+            serial = forecast_many(self.series, model='LL', processes=1)
+            pooled = forecast_many(self.series, model='LL', processes=2)
+            for sid in self.series:
+                self.assertEqual(pooled[sid]['fc'], serial[sid]['fc'])
+
+        def testSharedPeriod(self):
+            period = shared_period(self.series.values())
+            self.assertEqual(period, 12)
+            results = forecast_many(self.series, model='LLP', processes=1, share_period=True)
+            for sid, data in self.series.items():
+                m = LLP(data, period)
+                self.assertEqual(results[sid]['period'], period)
+                self.assertEqual(results[sid]['fc'], m.fc)
+                self.assertEqual(results[sid]['variance'], m.p)
+
+        def testModelOptions(self):
+            results = forecast_many(self.series, model='LLP', processes=1, refit_every=8)
+            for sid, data in self.series.items():
+                self.assertEqual(results[sid]['fc'], LLP(data, refit_every=8).fc)
+            self.assertRaises(ValueError, forecast_many, self.series, model='LLT', refit_every=8)
+
+        def testErrorsAreRecorded(self):
+            results = forecast_many({'short': [1.0], 'ok': series(30)}, model='LL', processes=1)
+            self.assertEqual(results['short']['fc'], None)
+            self.assertTrue(results['short']['error'].startswith('ValueError'))
+            self.assertEqual(results['ok']['error'], None)
+
+        def testBugsPropagate(self):
+            self.assertRaises(TypeError, forecast_many, {'s': series(30)}, model='LL', processes=1, bogus=1)
+
+    unittest.main()
@@ -22,33 +22,283 @@ def incre_rev (x,m):
 # For example, if a = [a0,a1,a2,a3,a4,a5,a6,a7] then A = [a0,a4,a2,a6,a1,a5,a3,a7].
 # len(a) must be a power of 2
 def bit_reverse (a,A):
-    m = len(a)/2 
+    m = len(a)/2
     rev_idx = 0
     for t in a:
         A[rev_idx] = t
         rev_idx = incre_rev(rev_idx,m)
 
 
+# The transforms below use the sign convention of "Introduction to Algorithms", that is
+#     fft(a)[k]  = sum_j a[j]*exp(2*pi*i*j*k/n)
+#     ifft(y)[j] = sum_k y[k]*exp(-2*pi*i*j*k/n)/n
+# Twiddle factors, bit reversal permutations and Bluestein chirps only depend on the
+# length of the input, so they are computed once per length and cached.
+
+_bit_reversals = {}
+_twiddles = {}
+_chirps = {}
+
+
+def is_power_of_2 (n):
+    return n > 0 and n & (n-1) == 0
+
+
+def _bit_reversal (n):
+    """ Return the list rev such that rev[i] is the mirror of i viewed as a log2(n)-bit number. """
+    rev = _bit_reversals.get(n)
+    if rev is None:
+        rev = range(n)
+        bit_reverse(range(n),rev)
+        _bit_reversals[n] = rev
+    return rev
+
+
+def _twiddle_table (n, sign):
+    """ Return [exp(sign*2*pi*i*k/n) for k in 0..n/2-1]. Each factor is computed directly
+    from cos/sin, which is more accurate than accumulating powers by repeated multiplication. """
+    key = (n,sign)
+    table = _twiddles.get(key)
+    if table is None:
+        phi = sign*2*math.pi/n
+        table = [complex(math.cos(phi*k),math.sin(phi*k)) for k in xrange(n/2)]
+        _twiddles[key] = table
+    return table
+
+
 # Cooley-Tukey Fast Fourier Transform as described in
-# "Introduction to Algorithms, 3rd edition" by Cormen-Leiserson-Rivest-Stein, page 917.
-def fft (a):
-    n = len(a) # n must be a power of 2
-    e = int(math.log(n,2))
-    A = range(n)
-    bit_reverse(a,A)
-    
-    for s in range(1,e+1):
-        m = int(math.pow(2,s))
-        phi = 2*math.pi/m
-        w_m = complex(math.cos(phi),math.sin(phi))
-        # w_m = cmath.rect(1, 2*cmath.pi/m) (if cmath is available) 
-        for k in range(0,n,m):
-            w = 1
-            for j in range(0,m/2):
-                t = w*A[k+j+m/2]
+# "Introduction to Algorithms, 3rd edition" by Cormen-Leiserson-Rivest-Stein, page 917,
+# iterative and using the cached tables. len(a) must be a power of 2.
+def _fft_radix2 (a, sign):
+    n = len(a)
+    A = [a[i] for i in _bit_reversal(n)]
+    table = _twiddle_table(n,sign)
+
+    m = 2
+    while m <= n:
+        half = m/2
+        w = table[::n/m]
+        for k in xrange(0,n,m):
+            for j in xrange(half):
+                t = w[j]*A[k+j+half]
                 u = A[k+j]
                 A[k+j] = u + t
-                A[k+j+m/2] = u - t
-                w = w*w_m
+                A[k+j+half] = u - t
+        m <<= 1
     return A
-                
+
+
+def _chirp (n, sign):
+    """ Return [exp(sign*pi*i*j*j/n) for j in 0..n-1], the chirp used by Bluestein's algorithm. """
+    key = (n,sign)
+    chirp = _chirps.get(key)
+    if chirp is None:
+        # Reduce j*j modulo 2n first so the angle stays small and accurate.
+        phi = sign*math.pi/n
+        chirp = [complex(math.cos(phi*(j*j%(2*n))),math.sin(phi*(j*j%(2*n)))) for j in xrange(n)]
+        _chirps[key] = chirp
+    return chirp
+
+
+# Bluestein's algorithm: a DFT of any length n is a convolution with a chirp, and the
+# convolution is computed with power of 2 FFTs of length >= 2n-1.
+def _fft_bluestein (a, sign):
+    n = len(a)
+    c = _chirp(n,sign)
+    m = 1
+    while m < 2*n-1: m <<= 1
+
+    x = [a[j]*c[j] for j in xrange(n)] + [0j]*(m-n)
+    b = [0j]*m
+    b[0] = c[0].conjugate()
+    for j in xrange(1,n):
+        b[j] = b[m-j] = c[j].conjugate()
+
+    X = _fft_radix2(x,1)
+    B = _fft_radix2(b,1)
+    conv = _fft_radix2([u*v for (u,v) in zip(X,B)],-1)
+    return [c[k]*conv[k]/m for k in xrange(n)]
+
+
+def fft (a):
+    """ Discrete Fourier transform of the sequence a, of any length. """
+    n = len(a)
+    if n <= 1: return [complex(x) for x in a]
+    if is_power_of_2(n): return _fft_radix2(a,1)
+    return _fft_bluestein(a,1)
+
+
+def ifft (y):
+    """ Inverse of fft: ifft(fft(a)) == a up to rounding. """
+    n = len(y)
+    if n <= 1: return [complex(x) for x in y]
+    if is_power_of_2(n): A = _fft_radix2(y,-1)
+    else: A = _fft_bluestein(y,-1)
+    return [x/n for x in A]
+
+
+def rfft (a):
+    """ Fourier transform of the real sequence a. Since fft(a)[n-k] is the conjugate of
+    fft(a)[k] for real input, only the first len(a)/2+1 terms are returned.
+    For even lengths the real values are packed in pairs into a complex sequence of half
+    the length, so this costs about half as much as fft. """
+    n = len(a)
+    if n < 2 or n%2: return fft(a)[:n/2+1]
+
+    # z[j] = a[2j] + i*a[2j+1]; its transform Z = E + iO mixes the transforms E and O
+    # of the even and odd samples, which are recovered from Z[k] and Z[h-k].
+    h = n/2
+    Z = fft([complex(a[2*j],a[2*j+1]) for j in xrange(h)])
+    w = _twiddle_table(n,1)
+    X = [None]*(h+1)
+    X[0] = complex(Z[0].real + Z[0].imag)
+    X[h] = complex(Z[0].real - Z[0].imag)
+    for k in xrange(1,h):
+        zc = Z[h-k].conjugate()
+        E = (Z[k] + zc)*0.5
+        O = (Z[k] - zc)*-0.5j
+        X[k] = E + w[k]*O
+    return X
+
+
+def irfft (y, n=None):
+    """ Inverse of rfft: return the n real values whose rfft is y. n defaults to 2*(len(y)-1). """
+    if n is None: n = 2*(len(y)-1)
+    if n < 2 or n%2:
+        full = list(y[:n/2+1]) + [y[k].conjugate() for k in xrange((n-1)/2,0,-1)]
+        return [x.real for x in ifft(full)]
+
+    # Undo the packing done by rfft: E[k] and O[k] are the transforms of the even and
+    # odd samples, and Z = E + iO is the transform of a[2j] + i*a[2j+1].
+    h = n/2
+    w = _twiddle_table(n,-1)
+    Z = [None]*h
+    for k in xrange(h):
+        Xk = y[k]
+        Xkh = y[h-k].conjugate()
+        E = (Xk + Xkh)*0.5
+        O = (Xk - Xkh)*0.5*w[k]
+        Z[k] = E + 1j*O
+    z = ifft(Z)
+    a = [0.0]*n
+    for j in xrange(h):
+        a[2*j] = z[j].real
+        a[2*j+1] = z[j].imag
+    return a
+
+
+if __name__ == "__main__":
+    # python fft.py            runs the tests
+    # python fft.py benchmark  times the transforms against the previous fft
+    import cmath
+    import random
+    import sys
+    import time
+    import unittest
+
+    def dft (a, sign=1):
+        """ The transform computed straight from its definition, in O(n^2) """
+        n = len(a)
+        return [sum(a[j]*cmath.exp(sign*2j*math.pi*(j*k%n)/n) for j in xrange(n)) for k in xrange(n)]
+
+    def baseline_fft (a):
+        """ fft as it was before the tables were cached: powers of 2 only, twiddles by repeated
+        multiplication """
+        n = len(a)
+        e = int(math.log(n,2))
+        A = range(n)
+        bit_reverse(a,A)
+        for s in range(1,e+1):
+            m = int(math.pow(2,s))
+            phi = 2*math.pi/m
+            w_m = complex(math.cos(phi),math.sin(phi))
+            for k in range(0,n,m):
+                w = 1
+                for j in range(0,m/2):
+                    t = w*A[k+j+m/2]
+                    u = A[k+j]
+                    A[k+j] = u + t
+                    A[k+j+m/2] = u - t
+                    w = w*w_m
+        return A
+
+    def real_series (n, seed=0):
+        rnd = random.Random(seed)
+        return [rnd.uniform(-1,1) for i in xrange(n)]
+
+    def complex_series (n, seed=0):
+        rnd = random.Random(seed)
+        return [complex(rnd.uniform(-1,1),rnd.uniform(-1,1)) for i in xrange(n)]
+
+    POWERS_OF_2 = (1, 2, 4, 8, 64, 256)
+    OTHER_LENGTHS = (3, 5, 6, 7, 12, 13, 97, 100)
+
+    class TestFFT(unittest.TestCase):
+
+        def assertClose(self, a, b, tol=1e-9):
+            self.assertEqual(len(a), len(b))
+            scale = max([1.0] + [abs(x) for x in b])
+            for k, (x, y) in enumerate(zip(a, b)):
+                self.assertTrue(abs(x-y) <= tol*scale, "term %d: %r != %r" % (k, x, y))
+
+        def testFFTMatchesDFT(self):
+            for n in POWERS_OF_2 + OTHER_LENGTHS:
+                a = complex_series(n, n)
+                self.assertClose(fft(a), dft(a))
+
+        def testIFFTMatchesInverseDFT(self):
+            for n in POWERS_OF_2 + OTHER_LENGTHS:
+                y = complex_series(n, n)
+                self.assertClose(ifft(y), [x/n for x in dft(y, -1)])
+                self.assertClose(ifft(fft(y)), y)
+
+        def testRFFT(self):
+            for n in POWERS_OF_2 + OTHER_LENGTHS:
+                a = real_series(n, n)
+                self.assertClose(rfft(a), dft(a)[:n/2+1])
+
+        def testIRFFTRoundTrip(self):
+            for n in POWERS_OF_2 + OTHER_LENGTHS:
+                if n < 2: continue
+                a = real_series(n, n)
+                self.assertClose(irfft(rfft(a), n), a)
+            # n defaults to an even length
+            a = real_series(16, 1)
+            self.assertClose(irfft(rfft(a)), a)
+
+        def testMatchesBaseline(self):
+            for n in POWERS_OF_2:
+                a = real_series(n, n)
+                self.assertClose(fft(a), baseline_fft(a))
+
+        def testCachedTables(self):
+            self.assertEqual(_bit_reversal(8), [0, 4, 2, 6, 1, 5, 3, 7])
+            self.assertTrue(_bit_reversal(8) is _bit_reversal(8))
+            table = _twiddle_table(1024, 1)
+            self.assertTrue(_twiddle_table(1024, 1) is table)
+            self.assertFalse(_twiddle_table(1024, -1) is table)
+            self.assertEqual(len(table), 512)
+            self.assertClose(table, [cmath.exp(2j*math.pi*k/1024) for k in xrange(512)], 1e-15)
+            chirp = _chirp(13, 1)
+            self.assertTrue(_chirp(13, 1) is chirp)
+            self.assertClose(chirp, [cmath.exp(1j*math.pi*j*j/13) for j in xrange(13)], 1e-12)
+
+    def benchmark (sizes=(1024, 4096, 16384, 1000, 10007), repeat=5):
+        def best (f, a):
+            times = []
+            for i in range(repeat):
+                start = time.time()
+                f(a)
+                times.append(time.time() - start)
+            return min(times)
+
+        print "%8s  %12s  %12s  %12s  %12s" % ('n', 'previous fft', 'fft', 'rfft', 'ifft')
+        for n in sizes:
+            a = real_series(n)
+            previous = is_power_of_2(n) and "%11.4fs" % best(baseline_fft, a) or "%12s" % '-'
+            print "%8d  %s  %11.4fs  %11.4fs  %11.4fs" % (n, previous, best(fft, a), best(rfft, a), best(ifft, a))
+
+    if sys.argv[1:] == ['benchmark']:
+        benchmark()
+    else:
+        unittest.main()
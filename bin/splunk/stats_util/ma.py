@@ -1,4 +1,5 @@
 import math
+from backend import correlate_valid
 
 class MA:
     """ Moving Average base class """
@@ -32,16 +33,14 @@ class MA:
             print "resizing result's length ..."
             result.resize(len(original))
 
-        for i, v in enumerate(original):
-            idx = i - self.center
+        # valid[idx] is the weighted sum of original[idx:idx+len(self)]
+        valid = correlate_valid(original.data, self.weights)
+        for i in range(len(original)):
+            idx = int(i - self.center)
             if idx < 0 or idx+len(self) > len(original):
                 result[i] = 0.0
-                continue
-
-            val = 0.0
-            for j, w in enumerate(self):
-                val += w * original[int(idx+j)]
-            result[i] = val
+            else:
+                result[i] = valid[idx]
 
         result.setPeriod (original.period)
         result.setPeriodStart ( (original.periodStart+self.center)%original.period)
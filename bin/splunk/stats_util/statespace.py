@@ -2,6 +2,7 @@ from optimize import vec
 from optimize import dfpmin
 from dist import Chisqdist
 from dist import Fdist
+from backend import lagged_products
 
 from itertools import izip
 from math import log
@@ -30,18 +31,20 @@ def correlogram (data, n=0):
     N = len(data)
     mean = float(sum(data))/N
     if n == 0 or n >= N: n = N-1
-    var = autocovariance(data,mean,0)
+    cov = [s/(N-1.) for s in lagged_products(data,mean,n)]
+    var = cov[0]
     if var == 0: raise Exception
     yield 1.0
     for i in range(1,n+1):
-        yield autocovariance(data,mean,i)/var
+        yield cov[i]/var
 
 
 # data: a list of float's         
+# maxlag: the largest period to look for; 0 looks at every lag up to len(data)-1
 # return -1 if no periodicity is found                                                                                                                                                                       
-def findPeriod (data):
+def findPeriod (data, maxlag=0):
     if len(data) == 1: return 1
-    cor = correlogram(data)
+    cor = correlogram(data, maxlag)
     try:
         prev = cor.next()
     except Exception:  # this means all elements are equal
@@ -69,16 +72,17 @@ def findPeriod (data):
 FORECAST=3
 
 class LLP3:
-    def __init__(self, data, forecast_len=FORECAST):
+    def __init__(self, data, forecast_len=FORECAST, **ll_options):
         if len(data) < self.least_num_data():
             raise ValueError("too few data points: %d" %len(data))
 
         self.data = data
         self.forecast_len = forecast_len
+        self.ll_options = ll_options
         self.fc = [None]*(len(data)+forecast_len) # filtered states
         self.p = [None]*len(self.fc) # variances of predictions (not filtered states)
 
-        self.model = self.model1 = LL(data,forecast_len) # starts with LL
+        self.model = self.model1 = LL(data,forecast_len,**ll_options) # starts with LL
         self.period = -1
 
         for i in range(self.model1.first_forecast_index(),len(self.fc)):
@@ -99,7 +103,7 @@ class LLP3:
         period = findPeriod(data[:k])
         if period != -1 and period != self.period and k > period*LL.least_num_data():
             try:
-                self.model2 = LLP(data,period,self.forecast_len)
+                self.model2 = LLP(data,period,self.forecast_len,**self.ll_options)
                 self.model = self.model2 
                 self.period = self.model2.period
             except ValueError:
@@ -136,16 +140,17 @@ class LLP3:
 
 #LLP4 combines LL and LLP
 class LLP4:
-    def __init__(self, data, forecast_len=FORECAST):
+    def __init__(self, data, forecast_len=FORECAST, **ll_options):
         if len(data) < self.least_num_data():
             raise ValueError("too few data points: %d" %len(data))
 
         self.data = data
         self.forecast_len = forecast_len
+        self.ll_options = ll_options
         self.fc = [None]*(len(data)+forecast_len) # filtered states
         self.p = [None]*len(self.fc) # variances of predictions (not filtered states)
 
-        self.model1 = LL(data,forecast_len) # starts with LL
+        self.model1 = LL(data,forecast_len,**ll_options) # starts with LL
         self.period = -1
         self.model2 = None
 
@@ -167,7 +172,7 @@ class LLP4:
         period = findPeriod(data[:k])
         if period != -1 and period != self.period and k > period*LL.least_num_data():
             try:
-                self.model2 = LLP(data,period,self.forecast_len)
+                self.model2 = LLP(data,period,self.forecast_len,**self.ll_options)
                 self.period = self.model2.period
             except ValueError:
                 pass
@@ -207,12 +212,13 @@ class LLP4:
 
 # LLP5 combines LLT and LLP
 class LLP5:
-    def __init__(self, data, forecast_len=FORECAST):
+    def __init__(self, data, forecast_len=FORECAST, **ll_options):
         if len(data) < self.least_num_data():
             raise ValueError("too few data points: %d" %len(data))
 
         self.data = data
         self.forecast_len = forecast_len
+        self.ll_options = ll_options
         self.fc = [None]*(len(data)+forecast_len) # filtered states
         self.p = [None]*len(self.fc) # variances of predictions (not filtered states)
 
@@ -238,7 +244,7 @@ class LLP5:
         period = findPeriod(data[:k])
         if period != -1 and period != self.period and k > period*LL.least_num_data():
             try:
-                self.model2 = LLP1(data,period,self.forecast_len)
+                self.model2 = LLP1(data,period,self.forecast_len,**self.ll_options)
                 self.period = self.model2.period
             except ValueError:
                 pass
@@ -349,18 +355,34 @@ class MIX:
         
 
 class LL:
+    """ Local level time series model.
+
+    By default the parameter q is re-optimised from scratch for every data point, which costs
+    O(n^2) filter passes. Setting refit_every=N re-optimises q only every N data points and,
+    in between, carries the filter state (a, p, sum of v^2/f) forward one observation at a time,
+    so fitting costs O(n) plus one full pass per refit. The default reproduces the original
+    results exactly. The LLP variants pass refit_every through to their LL sub-models. """
 
-    def __init__ (self, data, forecast_len=FORECAST):
+    def __init__ (self, data, forecast_len=FORECAST, refit_every=1):
         self.data = data
         if len(data) == 0:
             raise ValueError
+        if refit_every < 1:
+            raise ValueError("refit_every must be at least 1")
         n = len(data)
         self.forecast_len = forecast_len
+        self.refit_every = refit_every
         self.sigma = 0.
         self.nu = 0.
         self.fc = [None]*(n+self.forecast_len) # filtered states
         self.p = [None]*len(self.fc) # variances of predictions (not filtered states)
 
+        # Filter state after the last update: optimised log(q), the index of the last refit,
+        # and [a, p, t1, k] where t1 is the sum of v^2/f over data[1:k].
+        self.psi = None
+        self.fit_index = None
+        self.state = None
+
         idx = self.first_forecast_index()
         self.fc[idx] = self.data[0]
         psi = vec([1.0])
@@ -370,7 +392,7 @@ class LL:
         if n > idx+1:
             self.update(idx+1)
             self.p[idx] *= self.sigma
-            
+
             for i in range(idx+2,n):
                 self.update(i)
                 self.var = self.p[n-1]
@@ -381,7 +403,7 @@ class LL:
             self.fc[n+i] = self.fc[n-1]
             self.p[n+i] = self.p[n+i-1] + self.nu
 
-        
+
 
     @classmethod
     def load(cls,file): # each line consists of a single number
@@ -441,18 +463,29 @@ class LL:
     # optimize paramater q using up to the k-th data point
     # ATTN: k must be AT LEAST 1
     def update(self,k):
-        psi = vec([1.0])
-        dfpmin(lambda x: self.llh(exp(x),k+1), psi)
-        q = exp(psi[0])
-
-        data = self.data[:k+1]
-        a = data[0]
-        p = 1. + q
-        sigma = 0.
-        for i in range(1,k):
-            [a,p,v,f] = self.update_kalman(data[i],a,p,q)
-            sigma += v*v/f
-        sigma /= (k-1)
+        state = self.state
+        if state is not None and state[3] == k-1 and k - self.fit_index < self.refit_every:
+            # Keep q and advance the filter by the single new observation.
+            q = exp(self.psi)
+            [a,p,v,f] = self.update_kalman(self.data[k-1],state[0],state[1],q)
+            t1 = state[2] + v*v/f
+        else:
+            psi = vec([1.0])
+            dfpmin(lambda x: self.llh(exp(x),k+1), psi)
+            self.psi = psi[0]
+            self.fit_index = k
+            q = exp(psi[0])
+
+            data = self.data[:k+1]
+            a = data[0]
+            p = 1. + q
+            t1 = 0.
+            for i in range(1,k):
+                [a,p,v,f] = self.update_kalman(data[i],a,p,q)
+                t1 += v*v/f
+
+        self.state = [a,p,t1,k]
+        sigma = t1/(k-1)
         self.sigma = sigma
         self.nu = q*sigma
         self.fc[k] = a
@@ -510,7 +543,7 @@ class LLE:
 
 
 class LLP:
-    def __init__(self,data,period=-1,forecast_len=FORECAST):
+    def __init__(self,data,period=-1,forecast_len=FORECAST,**ll_options):
         self.period = period
         if period < 2: 
             self.period = findPeriod(data)
@@ -524,7 +557,7 @@ class LLP:
 
         self.models = [None]*self.period
         for i in range(self.period):
-            self.models[i] = LL([data[j] for j in range(i,n,self.period)],self.forecast_len/self.period+1)
+            self.models[i] = LL([data[j] for j in range(i,n,self.period)],self.forecast_len/self.period+1,**ll_options)
 
         self.fc = [None]*(len(data)+self.forecast_len) # filtered states
         self.p = [None]*len(self.fc) # variances of filtered states
@@ -585,7 +618,7 @@ class LLP:
         return len(self.data)
 
 class LLP1:
-    def __init__(self,data,period=-1,forecast_len=FORECAST):
+    def __init__(self,data,period=-1,forecast_len=FORECAST,**ll_options):
         self.period = period
         if period < 2: 
             self.period = findPeriod(data)
@@ -599,7 +632,7 @@ class LLP1:
 
         self.models = [None]*self.period
         for i in range(self.period):
-            self.models[i] = LL([data[j] for j in range(i,n,self.period)],self.forecast_len/self.period+1)
+            self.models[i] = LL([data[j] for j in range(i,n,self.period)],self.forecast_len/self.period+1,**ll_options)
 
         self.fc = [None]*(len(data)+self.forecast_len) # filtered states
         self.p = [None]*len(self.fc) # variances of filtered states
@@ -664,11 +697,11 @@ class LLP1:
 
 
 class LLP2:
-    def __init__(self, data, period=-1, forecast_len=FORECAST):
+    def __init__(self, data, period=-1, forecast_len=FORECAST, **ll_options):
         self.data = data
         self.forecast_len = forecast_len
-        self.model1 = LL(data,forecast_len)
-        self.model2 = LLP(data,period,forecast_len)
+        self.model1 = LL(data,forecast_len,**ll_options)
+        self.model2 = LLP(data,period,forecast_len,**ll_options)
         self.fc = [None]*(len(data)+forecast_len)
         self.p = [None]*len(self.fc)
         for i in range(len(self.fc)):
@@ -1208,3 +1241,100 @@ class LLB:
 #         print "Box-Ljung statistic only computed for 1 <= k <= %d" %len(model.Q)
 #         raise ValueError
 #     return model.Q[k]
+
+
+if __name__ == "__main__":
+    # python statespace.py            runs the tests
+    # python statespace.py benchmark  times LL fits for growing series lengths
+    import math
+    import random
+    import sys
+    import unittest
+
+    def series (n, period=12, seed=0):
+        rnd = random.Random(seed)
+        return [20.0 + 0.1*i + 4*math.sin(2*math.pi*i/period) + rnd.gauss(0, 1) for i in range(n)]
+
+    class BaselineLL(LL):
+        """ LL as it was before the filter state was carried forward: q is re-optimised
+        and the data re-filtered from scratch for every data point """
+
+        def update(self,k):
+            psi = vec([1.0])
+            dfpmin(lambda x: self.llh(exp(x),k+1), psi)
+            q = exp(psi[0])
+
+            data = self.data[:k+1]
+            a = data[0]
+            p = 1. + q
+            sigma = 0.
+            for i in range(1,k):
+                [a,p,v,f] = self.update_kalman(data[i],a,p,q)
+                sigma += v*v/f
+            sigma /= (k-1)
+            self.sigma = sigma
+            self.nu = q*sigma
+            self.fc[k] = a
+            self.p[k] = (p+1+q)*sigma
+
+    class TestIncrementalLL(unittest.TestCase):
+
+        def testDefaultsMatchBaseline(self):
+            for n, seed in ((2, 1), (3, 2), (40, 3), (120, 4)):
+                data = series(n, seed=seed)
+                baseline = BaselineLL(data)
+                model = LL(data)
+                self.assertEqual(model.fc, baseline.fc)
+                self.assertEqual(model.p, baseline.p)
+
+        def testLLPDefaultsMatchBaseline(self):
+            data = series(96, seed=5)
+            model = LLP(data, 12)
+            global LL
+            incremental = LL
+            LL = BaselineLL
+            try:
+                baseline = LLP(data, 12)
+            finally:
+                LL = incremental
+            self.assertEqual(model.fc, baseline.fc)
+            self.assertEqual(model.p, baseline.p)
+
+        def testRefitEvery(self):
+            data = series(120, seed=6)
+            baseline = LL(data)
+            model = LL(data, refit_every=10)
+            self.assertEqual(len(model.fc), len(baseline.fc))
+            # q drifts between refits, so the forecasts stay close rather than equal
+            for a, b in zip(model.fc[-FORECAST:], baseline.fc[-FORECAST:]):
+                self.assertTrue(abs(a-b) < 0.1*abs(b), "%r != %r" % (a, b))
+            self.assertRaises(ValueError, LL, data, refit_every=0)
+
+        def testCompositesPassRefitEvery(self):
+            data = series(96, seed=7)
+            for model in (LLP2(data, 12, refit_every=8), LLP3(data, refit_every=8),
+                          LLP4(data, refit_every=8), LLP5(data, refit_every=8)):
+                lls = []
+                for m in (model.model1, model.model2):
+                    if isinstance(m, LL):
+                        lls.append(m)
+                    lls.extend(getattr(m, 'models', []))
+                self.assertTrue(lls, model.__class__.__name__)
+                for m in lls:
+                    self.assertEqual(m.refit_every, 8)
+
+    def benchmark (sizes=(100, 200, 400, 800), options=({}, {'refit_every': 10}, {'refit_every': 50})):
+        print "%6s  %s" % ('n', '  '.join("%28s" % (o or 'defaults') for o in options))
+        for n in sizes:
+            data = series(n)
+            times = []
+            for o in options:
+                start = time.time()
+                LL(data, **o)
+                times.append(time.time() - start)
+            print "%6d  %s" % (n, '  '.join("%27.3fs" % t for t in times))
+
+    if sys.argv[1:] == ['benchmark']:
+        benchmark()
+    else:
+        unittest.main()
@@ -1,3 +1,4 @@
+from backend import lagged_products
 
 
 def divide (a, b):
@@ -32,16 +33,18 @@ def correlogram (data, n=0):
     N = len(data)
     mean = float(sum(data))/N
     if n == 0 or n >= N: n = N-1
-    var = autocovariance(data,mean,0)
+    cov = [s/N for s in lagged_products(data,mean,n)]
+    var = cov[0]
     yield 1.0
     for i in range(1,n+1):
         if var == 0.: yield 0.
-        else: yield autocovariance(data,mean,i)/var
+        else: yield cov[i]/var
 
 
 #data: a list of float's
-def findPeriod (data):
-    cor = correlogram(data)
+#maxlag: the largest period to look for; 0 looks at every lag up to len(data)-1
+def findPeriod (data, maxlag=0):
+    cor = correlogram(data, maxlag)
     prev = cor.next()
     curr = cor.next()
     # Go through cor and find the indices of all local peaks.
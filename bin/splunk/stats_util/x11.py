@@ -32,6 +32,29 @@ def group(lst, n):
     """
     return zip(*[lst[i::n] for i in range(n)])
 
+def moving_averages (period):
+    """ Return the moving averages X11 uses for the given period """
+    if period%2:
+        step1MA = Simple(period)
+        step6MA = Henderson(period)
+    else:
+        step1MA = TwoByN(period)
+        step6MA = Henderson(period+1)
+
+    v3 = [0]*(4*period+1)
+    v3[0] = v3[4*period] = 1.0/9
+    v3[period] = v3[3*period] = 2.0/9
+    v3[2*period] = 3.0/9
+    step3MA = Weighted(v3, 2*period)
+
+    v5 = [0]*(6*period+1)
+    v5[0] = v5[6*period] = 1.0/15
+    v5[period] = v5[5*period] = 2.0/15
+    v5[2*period] = v5[3*period] = v5[4*period] = 3.0/15
+    step7MA = Weighted(v5, 3*period)
+
+    return [step1MA, step3MA, step6MA, step7MA]
+
 class X11:
     def __init__ (self, original, type):
         """ original = original TS object, type = ADD or MULT """
@@ -72,24 +95,7 @@ class X11:
             raise ValueError
 
         self.period = original.period
-        if self.period%2:
-            self.step1MA = Simple(self.period)
-            self.step6MA = Henderson(self.period)
-        else:
-            self.step1MA = TwoByN(self.period)
-            self.step6MA = Henderson(self.period+1)
-
-        v3 = [0]*(4*self.period+1)
-        v3[0] = v3[4*self.period] = 1.0/9
-        v3[self.period] = v3[3*self.period] = 2.0/9
-        v3[2*self.period] = 3.0/9
-        self.step3MA = Weighted(v3, 2*self.period)
-
-        v5 = [0]*(6*self.period+1)
-        v5[0] = v5[6*self.period] = 1.0/15
-        v5[self.period] = v5[5*self.period] = 2.0/15
-        v5[2*self.period] = v5[3*self.period] = v5[4*self.period] = 3.0/15
-        self.step7MA = Weighted(v5, 3*self.period)
+        [self.step1MA, self.step3MA, self.step6MA, self.step7MA] = moving_averages(self.period)
 
     def do_step1 (self):
         self.step1MA.apply(self.original, self.step1)
@@ -649,6 +655,9 @@ class X11:
         steps = [self.do_step1, self.do_step2, self.do_step3a, self.do_step3b, self.do_step3c, self.do_step3d, self.do_step3e, self.do_step3f, self.do_step4a, self.do_step4b, self.do_step4c, self.do_step5,
                  self.do_step6a, self.do_step6b, self.do_step6c, self.do_step6d,  self.do_step6e, self.do_step7, self.do_step8a, self.do_step8b, self.do_step8c, self.do_step8d, self.do_step8e, self.do_step8f,
                  self.do_step9a, self.do_step9b, self.do_step9c, self.do_step10, self.do_step11]
+        # computeStd1 and computeStd2 extend these lists, so start from empty ones on every run
+        for std in [self.std1, self.std2, self.std3, self.std4]:
+            del std[:]
         for s in steps: s()
         return self.step10
 
@@ -635,6 +635,132 @@ class OrderedDict(UserDict, object):
         return map(self.get, self._keys)
 
 
+
+class FastOrderedDict(dict):
+    '''
+    Provides the same interface as OrderedDict, with constant time setting
+    and deleting of keys.  Use it for search result rows, which can have
+    hundreds of fields.
+
+    The values live in the dict itself and the key order in a list.  Deleted
+    keys are only dropped from the list the next time the order is needed,
+    so deleting several keys costs one pass over the list.  A row read from
+    a header and a list of values can be built in one step with fromLists().
+    '''
+
+    def __init__(self, dict = None):
+        self._keys = []
+        self._deleted = set()
+        if dict is not None:
+            self.update(dict)
+
+    @classmethod
+    def fromLists(cls, keys, values):
+        '''
+        Returns a FastOrderedDict mapping keys[i] to values[i].  If a key is
+        repeated, its last value is kept at its first position, the same as
+        setting each item in turn.
+        '''
+        if len(values) > len(keys):
+            raise IndexError('%s values for %s keys' % (len(values), len(keys)))
+        keys = keys[:len(values)]
+        self = cls()
+        dict.update(self, zip(keys, values))
+        if len(self) == len(keys):
+            self._keys = list(keys)
+        else:
+            seen = set()
+            self._keys = [k for k in keys if not (k in seen or seen.add(k))]
+        return self
+
+    def _order(self):
+        if self._deleted:
+            deleted = self._deleted
+            self._keys = [k for k in self._keys if k not in deleted]
+            self._deleted = set()
+        return self._keys
+
+    def __setitem__(self, key, item):
+        if key not in self:
+            if key in self._deleted:
+                self._order()
+            self._keys.append(key)
+        dict.__setitem__(self, key, item)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._deleted.add(key)
+
+    def __iter__(self):
+        return iter(self._order())
+
+    iterKeys = iterkeys = __iter__
+
+    def __str__(self):
+        o = []
+        for k in self:
+            o.append("'%s': '%s'" % (k,self[k]))
+        return '{' + ', '.join(o) + '}'
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.items())
+
+    def __reduce__(self):
+        return (self.__class__, (self.items(),))
+
+    def clear(self):
+        dict.clear(self)
+        self._keys = []
+        self._deleted = set()
+
+    def copy(self):
+        return self.__class__(self.items())
+
+    def items(self):
+        return [(k, dict.__getitem__(self, k)) for k in self._order()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def keys(self):
+        return list(self._order())
+
+    def values(self):
+        return [dict.__getitem__(self, k) for k in self._order()]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def pop(self, key, *default):
+        if key in self:
+            val = dict.pop(self, key)
+            self._deleted.add(key)
+            return val
+        return dict.pop(self, key, *default)
+
+    def popitem(self, last=True):
+        keys = self._order()
+        if not keys:
+            raise KeyError('dictionary is empty')
+        key = keys[-1] if last else keys[0]
+        return (key, self.pop(key))
+
+    def setdefault(self, key, failobj = None):
+        if key not in self:
+            self[key] = failobj
+        return dict.__getitem__(self, key)
+
+    def update(self, dict = None, **kwargs):
+        if dict is not None:
+            if hasattr(dict, 'keys'):
+                for key in dict.keys():
+                    self[key] = dict[key]
+            else:
+                for key, val in dict:
+                    self[key] = val
+        for key, val in kwargs.items():
+            self[key] = val
+
 def urlencodeDict(query):
     '''
     Convert a dictionary to a url-encoded" string.
@@ -1386,6 +1512,42 @@ if __name__ == '__main__':
             combined = keysd[0:-4] + KEYSd
             for i, k in enumerate(od):
                 self.assertEquals(combined[i], k)
+
+        def testFastOrderedDict(self):
+            '''
+            test that the fast ordered dictionary behaves like OrderedDict
+            '''
+            import copy, pickle
+
+            items = [(char, i) for i, char in enumerate('abcdefghijklmnopqrstuvwxyz')]
+            od = OrderedDict(items)
+            fod = FastOrderedDict(items)
+            self.assertEquals(fod.keys(), od.keys())
+            self.assertEquals(fod.items(), od.items())
+            self.assertEquals(list(fod.iterKeys()), list(od.iterKeys()))
+
+            for key in 'aeiou':
+                del od[key]
+                del fod[key]
+            od['a'] = fod['a'] = 'again'
+            self.assertEquals(fod.keys(), od.keys())
+            self.assertEquals(fod.popitem(), od.popitem())
+            self.assertEquals(fod.popitem(last=False), od.popitem(last=False))
+            self.assertEquals(str(fod), str(od))
+
+            copied = fod.copy()
+            self.assert_(isinstance(copied, FastOrderedDict))
+            self.assertEquals(copied.keys(), fod.keys())
+            self.assertEquals(FastOrderedDict([('x', 1), ('y', 2)]), FastOrderedDict([('y', 2), ('x', 1)]))
+
+            row = FastOrderedDict.fromLists(['x', 'y', 'x', 'z'], [1, 2, 3])
+            self.assertEquals(row.items(), [('x', 3), ('y', 2)])
+            del row['x']
+            row['x'] = 4
+            self.assertEquals(row.keys(), ['y', 'x'])
+            self.assertEquals(copy.deepcopy(row).items(), row.items())
+            self.assertEquals(pickle.loads(pickle.dumps(row, 2)).items(), row.items())
+            self.assertRaises(IndexError, FastOrderedDict.fromLists, ['x'], [1, 2])
                     
 
         def testGetIsoTime(self):
@@ -1,4 +1,4 @@
-from util.apache_config import read_config_file
+from util.apache_config import read_config_file_cached
 import app_utils
 
 
@@ -34,7 +34,7 @@ def buildConfigHandler(config_file=DEFAULT_APP_CONFIG_FILE, supported_fields='au
 
             if supported_fields=='auto':
                 _config_file = '%s/default/%s.conf' % (LOCAL_APP_PATH, DEFAULT_APP_CONFIG_FILE)
-                config, all_sections, all_options, merged_options = read_config_file(default_config_file=_config_file)
+                config, all_sections, all_options, merged_options = read_config_file_cached(default_config_file=_config_file)
                 _supported_fields = merged_options
 
 
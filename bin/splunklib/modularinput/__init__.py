@@ -5,8 +5,9 @@ from splunklib.modularinput import *
 """
 from argument import Argument
 from event import Event
-from event_writer import EventWriter
+from event_writer import EventWriter, BufferedEventWriter
 from input_definition import InputDefinition
 from scheme import Scheme
 from script import Script
+from scheduled_script import CheckpointStore, ScheduledScript
 from validation_definition import ValidationDefinition
\ No newline at end of file
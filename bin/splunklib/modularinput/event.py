@@ -17,6 +17,22 @@ try:
 except ImportError as ie:
     import xml.etree.ElementTree as ET
 
+from xml.sax.saxutils import escape
+
+# Entities used for attribute values in addition to &, < and >; these match
+# what ``ET.tostring`` produces.
+_ATTR_ENTITIES = {'"': "&quot;", "\n": "&#10;"}
+
+def _xml_escape(value, entities={}):
+    """Escape *value* for XML, encoding unicode characters outside ASCII
+    as character references the way ``ET.tostring`` does."""
+    if not isinstance(value, basestring):
+        value = str(value)
+    value = escape(value, entities)
+    if isinstance(value, unicode):
+        value = value.encode("ascii", "xmlcharrefreplace")
+    return value
+
 class Event(object):
     """Represents an event or fragment of an event to be written by this modular input to Splunk.
 
@@ -76,6 +92,52 @@ class Event(object):
 
         :param stream: stream to write XML to.
         """
+        stream.write(self.to_xml_string())
+        stream.flush()
+
+    def to_xml_string(self):
+        """Return the XML representation of self, an ``Event`` object, as a string.
+
+        The ``<event>`` element is formatted directly rather than built as an
+        ``ElementTree``, which is what makes it cheap enough to call for every
+        event of a high volume input. A ``ValueError`` is raised if the data
+        field is not defined.
+        """
+        if self.data is None:
+            raise ValueError("Events must have at least the data field set to be written to XML.")
+
+        parts = ["<event"]
+        if self.stanza is not None:
+            parts.append(' stanza="%s"' % _xml_escape(self.stanza, _ATTR_ENTITIES))
+        parts.append(' unbroken="%d">' % int(self.unbroken))
+
+        # if a time isn't set, let Splunk guess by not creating a <time> element
+        if self.time is not None:
+            parts.append("<time>%s</time>" % _xml_escape(self.time))
+
+        # add all other subelements to this Event, represented by (tag, text)
+        subelements = [
+            ("source", self.source),
+            ("sourcetype", self.sourceType),
+            ("index", self.index),
+            ("host", self.host),
+            ("data", self.data)
+        ]
+        for node, value in subelements:
+            if value is not None:
+                parts.append("<%s>%s</%s>" % (node, _xml_escape(value), node))
+
+        if self.done is not None:
+            parts.append("<done />")
+
+        parts.append("</event>")
+        return "".join(parts)
+
+    def to_element(self):
+        """Return the XML representation of self, an ``Event`` object, as an ``ElementTree`` element.
+
+        A ``ValueError`` is raised if the data field is not defined.
+        """
         if self.data is None:
             raise ValueError("Events must have at least the data field set to be written to XML.")
 
@@ -103,5 +165,51 @@ class Event(object):
         if self.done is not None:
             ET.SubElement(event, "done")
 
-        stream.write(ET.tostring(event))
-        stream.flush()
\ No newline at end of file
+        return event
+
+if __name__ == "__main__":
+    import unittest
+
+    class TestToXmlString(unittest.TestCase):
+        """``to_xml_string`` must produce exactly what ``ET.tostring(to_element())`` does."""
+
+        def assertSameXml(self, event):
+            self.assertEqual(event.to_xml_string(), ET.tostring(event.to_element()))
+
+        def test_minimal(self):
+            self.assertSameXml(Event(data="This is a test of my new event."))
+
+        def test_all_fields(self):
+            self.assertSameXml(Event(
+                data="This is a test of my excellent event.",
+                stanza="excellenceOnly",
+                time="%.3f" % 1372274622.493,
+                host="localhost",
+                index="main",
+                source="Splunk",
+                sourcetype="misc",
+                done=True,
+                unbroken=True))
+
+        def test_escaping(self):
+            text = "a < b && c > \"d\" 'e'\nline two\ttab\r]]>"
+            self.assertSameXml(Event(data=text, stanza=text, host=text, source=text,
+                                     sourcetype=text, index=text, time=text))
+
+        def test_unicode(self):
+            self.assertSameXml(Event(data=u"caf\xe9 \u2603 <snow>", stanza=u"st\xe4nza\n"))
+
+        def test_flags(self):
+            for done in (True, False, None):
+                for unbroken in (True, False, 0, 1):
+                    self.assertSameXml(Event(data="x", done=done, unbroken=unbroken))
+            self.assertFalse("<done" in Event(data="x", done=None).to_xml_string())
+
+        def test_float_time(self):
+            self.assertSameXml(Event(data="x", time=1372187084.5))
+
+        def test_missing_data(self):
+            self.assertRaises(ValueError, Event().to_xml_string)
+            self.assertRaises(ValueError, Event().to_element)
+
+    unittest.main()
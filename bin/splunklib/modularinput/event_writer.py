@@ -13,8 +13,11 @@
 # under the License.
 
 import sys
+import threading
+import time
 
 from splunklib.modularinput.event import ET
+from splunklib.modularinput.scheme import Scheme
 
 try:
     from cStringIO import StringIO
@@ -81,4 +84,249 @@ class EventWriter(object):
 
     def close(self):
         """Write the closing </stream> tag to make this XML well formed."""
-        self._out.write("</stream>")
\ No newline at end of file
+        self._out.write("</stream>")
+
+
+class BufferedEventWriter(EventWriter):
+    """``BufferedEventWriter`` is an ``EventWriter`` that batches events before writing them.
+
+    Events are serialized with ``Event.to_xml_string`` into an internal buffer,
+    which is written to the output stream and flushed once it holds
+    ``max_buffer_size`` bytes, or once ``flush_interval`` seconds have passed
+    since the last flush. A daemon thread enforces the time threshold while the
+    input is idle, so a slow trickle of events is never held back for long.
+    All methods may be called from several threads at once.
+
+    When the modular input's scheme uses ``Scheme.streaming_mode_simple``, pass
+    that as *streaming_mode* to write each event's data as a plain line instead
+    of an ``<event>`` element. Simple mode carries no per-event metadata.
+
+    **Example**::
+
+        ew = BufferedEventWriter(max_buffer_size=256 * 1024, flush_interval=0.5)
+        for line in source:
+            ew.write_event(Event(data=line, stanza=stanza))
+        ew.close()
+    """
+
+    def __init__(self, output = sys.stdout, error = sys.stderr,
+                 max_buffer_size = 64 * 1024, flush_interval = 1.0,
+                 streaming_mode = Scheme.streaming_mode_xml):
+        """
+        :param output: Where to write the output; defaults to sys.stdout.
+        :param error: Where to write any errors; defaults to sys.stderr.
+        :param max_buffer_size: ``integer``, number of buffered bytes that triggers a flush.
+        :param flush_interval: ``float``, maximum number of seconds an event stays
+            buffered, or None to flush on size and on ``close`` only.
+        :param streaming_mode: ``Scheme.streaming_mode_xml`` or ``Scheme.streaming_mode_simple``.
+        """
+        super(BufferedEventWriter, self).__init__(output, error)
+        self.max_buffer_size = max_buffer_size
+        self.flush_interval = flush_interval
+        self.simple = streaming_mode == Scheme.streaming_mode_simple
+
+        self.events_written = 0
+        self.flush_count = 0
+
+        self._buffer = []
+        self._buffer_size = 0
+        self._last_flush = time.time()
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+        self._flusher = None
+
+    def write_event(self, event):
+        """Adds an ``Event`` object to the buffer, flushing it if a threshold is reached.
+
+        :param event: An ``Event`` object.
+        """
+        if self.simple:
+            if event.data is None:
+                raise ValueError("Events must have at least the data field set to be written.")
+            text = event.data
+            if isinstance(text, unicode):
+                text = text.encode("utf-8")
+            if not text.endswith("\n"):
+                text += "\n"
+        else:
+            text = event.to_xml_string()
+
+        with self._lock:
+            if not self.header_written:
+                if not self.simple:
+                    self._buffer.append("<stream>")
+                self.header_written = True
+                self._start_flusher()
+            self._buffer.append(text)
+            self._buffer_size += len(text)
+            self.events_written += 1
+            if self._buffer_size >= self.max_buffer_size or \
+                    (self.flush_interval is not None and
+                     time.time() - self._last_flush >= self.flush_interval):
+                self.flush()
+
+    def flush(self):
+        """Writes all buffered events to the output stream and flushes it."""
+        with self._lock:
+            if self._buffer:
+                self._out.write("".join(self._buffer))
+                self._buffer = []
+                self._buffer_size = 0
+                self.flush_count += 1
+            self._out.flush()
+            self._last_flush = time.time()
+
+    def log(self, severity, message):
+        """Logs messages about the state of this modular input to Splunk.
+
+        Buffered events are flushed first, so that log entries keep their
+        order relative to the events.
+
+        :param severity: ``string``, severity of message, see severites defined as class constants.
+        :param message: ``string``, message to log.
+        """
+        with self._lock:
+            self.flush()
+            super(BufferedEventWriter, self).log(severity, message)
+
+    def write_xml_document(self, document):
+        """Writes a string representation of an
+        ``ElementTree`` object to the output stream, after any buffered events.
+
+        :param document: An ``ElementTree`` object.
+        """
+        with self._lock:
+            self.flush()
+            super(BufferedEventWriter, self).write_xml_document(document)
+
+    def close(self):
+        """Flushes buffered events and, in XML mode, writes the closing </stream> tag."""
+        self._closed.set()
+        with self._lock:
+            if self.header_written and not self.simple:
+                self._buffer.append("</stream>")
+            self.flush()
+
+    def _start_flusher(self):
+        if self.flush_interval is None or self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_periodically,
+                                         name="BufferedEventWriter-flusher")
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if self._buffer and time.time() - self._last_flush >= self.flush_interval:
+                    self.flush()
+
+
+if __name__ == "__main__":
+    import unittest
+    from splunklib.modularinput.event import Event
+
+    class Output(object):
+        """An output stream that records what each flush made visible."""
+        def __init__(self):
+            self.written = []
+            self.flushed = []
+        def write(self, text):
+            self.written.append(text)
+        def flush(self):
+            self.flushed.append("".join(self.written))
+        def getvalue(self):
+            return "".join(self.written)
+
+    def events_in(xml):
+        return [e.findtext("data") for e in ET.fromstring(xml).findall("event")]
+
+    class TestBufferedEventWriter(unittest.TestCase):
+
+        def writer(self, **kwargs):
+            self.out, self.err = Output(), Output()
+            return BufferedEventWriter(self.out, self.err, **kwargs)
+
+        def test_size_threshold(self):
+            ew = self.writer(max_buffer_size=200, flush_interval=None)
+            ew.write_event(Event(data="0"))
+            self.assertEqual(self.out.getvalue(), "")
+            for i in range(1, 20):
+                ew.write_event(Event(data=str(i)))
+            self.assertTrue(ew.flush_count > 1)
+            # every flush happens at an event boundary, once the buffer reaches the threshold
+            for flushed in self.out.flushed:
+                self.assertTrue(flushed.endswith("</event>"))
+            self.assertTrue(len(self.out.flushed[0]) >= 200)
+            ew.close()
+            self.assertEqual(events_in(self.out.getvalue()), [str(i) for i in range(20)])
+            self.assertEqual(ew.events_written, 20)
+
+        def test_time_threshold(self):
+            ew = self.writer(max_buffer_size=1 << 20, flush_interval=0.05)
+            ew.write_event(Event(data="first"))
+            self.assertEqual(self.out.getvalue(), "")
+            # the flusher thread writes the event without any further call
+            deadline = time.time() + 5
+            while not self.out.getvalue() and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(self.out.getvalue().endswith("<data>first</data><done /></event>"))
+            self.assertTrue(ew._flusher.is_alive())
+            ew.close()
+            ew._flusher.join(1)
+            self.assertFalse(ew._flusher.is_alive())
+            self.assertEqual(events_in(self.out.getvalue()), ["first"])
+
+        def test_write_after_interval(self):
+            ew = self.writer(max_buffer_size=1 << 20, flush_interval=0.05)
+            ew._start_flusher = lambda: None
+            ew.write_event(Event(data="a"))
+            time.sleep(0.06)
+            ew.write_event(Event(data="b"))
+            self.assertEqual(events_in(self.out.getvalue() + "</stream>"), ["a", "b"])
+            ew.close()
+
+        def test_close(self):
+            ew = self.writer(flush_interval=None)
+            ew.close()
+            self.assertEqual(self.out.getvalue(), "")
+            ew = self.writer(flush_interval=None)
+            for i in range(3):
+                ew.write_event(Event(data=str(i), stanza="s"))
+            ew.close()
+            self.assertTrue(self.out.getvalue().startswith("<stream><event"))
+            self.assertTrue(self.out.getvalue().endswith("</stream>"))
+            self.assertEqual(events_in(self.out.getvalue()), ["0", "1", "2"])
+
+        def test_concurrent_writers(self):
+            ew = self.writer(max_buffer_size=512, flush_interval=0.001)
+            def write(n):
+                for i in range(500):
+                    ew.write_event(Event(data="%d-%d" % (n, i)))
+            threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            ew.close()
+            data = events_in(self.out.getvalue())
+            self.assertEqual(sorted(data), sorted("%d-%d" % (n, i) for n in range(4) for i in range(500)))
+            for n in range(4):
+                self.assertEqual([d for d in data if d.startswith("%d-" % n)], ["%d-%d" % (n, i) for i in range(500)])
+
+        def test_log_flushes_first(self):
+            ew = self.writer(flush_interval=None)
+            ew.write_event(Event(data="before"))
+            ew.log(EventWriter.ERROR, "oops")
+            self.assertEqual(events_in(self.out.getvalue() + "</stream>"), ["before"])
+            self.assertEqual(self.err.getvalue(), "ERROR oops\n")
+
+        def test_simple_mode(self):
+            ew = self.writer(flush_interval=None, streaming_mode=Scheme.streaming_mode_simple)
+            ew.write_event(Event(data="one"))
+            ew.write_event(Event(data=u"t\xe9o\n"))
+            ew.close()
+            self.assertEqual(self.out.getvalue(), "one\nt\xc3\xa9o\n")
+            self.assertRaises(ValueError, ew.write_event, Event())
+
+    unittest.main()
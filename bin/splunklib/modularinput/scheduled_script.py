@@ -0,0 +1,418 @@
+# Copyright 2011-2014 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from abc import abstractmethod
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import urllib
+
+from splunklib.modularinput.event_writer import EventWriter, BufferedEventWriter
+from splunklib.modularinput.script import Script
+
+
+class CheckpointStore(object):
+    """``CheckpointStore`` keeps one JSON checkpoint file per input stanza.
+
+    Files live in the ``checkpoint_dir`` that Splunk passes to the modular
+    input. Writes go to a temporary file in the same directory which is then
+    renamed over the checkpoint, so a crash never leaves a partial file.
+
+    **Example**::
+
+        store = CheckpointStore(inputs.metadata["checkpoint_dir"])
+        state = store.load("my_input://foo")
+        state["offset"] = 42
+        store.save("my_input://foo", state)
+    """
+    def __init__(self, checkpoint_dir):
+        """
+        :param checkpoint_dir: ``string``, directory holding the checkpoint files.
+        """
+        self.checkpoint_dir = checkpoint_dir
+        if not os.path.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+
+    def path(self, stanza):
+        """Returns the checkpoint file path for *stanza*.
+
+        :param stanza: ``string``, name of the input stanza.
+        """
+        return os.path.join(self.checkpoint_dir, urllib.quote(stanza, safe="") + ".json")
+
+    def load(self, stanza):
+        """Returns the saved checkpoint of *stanza*, or an empty ``dict`` if there is
+        none or it cannot be decoded.
+
+        :param stanza: ``string``, name of the input stanza.
+        """
+        path = self.path(stanza)
+        try:
+            with open(path, "rb") as f:
+                return json.load(f)
+        except IOError:
+            return {}
+        except ValueError as e:
+            # A corrupt checkpoint would otherwise fail every run; start over.
+            logging.warning("Ignoring unreadable checkpoint %s: %s", path, e)
+            return {}
+
+    def save(self, stanza, state):
+        """Atomically replaces the checkpoint of *stanza* with *state*.
+
+        :param stanza: ``string``, name of the input stanza.
+        :param state: A JSON serializable object.
+        """
+        path = self.path(stanza)
+        fd, tmp_path = tempfile.mkstemp(dir=self.checkpoint_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.name == "nt" and os.path.exists(path):
+                # os.rename does not replace existing files on Windows
+                os.remove(path)
+            os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class ScheduledScript(Script):
+    """An abstract base class for long-running modular inputs.
+
+    Where ``Script`` calls ``stream_events`` once, ``ScheduledScript`` starts one
+    worker thread per configured stanza. Each worker repeatedly calls
+    ``stream_stanza`` with the stanza's last checkpoint, saves the checkpoint it
+    returns, then sleeps for the stanza's interval. All workers write to one
+    shared ``BufferedEventWriter``. The process runs until every stanza has
+    finished, ``stop`` is called, or it receives SIGTERM or SIGINT.
+
+    Subclasses should override ``get_scheme`` and ``stream_stanza``, and
+    optionally ``get_interval`` and ``validate_input``.
+
+    **Example**::
+
+        class TailInput(ScheduledScript):
+            def get_scheme(self):
+                ...
+            def stream_stanza(self, stanza, params, ew, checkpoint):
+                offset = checkpoint.get("offset", 0)
+                for offset, line in read_from(params["path"], offset):
+                    ew.write_event(Event(data=line, stanza=stanza))
+                return {"offset": offset}
+    """
+
+    #: Seconds between runs of a stanza that has no ``interval`` parameter.
+    #: ``None`` runs such stanzas once.
+    default_interval = None
+
+    def __init__(self, max_buffer_size=64 * 1024, flush_interval=1.0):
+        """
+        :param max_buffer_size: ``integer``, passed to the shared ``BufferedEventWriter``.
+        :param flush_interval: ``float``, passed to the shared ``BufferedEventWriter``.
+        """
+        super(ScheduledScript, self).__init__()
+        self.max_buffer_size = max_buffer_size
+        self.flush_interval = flush_interval
+        self.checkpoints = None
+        self._stopping = threading.Event()
+
+    def run(self, args):
+        """Runs this modular input, writing events through a ``BufferedEventWriter``.
+
+        :param args: List of command line arguments passed to this script.
+        :returns: An integer to be used as the exit value of this program.
+        """
+        event_writer = BufferedEventWriter(max_buffer_size=self.max_buffer_size,
+                                           flush_interval=self.flush_interval)
+        return self.run_script(args, event_writer, sys.stdin)
+
+    def stop(self):
+        """Asks all stanza workers to finish their current run and exit."""
+        self._stopping.set()
+
+    @property
+    def stopping(self):
+        """``True`` once ``stop`` has been called; long ``stream_stanza`` calls should poll it."""
+        return self._stopping.is_set()
+
+    def stream_events(self, inputs, ew):
+        """Runs every stanza of *inputs* on its own worker thread until they finish.
+
+        :param inputs: An ``InputDefinition`` object.
+        :param ew: An object with methods to write events and log messages to Splunk.
+        """
+        self.checkpoints = CheckpointStore(inputs.metadata["checkpoint_dir"])
+        self._install_signal_handlers()
+
+        workers = []
+        for stanza, params in inputs.inputs.iteritems():
+            worker = threading.Thread(target=self._run_stanza, args=(stanza, params, ew),
+                                      name="stanza:%s" % stanza)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        # Join with a timeout so the main thread stays responsive to signals.
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(1.0)
+
+    def get_interval(self, stanza, params):
+        """Returns the number of seconds to wait between runs of *stanza*.
+
+        The default reads the standard ``interval`` parameter and falls back to
+        ``default_interval``. Returning ``None`` or a non-positive number runs
+        the stanza once.
+
+        :param stanza: ``string``, name of the input stanza.
+        :param params: ``dict``, the stanza's parameters.
+        """
+        interval = params.get("interval")
+        if interval is None:
+            return self.default_interval
+        try:
+            return float(interval)
+        except ValueError:
+            # Cron schedules are handled by splunkd, which restarts the script.
+            return None
+
+    @abstractmethod
+    def stream_stanza(self, stanza, params, ew, checkpoint):
+        """Streams the events of a single stanza and returns its new checkpoint.
+
+        This is called from the stanza's worker thread, once per interval.
+
+        :param stanza: ``string``, name of the input stanza.
+        :param params: ``dict``, the stanza's parameters.
+        :param ew: The shared, thread-safe ``BufferedEventWriter``.
+        :param checkpoint: The ``dict`` returned by the previous run, or an empty ``dict``.
+        :return: The checkpoint to save, or ``None`` to keep the previous one.
+        """
+
+    def _run_stanza(self, stanza, params, ew):
+        interval = self.get_interval(stanza, params)
+        while not self._stopping.is_set():
+            started = time.time()
+            try:
+                checkpoint = self.checkpoints.load(stanza)
+                checkpoint = self.stream_stanza(stanza, params, ew, checkpoint)
+                if checkpoint is not None:
+                    self.checkpoints.save(stanza, checkpoint)
+            except Exception as e:
+                ew.log(EventWriter.ERROR, "Stanza %s failed: %s" % (stanza, e))
+            if not interval or interval <= 0:
+                break
+            self._stopping.wait(max(0, interval - (time.time() - started)))
+
+    def _install_signal_handlers(self):
+        # Signal handlers can only be installed from the main thread.
+        if not isinstance(threading.current_thread(), threading._MainThread):
+            return
+        def handler(signum, frame):
+            self.stop()
+        for name in ("SIGTERM", "SIGINT"):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), handler)
+
+
+if __name__ == "__main__":
+    import shutil
+    import unittest
+    from StringIO import StringIO
+    from splunklib.modularinput.event import Event
+    from splunklib.modularinput.input_definition import InputDefinition
+
+    class Output(object):
+        def __init__(self):
+            self.written = []
+        def write(self, text):
+            self.written.append(text)
+        def flush(self):
+            pass
+        def getvalue(self):
+            return "".join(self.written)
+
+    class TestCheckpointStore(unittest.TestCase):
+
+        def setUp(self):
+            self.dir = tempfile.mkdtemp()
+            self.store = CheckpointStore(os.path.join(self.dir, "checkpoints"))
+
+        def tearDown(self):
+            shutil.rmtree(self.dir)
+
+        def test_round_trip(self):
+            self.assertEqual(self.store.load("my_input://foo/bar"), {})
+            self.store.save("my_input://foo/bar", {"offset": 42})
+            self.assertEqual(self.store.load("my_input://foo/bar"), {"offset": 42})
+            self.assertEqual(self.store.load("my_input://foo"), {})
+            self.assertEqual(os.listdir(self.store.checkpoint_dir), ["my_input%3A%2F%2Ffoo%2Fbar.json"])
+
+        def test_failed_save_keeps_checkpoint(self):
+            self.store.save("s", {"offset": 1})
+            self.assertRaises(TypeError, self.store.save, "s", {"offset": object()})
+            self.assertEqual(self.store.load("s"), {"offset": 1})
+            # the temporary file is removed
+            self.assertEqual(os.listdir(self.store.checkpoint_dir), ["s.json"])
+
+        def test_save_replaces_by_rename(self):
+            self.store.save("s", {"offset": 1})
+            renames = []
+            rename = os.rename
+            def recording_rename(src, dst):
+                renames.append((src, dst, open(src).read()))
+                rename(src, dst)
+            os.rename = recording_rename
+            try:
+                self.store.save("s", {"offset": 2})
+            finally:
+                os.rename = rename
+            [(src, dst, content)] = renames
+            self.assertEqual(os.path.dirname(src), self.store.checkpoint_dir)
+            self.assertEqual(dst, self.store.path("s"))
+            self.assertEqual(json.loads(content), {"offset": 2})
+
+        def test_corrupt_checkpoint(self):
+            with open(self.store.path("s"), "wb") as f:
+                f.write('{"offset": 4')
+            warnings = []
+            warning = logging.warning
+            logging.warning = lambda *args: warnings.append(args)
+            try:
+                self.assertEqual(self.store.load("s"), {})
+            finally:
+                logging.warning = warning
+            self.assertEqual(len(warnings), 1)
+            self.store.save("s", {"offset": 5})
+            self.assertEqual(self.store.load("s"), {"offset": 5})
+
+    class CountingInput(ScheduledScript):
+        """Counts its runs per stanza in the checkpoint; the (stanza, count) runs in *fail*
+        raise once."""
+
+        def __init__(self, runs_before_stop=3, fail=()):
+            super(CountingInput, self).__init__(flush_interval=None)
+            self.runs_before_stop = runs_before_stop
+            self.fail = set(fail)
+            self.lock = threading.Lock()
+            self.calls = []
+
+        def get_scheme(self):
+            return None
+
+        def stream_stanza(self, stanza, params, ew, checkpoint):
+            count = checkpoint.get("count", 0) + 1
+            with self.lock:
+                self.calls.append((stanza, count))
+                if len([c for c in self.calls if c[0] == "counter://a"]) >= self.runs_before_stop:
+                    self.stop()
+            if (stanza, count) in self.fail:
+                self.fail.discard((stanza, count))
+                raise RuntimeError("run %d failed" % count)
+            ew.write_event(Event(data="%s %d" % (stanza, count), stanza=stanza))
+            return {"count": count}
+
+    class TestScheduledScript(unittest.TestCase):
+
+        def setUp(self):
+            self.dir = tempfile.mkdtemp()
+            self.handlers = dict((name, signal.getsignal(getattr(signal, name)))
+                                 for name in ("SIGTERM", "SIGINT") if hasattr(signal, name))
+
+        def tearDown(self):
+            for name, handler in self.handlers.items():
+                signal.signal(getattr(signal, name), handler)
+            shutil.rmtree(self.dir)
+
+        def definition(self, inputs):
+            definition = InputDefinition()
+            definition.metadata["checkpoint_dir"] = self.dir
+            definition.inputs = inputs
+            return definition
+
+        def run_input(self, script, inputs):
+            out, err = Output(), Output()
+            ew = BufferedEventWriter(out, err, flush_interval=None)
+            worker = threading.Thread(target=script.stream_events, args=(self.definition(inputs), ew))
+            worker.start()
+            worker.join(10)
+            self.assertFalse(worker.is_alive())
+            ew.close()
+            return out.getvalue(), err.getvalue()
+
+        def test_get_interval(self):
+            script = CountingInput()
+            self.assertEqual(script.get_interval("s", {"interval": "60"}), 60.0)
+            self.assertEqual(script.get_interval("s", {"interval": "*/5 * * * *"}), None)
+            self.assertEqual(script.get_interval("s", {}), None)
+            script.default_interval = 30
+            self.assertEqual(script.get_interval("s", {}), 30)
+
+        def test_per_stanza_schedule(self):
+            script = CountingInput(runs_before_stop=3)
+            out, err = self.run_input(script, {
+                "counter://a": {"interval": "0.01"},
+                "counter://once": {}})
+            self.assertEqual(err, "")
+            self.assertEqual([c for c in script.calls if c[0] == "counter://once"], [("counter://once", 1)])
+            self.assertEqual([c for c in script.calls if c[0] == "counter://a"],
+                             [("counter://a", 1), ("counter://a", 2), ("counter://a", 3)])
+            self.assertEqual(script.checkpoints.load("counter://a"), {"count": 3})
+            self.assertEqual(script.checkpoints.load("counter://once"), {"count": 1})
+            self.assertTrue("<data>counter://a 3</data>" in out)
+
+            # a new process carries on from the saved checkpoints
+            script = CountingInput(runs_before_stop=1)
+            self.run_input(script, {"counter://a": {"interval": "0.01"}})
+            self.assertEqual(script.calls, [("counter://a", 4)])
+
+        def test_failed_run_is_logged_and_retried(self):
+            script = CountingInput(runs_before_stop=3, fail=[("counter://a", 1)])
+            out, err = self.run_input(script, {"counter://a": {"interval": "0.01"}})
+            self.assertEqual(err, "ERROR Stanza counter://a failed: run 1 failed\n")
+            # the failed run saved no checkpoint, so it is retried with the same one
+            self.assertEqual(script.calls, [("counter://a", 1), ("counter://a", 1), ("counter://a", 2)])
+            self.assertEqual(script.checkpoints.load("counter://a"), {"count": 2})
+
+        def test_failure_while_stopping(self):
+            # the run that sees stop() fails: the worker logs it and exits
+            script = CountingInput(runs_before_stop=2, fail=[("counter://a", 2)])
+            out, err = self.run_input(script, {"counter://a": {"interval": "0.01"}})
+            self.assertEqual(err, "ERROR Stanza counter://a failed: run 2 failed\n")
+            self.assertEqual(script.calls, [("counter://a", 1), ("counter://a", 2)])
+            self.assertEqual(script.checkpoints.load("counter://a"), {"count": 1})
+            self.assertTrue(out.endswith("<data>counter://a 1</data><done /></event></stream>"))
+
+        def test_run_script(self):
+            script = CountingInput(runs_before_stop=1)
+            definition = """<input><server_host>h</server_host><checkpoint_dir>%s</checkpoint_dir>
+                <configuration><stanza name="counter://a"><param name="interval">0.01</param></stanza>
+                </configuration></input>""" % self.dir
+            out = Output()
+            ew = BufferedEventWriter(out, Output(), flush_interval=None)
+            self.assertEqual(script.run_script([sys.argv[0]], ew, StringIO(definition)), 0)
+            self.assertEqual(out.getvalue(), '<stream><event stanza="counter://a" unbroken="1">'
+                             '<data>counter://a 1</data><done /></event></stream>')
+            self.assertEqual(os.path.exists(os.path.join(self.dir, "counter%3A%2F%2Fa.json")), True)
+
+    unittest.main()
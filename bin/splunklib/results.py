@@ -30,8 +30,13 @@ as follows:::
     for item in reader:
         print(item)
     print "Results are a preview: %s" % reader.is_preview
+
+Streams requested with ``output_mode=json`` can be read the same way with
+:class:`JSONResultsReader`, which avoids XML parsing altogether.
 """
 
+import json
+
 try:
     import xml.etree.cElementTree as et
 except:
@@ -49,6 +54,7 @@ except:
 
 __all__ = [
     "ResultsReader",
+    "JSONResultsReader",
     "Message"
 ]
 
@@ -266,5 +272,273 @@ class ResultsReader(object):
                 raise
 
 
+class JSONResultsReader(object):
+    """This class returns dictionaries and Splunk messages from a JSON results
+    stream.
+
+    ``JSONResultsReader`` is the counterpart of :class:`ResultsReader` for
+    streams requested with ``output_mode=json``. It yields the same items: an
+    ordered ``dict`` for each result, with multivalued fields as lists, and a
+    :class:`Message` object for each Splunk message. Its ``is_preview`` field
+    has the same meaning.
+
+    The reader accepts both the line-oriented format of the
+    ``search/jobs/export`` endpoint, which writes one JSON object per line,
+    and the single JSON document returned by ``Job.results`` and
+    ``Job.preview``.
+
+    :param `stream`: The stream to read from (any object that supports
+        ``.read()``).
+
+    **Example**::
+
+        import results
+        response = service.jobs.export("search * | head 5", output_mode="json")
+        reader = results.JSONResultsReader(response)
+        for result in reader:
+            if isinstance(result, dict):
+                print "Result: %s" % result
+            elif isinstance(result, results.Message):
+                print "Message: %s" % result
+        print "is_preview = %s " % reader.is_preview
+    """
+    # Size of the blocks read from the underlying stream.
+    chunk_size = 64 * 1024
 
+    def __init__(self, stream):
+        self.is_preview = None
+        self._decoder = json.JSONDecoder(object_pairs_hook=_JSONObject)
+        self._gen = self._parse_results(stream)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self._gen.next()
+
+    def _lines(self, stream):
+        """Yield the complete lines of *stream*, reading it in blocks."""
+        # The pieces of a line are joined only once its end has been read, so
+        # a long single-line document is not copied again for every block.
+        pending = []
+        while True:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                break
+            if "\n" not in chunk:
+                pending.append(chunk)
+                continue
+            lines = chunk.split("\n")
+            if pending:
+                pending.append(lines[0])
+                lines[0] = "".join(pending)
+            pending = [lines.pop()]
+            for line in lines:
+                yield line
+        yield "".join(pending)
+
+    def _parse_results(self, stream):
+        """Parse results and messages out of *stream*.
+
+        If the first line holds a complete JSON object, the stream is read as
+        the export format and every following line must hold one too; a bad
+        line raises ``ValueError``. Otherwise the stream is a single document
+        spanning several lines, which is decoded once it has been read.
+        """
+        lines = enumerate(self._lines(stream), 1)
+        for line_number, line in lines:
+            if line.strip():
+                break
+        else:
+            return
+        try:
+            obj = self._decoder.decode(line)
+        except ValueError:
+            document = [line]
+            document.extend(line for line_number, line in lines)
+            obj = self._decoder.decode("\n".join(document))
+            for item in self._parse_object(obj):
+                yield item
+            return
+        for item in self._parse_object(obj):
+            yield item
+
+        for line_number, line in lines:
+            if not line.strip():
+                continue
+            try:
+                obj = self._decoder.decode(line)
+            except ValueError as e:
+                raise ValueError("Invalid JSON on line %d of the results stream: %s" % (line_number, e))
+            for item in self._parse_object(obj):
+                yield item
+
+    def _parse_object(self, obj):
+        """Yield the messages and results contained in one JSON object."""
+        obj = dict(obj)
+        if 'preview' in obj:
+            self.is_preview = bool(obj['preview'])
+        for msg in obj.get('messages') or ():
+            msg = dict(msg)
+            yield Message(msg.get('type'), _encode(msg.get('text', "")))
+        if 'result' in obj:
+            yield self._parse_result(obj['result'])
+        for result in obj.get('results') or ():
+            yield self._parse_result(result)
+
+    def _parse_result(self, result):
+        values = OrderedDict()
+        for field_name, value in result:
+            if isinstance(value, _JSONObject):
+                value = _encode(OrderedDict(value))
+            elif isinstance(value, list):
+                value = [_encode(v) for v in value]
+            else:
+                value = _encode(value)
+            values[field_name.encode('utf8')] = value
+        return values
+
+class _JSONObject(list):
+    """The (key, value) pairs of a decoded JSON object.
+
+    Results are decoded to pairs and copied into an ``OrderedDict`` once, in
+    :meth:`JSONResultsReader._parse_result`, which is much faster than
+    decoding every object into an ``OrderedDict`` directly.
+    """
+    pass
+
+def _encode(value):
+    """Return *value* as a UTF-8 byte string, as :class:`ResultsReader` does."""
+    if value is None:
+        return ""
+    if isinstance(value, unicode):
+        return value.encode('utf8')
+    return str(value)
+
+
+if __name__ == "__main__":
+    import unittest
+
+    # The same two results and message, in the formats splunkd returns for
+    # "search ... | eval multi=split("a,b", ",") | table host, multi".
+    XML_RESULTS = """<?xml version='1.0' encoding='UTF-8'?>
+<results preview='0'>
+<meta>
+<fieldOrder>
+<field>host</field>
+<field>multi</field>
+</fieldOrder>
+</meta>
+<messages>
+  <msg type="INFO">Your timerange was substituted based on your search string</msg>
+</messages>
+\t<result offset='0'>
+\t\t<field k='host'>
+\t\t\t<value><text>idx1</text></value>
+\t\t</field>
+\t\t<field k='multi'>
+\t\t\t<value><text>a</text></value>
+\t\t\t<value><text>b</text></value>
+\t\t</field>
+\t</result>
+\t<result offset='1'>
+\t\t<field k='host'>
+\t\t\t<value><text>idx2</text></value>
+\t\t</field>
+\t\t<field k='multi'>
+\t\t\t<value><text>a</text></value>
+\t\t\t<value><text>b</text></value>
+\t\t</field>
+\t</result>
+</results>
+"""
+
+    # search/jobs/export?output_mode=json: one object per line.
+    JSON_EXPORT = (
+        '{"preview":false,"offset":0,"messages":[{"type":"INFO","text":"Your timerange was substituted based on your search string"}]}\n'
+        '{"preview":false,"offset":0,"result":{"host":"idx1","multi":["a","b"]}}\n'
+        '\n'
+        '{"preview":false,"offset":1,"lastrow":true,"result":{"host":"idx2","multi":["a","b"]}}\n')
+
+    # search/jobs/<sid>/results_preview?output_mode=json: a single document,
+    # here indented so that it spans several lines.
+    JSON_DOCUMENT = """{
+    "preview": true,
+    "init_offset": 0,
+    "messages": [
+        {"type": "INFO", "text": "Your timerange was substituted based on your search string"}
+    ],
+    "results": [
+        {"host": "idx1", "multi": ["a", "b"]},
+        {"host": "idx2", "multi": ["a", "b"]}
+    ]
+}
+"""
 
+    class BlockStream(object):
+        """A stream that returns at most *size* bytes per read, as sockets do."""
+        def __init__(self, data, size):
+            self.data = data
+            self.size = size
+        def read(self, n=-1):
+            n = min(n, self.size) if n >= 0 else self.size
+            chunk, self.data = self.data[:n], self.data[n:]
+            return chunk
+
+    class TestJSONResultsReader(unittest.TestCase):
+
+        expected = [
+            Message("INFO", "Your timerange was substituted based on your search string"),
+            OrderedDict([("host", "idx1"), ("multi", ["a", "b"])]),
+            OrderedDict([("host", "idx2"), ("multi", ["a", "b"])])]
+
+        def read(self, data, size=7):
+            reader = JSONResultsReader(BlockStream(data, size))
+            return reader, list(reader)
+
+        def test_matches_xml_reader(self):
+            xml_reader = ResultsReader(StringIO(XML_RESULTS))
+            self.assertEqual(list(xml_reader), self.expected)
+            reader, items = self.read(JSON_EXPORT)
+            self.assertEqual(items, self.expected)
+            self.assertEqual(reader.is_preview, xml_reader.is_preview)
+
+        def test_export_block_sizes(self):
+            for size in (1, 5, 64, len(JSON_EXPORT)):
+                self.assertEqual(self.read(JSON_EXPORT, size)[1], self.expected)
+
+        def test_document(self):
+            reader, items = self.read(JSON_DOCUMENT)
+            self.assertEqual(items, self.expected)
+            self.assertEqual(reader.is_preview, True)
+
+        def test_single_line_document(self):
+            # non-streaming output_mode=json returns the document on one line
+            document = JSON_DOCUMENT.replace("\n", "")
+            for size in (1, 5, 64):
+                self.assertEqual(self.read(document, size)[1], self.expected)
+
+        def test_lines(self):
+            data = "a\nbc\n\ndef\ng"
+            reader = JSONResultsReader(StringIO(""))
+            for size in (1, 2, 3, len(data)):
+                lines = list(reader._lines(BlockStream(data, size)))
+                self.assertEqual(lines, data.split("\n"))
+
+        def test_empty(self):
+            reader, items = self.read("\n\n")
+            self.assertEqual(items, [])
+            self.assertEqual(reader.is_preview, None)
+
+        def test_bad_export_line(self):
+            lines = JSON_EXPORT.split("\n")
+            lines[1] = lines[1][:30]
+            reader = JSONResultsReader(StringIO("\n".join(lines)))
+            self.assertEqual(reader.next(), self.expected[0])
+            self.assertRaises(ValueError, reader.next)
+
+        def test_truncated_document(self):
+            reader = JSONResultsReader(StringIO(JSON_DOCUMENT[:-20]))
+            self.assertRaises(ValueError, list, reader)
+
+    unittest.main()
@@ -1,6 +1,11 @@
 import ConfigParser
+import json
+import os
 from itertools import chain
 
+# (config files) -> (file mtimes, parsed settings)
+_config_cache = {}
+
 def read_config_file(default_config_file=None, aditional_config_files=None):
 
     config = ConfigParser.ConfigParser(allow_no_value=True)
@@ -19,6 +24,116 @@ def read_config_file(default_config_file=None, aditional_config_files=None):
     return config, all_sections, all_options, merged_options
 
 
+def _config_file_list(default_config_file, aditional_config_files):
+    files = [default_config_file]
+    if isinstance(aditional_config_files, basestring):
+        files.append(aditional_config_files)
+    elif aditional_config_files:
+        files.extend(aditional_config_files)
+    else:
+        files.append(None)
+    return tuple(files)
+
+
+def _config_mtimes(files):
+    mtimes = []
+    for f in files:
+        try:
+            mtimes.append(os.stat(f).st_mtime if f else None)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def _config_items(config):
+    # (defaults, [(section, [(option, value)])]), leaving out the defaults a section inherits
+    defaults = config.defaults()
+    section_items = []
+    for section in config.sections():
+        items = [(option, value) for option, value in config.items(section, raw=True)
+                 if defaults.get(option, value) != value or option not in defaults]
+        section_items.append((section, items))
+    return defaults.items(), section_items
+
+
+def _utf8(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_utf8(v) for v in value]
+    return value
+
+
+def _config_from_items(items):
+    defaults, section_items = items
+    config = ConfigParser.ConfigParser(allow_no_value=True)
+    for option, value in defaults:
+        config.set('DEFAULT', option, value)
+    for section, options in section_items:
+        config.add_section(section)
+        for option, value in options:
+            config.set(section, option, value)
+    return config
+
+
+def _load_config_cache(cache_file, files, mtimes):
+    try:
+        with open(cache_file, 'rb') as f:
+            cached = json.load(f)
+        if cached['files'] != list(files) or cached['mtimes'] != list(mtimes):
+            return None
+        # json gives back unicode; ConfigParser read them as utf-8 str
+        return _utf8(cached['defaults']), _utf8(cached['sections'])
+    except Exception:
+        return None
+
+
+def _save_config_cache(cache_file, files, mtimes, items):
+    tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+    try:
+        with open(tmp_file, 'wb') as f:
+            json.dump({'files': files, 'mtimes': mtimes, 'defaults': items[0], 'sections': items[1]}, f)
+        if os.name == 'nt' and os.path.exists(cache_file):
+            os.remove(cache_file)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        # The cache is only an optimisation; a missing or read-only directory is fine.
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def read_config_file_cached(default_config_file=None, aditional_config_files=None, cache_file=None):
+    '''
+    # Same as read_config_file, but the parsed settings are kept in memory and
+    # only re-read when the modification time of one of the files changes.
+    # If cache_file is given, the parsed settings are also saved there as
+    # JSON so that new processes can skip ConfigParser parsing too; its
+    # directory must already exist. Each call returns a new config object
+    # and lists, so callers may modify them.
+    :usage: config, all_sections, all_options, merged_options = read_config_file_cached(default, local)
+    '''
+    files = _config_file_list(default_config_file, aditional_config_files)
+    mtimes = _config_mtimes(files)
+
+    cached = _config_cache.get(files)
+    if cached and cached[0] == mtimes:
+        items = cached[1]
+    else:
+        items = _load_config_cache(cache_file, files, mtimes) if cache_file else None
+        if items is None:
+            items = _config_items(read_config_file(default_config_file, aditional_config_files)[0])
+            if cache_file:
+                _save_config_cache(cache_file, files, mtimes, items)
+        _config_cache[files] = (mtimes, items)
+
+    config = _config_from_items(items)
+    all_sections = config.sections()
+    all_options = [config.options(section) for section in all_sections]
+    merged_options = list(chain.from_iterable(all_options))
+
+    return config, all_sections, all_options, merged_options
+
+
 def get_config_string(config):
 
     str =''